@@ -0,0 +1,204 @@
+"""
+Command-line entry points.
+
+    python -m app.cli regression --run-name nightly --models openai/gpt-4o,anthropic/claude-3.5-sonnet
+    RESPONSE_CACHE_MODE=replay python -m app.cli regression --run-name ci --models openai/gpt-4o
+    python -m app.cli rescore --run-name nightly
+    python -m app.cli import-prompts dumps/ANTHROPIC.mkd --source L1B3RT4S --category jailbreak
+    python -m app.cli reconcile-stats --all
+    SMTP_HOST=localhost SMTP_PORT=1025 python -m app.cli notify
+    python -m app.cli build-index && python -m app.cli dedupe-report --threshold 0.92
+    python -m app.cli spend --group-by user --days 30
+    python -m app.cli compress-text && python -m app.cli archive --after-days 90 && python -m app.cli storage-report
+"""
+import argparse
+import asyncio
+import json
+from app.config import IMPORT_CHUNK_SIZE
+from app.database import AsyncSessionLocal, init_db
+from app.services.http_pool import HttpPool, use_http_pool, close_http_pool
+from app.services.write_buffer import close_write_buffer
+from app.services.response_cache import close_response_cache
+from app.services.outcome_stats import get_stats_reconciler
+from app.services.notifier import get_notifier
+from app.services.budget import close_budget_tracker
+
+def _split(value: str):
+    return [v.strip() for v in value.split(",") if v.strip()] if value else []
+
+async def regression(args):
+    from app.services.regression_runner import RegressionRunner, load_exploits
+
+    async with AsyncSessionLocal() as db:
+        exploits = await load_exploits(db, _split(args.exploits))
+        if not exploits:
+            print("No matching exploits")
+            return
+        runner = RegressionRunner(cache_bypass=args.no_cache)
+        async for event in runner.run(db, args.run_name, exploits, _split(args.models)):
+            print(json.dumps(event), flush=True)
+
+async def rescore(args):
+    from app.services.regression_runner import rescore_test_runs
+
+    async with AsyncSessionLocal() as db:
+        print(json.dumps(await rescore_test_runs(db, args.run_name or None)))
+
+async def import_prompts(args):
+    from app.services.corpus_importer import import_corpus, detect_format, provider_from_path
+
+    for path in args.paths:
+        corpus_format = args.format or detect_format(path)
+        provider = args.provider or (provider_from_path(path) if corpus_format == "markdown" else None)
+        with open(path, encoding="utf-8", newline="") as f:
+            async with AsyncSessionLocal() as db:
+                stats = await import_corpus(
+                    db, f, corpus_format,
+                    source=args.source, category=args.category, provider=provider,
+                    chunk_size=args.chunk_size
+                )
+        print(json.dumps({"path": path, **stats}), flush=True)
+
+async def reconcile_stats(args):
+    print(json.dumps(await get_stats_reconciler().reconcile(0 if args.all else args.days)))
+
+async def notify(args):
+    notifier = get_notifier()
+    await notifier.recover()
+    while True:
+        result = await notifier.dispatch()
+        print(json.dumps(result), flush=True)
+        if not args.drain or not result["claimed"]:
+            break
+
+async def build_index(args):
+    from app.services.embedding_index import get_embedding_index
+
+    index = get_embedding_index()
+    async with AsyncSessionLocal() as db:
+        print(json.dumps(await index.sync(db)), flush=True)
+    if args.compact:
+        index.compact()
+    print(json.dumps(index.metrics()))
+
+async def dedupe_report(args):
+    from app.services.embedding_index import get_embedding_index
+
+    index = get_embedding_index()
+    async with AsyncSessionLocal() as db:
+        await index.sync(db, [args.kind])
+        print(json.dumps(await index.near_duplicates(db, args.kind, args.threshold, args.limit), indent=2))
+
+async def spend(args):
+    from app.services.budget import spend_report, spend_timeseries
+
+    async with AsyncSessionLocal() as db:
+        report = {
+            "group_by": args.group_by,
+            "days": args.days,
+            "rows": await spend_report(db, group_by=args.group_by, days=args.days, user_id=args.user or None),
+        }
+        if args.series:
+            report["series"] = await spend_timeseries(db, granularity=args.series, days=args.days, user_id=args.user or None)
+    print(json.dumps(report, indent=2))
+
+async def compress_text(args):
+    from app.services.archive import compress_existing
+
+    async with AsyncSessionLocal() as db:
+        print(json.dumps(await compress_existing(db, args.batch_size)), flush=True)
+
+async def archive(args):
+    from app.services.archive import get_archiver
+
+    print(json.dumps(await get_archiver().archive(args.after_days)))
+
+async def storage_report(args):
+    from app.services.archive import storage_report as report
+
+    async with AsyncSessionLocal() as db:
+        print(json.dumps(await report(db, args.sample), indent=2))
+
+COMMANDS = {
+    "regression": regression,
+    "rescore": rescore,
+    "import-prompts": import_prompts,
+    "reconcile-stats": reconcile_stats,
+    "notify": notify,
+    "build-index": build_index,
+    "dedupe-report": dedupe_report,
+    "spend": spend,
+    "compress-text": compress_text,
+    "archive": archive,
+    "storage-report": storage_report,
+}
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Lupin backend tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("regression", help="Run exploits against target models into TestRun (resumable)")
+    run.add_argument("--run-name", required=True, help="Re-using a run name resumes it")
+    run.add_argument("--models", required=True, help="Comma-separated target model ids")
+    run.add_argument("--exploits", default="", help="Comma-separated exploit ids (default: all active)")
+    run.add_argument("--no-cache", action="store_true", help="Skip cached responses (RESPONSE_CACHE_MODE=on only)")
+
+    scoring = commands.add_parser("rescore", help="Re-classify stored TestRun responses with the current classifier")
+    scoring.add_argument("--run-name", default="", help="Limit to one run (default: all runs)")
+
+    corpus = commands.add_parser("import-prompts", help="Stream JSONL/CSV/markdown dumps into the prompts table (idempotent)")
+    corpus.add_argument("paths", nargs="+", help="Corpus files to import")
+    corpus.add_argument("--format", choices=["jsonl", "csv", "markdown"], help="Default: inferred from the extension")
+    corpus.add_argument("--source", default="", help="Source label for rows that lack one, e.g. L1B3RT4S")
+    corpus.add_argument("--category", default="", help="Category for rows that lack one")
+    corpus.add_argument("--provider", default="", help="Provider for rows that lack one (markdown: defaults to the file name)")
+    corpus.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE, help="Rows per bulk insert")
+
+    stats = commands.add_parser("reconcile-stats", help="Re-derive success-rate stats from attempts and test runs")
+    stats.add_argument("--days", type=int, default=None, help="Days back to recompute (default: STATS_RECONCILE_DAYS)")
+    stats.add_argument("--all", action="store_true", help="Rebuild from all history (once, after upgrading; best with the server stopped)")
+
+    dispatch = commands.add_parser("notify", help="Deliver due provider notifications once")
+    dispatch.add_argument("--drain", action="store_true", help="Keep dispatching until nothing is due")
+
+    embeddings = commands.add_parser("build-index", help="Build or catch up the semantic index (safe while the server runs)")
+    embeddings.add_argument("--compact", action="store_true", help="Drop tombstoned rows from the index files")
+
+    report = commands.add_parser("dedupe-report", help="Cluster near-duplicate prompts or exploits")
+    report.add_argument("--kind", choices=["prompts", "exploits"], default="prompts")
+    report.add_argument("--threshold", type=float, default=0.9, help="Cosine similarity that counts as a duplicate")
+    report.add_argument("--limit", type=int, default=50, help="Clusters to print")
+
+    costs = commands.add_parser("spend", help="Token usage and priced spend from the usage buckets")
+    costs.add_argument("--group-by", choices=["model", "provider", "user", "session", "kind"], default="model")
+    costs.add_argument("--days", type=int, default=7)
+    costs.add_argument("--user", default="", help="Only this user's calls")
+    costs.add_argument("--series", choices=["hour", "day"], help="Add a throughput time series")
+
+    packing = commands.add_parser("compress-text", help="Compress response text stored before compression (then VACUUM)")
+    packing.add_argument("--batch-size", type=int, default=1000)
+
+    archiving = commands.add_parser("archive", help="Move old attempts and test runs into compressed archive files")
+    archiving.add_argument("--after-days", type=int, default=None, help="Default: ARCHIVE_AFTER_DAYS")
+
+    sizes = commands.add_parser("storage-report", help="Space used and saved by compression and the archive")
+    sizes.add_argument("--sample", type=int, default=200, help="Compressed values decompressed to estimate the ratio")
+    return parser
+
+async def _main(args):
+    use_http_pool(HttpPool())
+    await init_db()
+    # Attempts and test runs written from the CLI count towards the stats too
+    get_stats_reconciler().install()
+    get_notifier().install()
+    try:
+        await COMMANDS[args.command](args)
+    finally:
+        # Spend from CLI regression runs is persisted like the server's
+        await close_budget_tracker()
+        await close_write_buffer()
+        await close_http_pool()
+        close_response_cache()
+
+if __name__ == "__main__":
+    asyncio.run(_main(build_parser().parse_args()))
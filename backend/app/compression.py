@@ -0,0 +1,50 @@
+"""
+zstd compression for large text columns.
+
+Values of at least COMPRESS_MIN_BYTES (UTF-8) are stored as a zstd frame and
+smaller ones as plain UTF-8 bytes. A zstd frame starts with the magic bytes
+28 B5 2F FD, which can never begin valid UTF-8, so stored values need no marker
+of their own and rows written before compression read back unchanged.
+"""
+import threading
+from typing import Optional, Union
+import zstandard
+from app.config import COMPRESS_MIN_BYTES, COMPRESS_LEVEL
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# Compressor and decompressor objects must not be shared between threads
+_local = threading.local()
+
+def compressor(level: int = COMPRESS_LEVEL) -> zstandard.ZstdCompressor:
+    cached = getattr(_local, "compressors", None)
+    if cached is None:
+        cached = _local.compressors = {}
+    if level not in cached:
+        cached[level] = zstandard.ZstdCompressor(level=level)
+    return cached[level]
+
+def decompressor() -> zstandard.ZstdDecompressor:
+    if not hasattr(_local, "decompressor"):
+        _local.decompressor = zstandard.ZstdDecompressor()
+    return _local.decompressor
+
+def is_compressed(value: Optional[bytes]) -> bool:
+    return value is not None and bytes(value[:4]) == ZSTD_MAGIC
+
+def compress_text(text: str, min_bytes: int = COMPRESS_MIN_BYTES, level: int = COMPRESS_LEVEL) -> bytes:
+    """UTF-8 bytes, zstd-compressed when at least min_bytes long and smaller for it"""
+    raw = text.encode("utf-8")
+    if len(raw) < min_bytes:
+        return raw
+    packed = compressor(level).compress(raw)
+    return packed if len(packed) < len(raw) else raw
+
+def decompress_text(value: Union[None, str, bytes, memoryview]) -> Optional[str]:
+    """Inverse of compress_text; str values (SQLite rows from before the BLOB column) pass through"""
+    if value is None or isinstance(value, str):
+        return value
+    value = bytes(value)
+    if value[:4] == ZSTD_MAGIC:
+        value = decompressor().decompress(value)
+    return value.decode("utf-8")
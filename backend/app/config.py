@@ -1,7 +1,10 @@
 import os
 from dotenv import load_dotenv
 
-load_dotenv()
+# backend/.env by explicit path: no directory walk at import, same file from any cwd.
+# Variables already set in the environment win.
+ENV_FILE = os.getenv("LUPIN_ENV_FILE", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env"))
+load_dotenv(ENV_FILE)
 
 # API Keys
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
@@ -16,5 +19,153 @@ DEFAULT_TARGET_MODEL = "anthropic/claude-3.5-sonnet"
 # Database
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./lupin.db")
 
+# Postgres (asyncpg) connection pool. Size it to the number of concurrent sessions
+# plus background jobs; recycle below any proxy/server idle timeout.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))  # 0 = server default
+
+# SQLite (dev fallback): WAL lets readers proceed while the single writer commits
+SQLITE_WAL = os.getenv("SQLITE_WAL", "true").lower() == "true"
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+
+# Startup: /ready reports 200 once the schema is current, DB_WARM_CONNECTIONS pooled
+# connections are open and the model catalog is loaded (or known unavailable).
+# STARTUP_PRELOAD loads optional heavy components in the background after that
+# (comma-separated: embedding_index, refusal_model); otherwise they load on first use.
+DB_WARM_CONNECTIONS = int(os.getenv("DB_WARM_CONNECTIONS", "2"))
+STARTUP_PRELOAD = [name.strip() for name in os.getenv("STARTUP_PRELOAD", "").split(",") if name.strip()]
+
+# Write-behind buffer for attempt/test run rows
+WRITE_BUFFER_MAX_BATCH = int(os.getenv("WRITE_BUFFER_MAX_BATCH", "200"))
+WRITE_BUFFER_FLUSH_INTERVAL = float(os.getenv("WRITE_BUFFER_FLUSH_INTERVAL", "0.5"))
+WRITE_BUFFER_MAX_PENDING = int(os.getenv("WRITE_BUFFER_MAX_PENDING", "50000"))
+
+# Regression runner
+REGRESSION_PER_PROVIDER = int(os.getenv("REGRESSION_PER_PROVIDER", "4"))
+REGRESSION_RATE_PER_SEC = float(os.getenv("REGRESSION_RATE_PER_SEC", "2"))
+REGRESSION_BURST = float(os.getenv("REGRESSION_BURST", "4"))
+REGRESSION_MAX_RETRIES = int(os.getenv("REGRESSION_MAX_RETRIES", "4"))
+REGRESSION_MAX_WORKERS = int(os.getenv("REGRESSION_MAX_WORKERS", "32"))
+
+# Agent target calls: concurrent streams per provider across all sessions (a
+# multi-model jailbreak_attempt fans out under this limit); rate 0 = unlimited.
+# FANOUT_MAX_MODELS caps the models one jailbreak_attempt may target.
+TARGET_PER_PROVIDER = int(os.getenv("TARGET_PER_PROVIDER", "4"))
+TARGET_RATE_PER_SEC = float(os.getenv("TARGET_RATE_PER_SEC", "0"))
+TARGET_BURST = float(os.getenv("TARGET_BURST", "4"))
+FANOUT_MAX_MODELS = int(os.getenv("FANOUT_MAX_MODELS", "10"))
+
+# Refusal classifier: a refusal within the first REFUSAL_EARLY_WINDOW characters
+# of a streamed target reply cancels the generation. REFUSAL_MODEL optionally names
+# a local transformers text-classification model used when no pattern matches.
+REFUSAL_EARLY_WINDOW = int(os.getenv("REFUSAL_EARLY_WINDOW", "200"))
+REFUSAL_EARLY_CANCEL = os.getenv("REFUSAL_EARLY_CANCEL", "true").lower() == "true"
+REFUSAL_MODEL = os.getenv("REFUSAL_MODEL", "")
+REFUSAL_MODEL_LABEL = os.getenv("REFUSAL_MODEL_LABEL", "refusal")
+REFUSAL_MODEL_THRESHOLD = float(os.getenv("REFUSAL_MODEL_THRESHOLD", "0.5"))
+
+# Target response cache (opt-in). Mode "on" serves and records, "replay" serves only
+# recorded responses and fails on a miss (offline CI), "off" disables it.
+# RESPONSE_CACHE_MODEL_TTLS overrides the TTL per model or provider prefix, e.g.
+# "openai/=86400,anthropic/claude-3.5-sonnet=3600"; a TTL of 0 disables caching.
+RESPONSE_CACHE_MODE = os.getenv("RESPONSE_CACHE_MODE", "off").lower()
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "./response_cache.db")
+RESPONSE_CACHE_MEMORY_SIZE = int(os.getenv("RESPONSE_CACHE_MEMORY_SIZE", "1024"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "100000"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))
+RESPONSE_CACHE_MODEL_TTLS = os.getenv("RESPONSE_CACHE_MODEL_TTLS", "")
+
+# Prompt search: weight of success_rate when blended with full-text relevance
+SEARCH_SUCCESS_WEIGHT = float(os.getenv("SEARCH_SUCCESS_WEIGHT", "1.0"))
+
+# Corpus importer: rows per executemany batch and commit
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "1000"))
+
+# Optional shared secret for /api/admin, stats reconcile and spend endpoints (sent as X-Admin-Token)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
 # OpenRouter
-OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")  # e.g. benchmarks.mock_openrouter
+
+# Agent sessions: in-memory LRU/TTL tier and conversation compaction
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "256"))
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+SESSION_KEEP_RECENT = int(os.getenv("SESSION_KEEP_RECENT", "6"))  # messages kept verbatim
+SESSION_MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "40"))
+SESSION_TOOL_RESULT_CHARS = int(os.getenv("SESSION_TOOL_RESULT_CHARS", "1500"))
+
+# Background agent jobs: concurrent runs, queue bound, and how long a finished
+# job's full event stream (including token deltas) stays in memory for replay
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "4"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "1000"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "300"))
+
+# Success-rate stats: how often the reconciliation job re-derives recent day
+# buckets from attempts/test_runs, and how many days back it looks
+STATS_RECONCILE_INTERVAL = float(os.getenv("STATS_RECONCILE_INTERVAL", "3600"))
+STATS_RECONCILE_DAYS = int(os.getenv("STATS_RECONCILE_DAYS", "2"))
+
+# Provider notifications: dispatch cycle, digest sizing, delivery retries
+NOTIFY_INTERVAL = float(os.getenv("NOTIFY_INTERVAL", "30"))
+NOTIFY_BATCH_LIMIT = int(os.getenv("NOTIFY_BATCH_LIMIT", "500"))  # due notifications claimed per cycle
+NOTIFY_DIGEST_SIZE = int(os.getenv("NOTIFY_DIGEST_SIZE", "50"))  # findings per email/webhook
+NOTIFY_CONCURRENCY = int(os.getenv("NOTIFY_CONCURRENCY", "4"))
+NOTIFY_RETRIES = int(os.getenv("NOTIFY_RETRIES", "2"))  # immediate retries within one delivery
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "5"))  # deliveries before giving up
+NOTIFY_RETRY_BASE = float(os.getenv("NOTIFY_RETRY_BASE", "60"))  # backoff between deliveries, doubled each time
+NOTIFY_PROVIDER_TTL = float(os.getenv("NOTIFY_PROVIDER_TTL", "60"))  # provider matcher reload interval
+NOTIFY_SEND_LEASE = float(os.getenv("NOTIFY_SEND_LEASE", "600"))  # claimed rows not settled by then are requeued
+SMTP_HOST = os.getenv("SMTP_HOST", "")  # email notifications wait until this is set
+SMTP_PORT = int(os.getenv("SMTP_PORT", "25"))
+SMTP_USER = os.getenv("SMTP_USER", "")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD", "")
+SMTP_FROM = os.getenv("SMTP_FROM", "lupin@localhost")
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "false").lower() == "true"
+
+# Semantic search: optional local sentence-transformers model (else feature
+# hashing), where the memory-mapped vectors live, and how often to catch up
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "")  # e.g. sentence-transformers/all-MiniLM-L6-v2
+EMBEDDING_DIM = int(os.getenv("EMBEDDING_DIM", "384"))  # feature-hashing dimensions
+EMBEDDING_INDEX_DIR = os.getenv("EMBEDDING_INDEX_DIR", "./embedding_index")
+EMBEDDING_SYNC_INTERVAL = float(os.getenv("EMBEDDING_SYNC_INTERVAL", "300"))
+
+# Budgets: completion usage is priced with the model catalog's per-token pricing
+# and counted per session (lifetime), per user (UTC day) and globally (UTC day).
+# A run stops with a budget_exceeded event once any limit is reached; 0 = no limit.
+# Counters are kept in memory and persisted every BUDGET_PERSIST_INTERVAL seconds.
+BUDGET_SESSION_USD = float(os.getenv("BUDGET_SESSION_USD", "0"))
+BUDGET_SESSION_TOKENS = int(os.getenv("BUDGET_SESSION_TOKENS", "0"))
+BUDGET_USER_DAILY_USD = float(os.getenv("BUDGET_USER_DAILY_USD", "0"))
+BUDGET_USER_DAILY_TOKENS = int(os.getenv("BUDGET_USER_DAILY_TOKENS", "0"))
+BUDGET_GLOBAL_DAILY_USD = float(os.getenv("BUDGET_GLOBAL_DAILY_USD", "0"))
+BUDGET_GLOBAL_DAILY_TOKENS = int(os.getenv("BUDGET_GLOBAL_DAILY_TOKENS", "0"))
+BUDGET_PERSIST_INTERVAL = float(os.getenv("BUDGET_PERSIST_INTERVAL", "10"))
+
+# Large text columns (attempt/test run responses, notification prompts) are stored
+# zstd-compressed from COMPRESS_MIN_BYTES up. Attempts and test runs older than
+# ARCHIVE_AFTER_DAYS move to monthly zstd files under ARCHIVE_DIR, with identical
+# texts stored once per file; ARCHIVE_INTERVAL > 0 runs that job in the server.
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "512"))
+COMPRESS_LEVEL = int(os.getenv("COMPRESS_LEVEL", "3"))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "./archive")
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "5000"))
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "0"))
+ARCHIVE_LEVEL = int(os.getenv("ARCHIVE_LEVEL", "9"))
+
+# Model catalog cache
+MODEL_CATALOG_TTL = float(os.getenv("MODEL_CATALOG_TTL", "3600"))
+MODEL_CATALOG_SNAPSHOT = os.getenv("MODEL_CATALOG_SNAPSHOT", "./model_catalog.json")
+
+# Outbound HTTP pool
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_MAX_PER_HOST = int(os.getenv("HTTP_MAX_PER_HOST", "50"))
+HTTP_ENABLE_HTTP2 = os.getenv("HTTP_ENABLE_HTTP2", "true").lower() == "true"
@@ -1,11 +1,96 @@
+import asyncio
+from typing import Any, Dict
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from sqlalchemy.orm import sessionmaker
-from app.models import Base
-import os
+from app.config import (
+    DATABASE_URL as CONFIGURED_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_TIMEOUT,
+    DB_POOL_RECYCLE,
+    DB_POOL_PRE_PING,
+    DB_STATEMENT_TIMEOUT_MS,
+    DB_WARM_CONNECTIONS,
+    SQLITE_WAL,
+    SQLITE_SYNCHRONOUS,
+    SQLITE_BUSY_TIMEOUT_MS,
+    SQLITE_CACHE_SIZE_KB,
+)
+from app.migrations import upgrade
+from app.services.prompt_search import ensure_search_index
+from app.services.metrics import span
+
+SQLITE_SYNCHRONOUS_LEVELS = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+def normalize_url(url: str) -> str:
+    """Pick the async driver for bare postgres:// / postgresql:// / sqlite:// URLs"""
+    parsed = make_url(url)
+    if parsed.drivername in ("postgres", "postgresql"):
+        parsed = parsed.set(drivername="postgresql+asyncpg")
+    elif parsed.drivername == "sqlite":
+        parsed = parsed.set(drivername="sqlite+aiosqlite")
+    return parsed.render_as_string(hide_password=False)
+
+def engine_options(url: str) -> Dict[str, Any]:
+    """Pool settings for Postgres; SQLite keeps SQLAlchemy's defaults for aiosqlite"""
+    if make_url(url).get_backend_name() != "postgresql":
+        return {}
+    server_settings = {"application_name": "lupin"}
+    if DB_STATEMENT_TIMEOUT_MS:
+        server_settings["statement_timeout"] = str(DB_STATEMENT_TIMEOUT_MS)
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "connect_args": {"server_settings": server_settings},
+    }
+
+def sqlite_pragmas(wal: bool = SQLITE_WAL, synchronous: str = SQLITE_SYNCHRONOUS):
+    """
+    Connect hook applying per-connection pragmas. WAL lets readers (search, history,
+    reports) run while the write buffer commits instead of queueing behind it;
+    synchronous=NORMAL is durable across application crashes in WAL mode.
+    """
+    synchronous = synchronous.upper()
+    if synchronous not in SQLITE_SYNCHRONOUS_LEVELS:
+        raise ValueError(f"SQLITE_SYNCHRONOUS must be one of {', '.join(SQLITE_SYNCHRONOUS_LEVELS)}")
 
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite+aiosqlite:///./lupin.db")
+    def apply(dbapi_connection, _record):
+        cursor = dbapi_connection.cursor()
+        if wal:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+    return apply
 
-engine = create_async_engine(DATABASE_URL, echo=False)
+def build_engine(url: str, **overrides):
+    """Async engine for the URL with pool options and, on SQLite, the pragma hook"""
+    url = normalize_url(url)
+    options = {"echo": False, **engine_options(url)}
+    wal = overrides.pop("sqlite_wal", SQLITE_WAL)
+    options.update(overrides)
+    engine = create_async_engine(url, **options)
+    if engine.dialect.name == "sqlite":
+        event.listen(engine.sync_engine, "connect", sqlite_pragmas(wal=wal))
+    return engine
+
+def pool_status(engine) -> Dict[str, Any]:
+    pool = engine.pool
+    status = {"backend": engine.dialect.name, "pool": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        if hasattr(pool, name):
+            status[name] = getattr(pool, name)()
+    return status
+
+DATABASE_URL = normalize_url(CONFIGURED_URL)
+
+engine = build_engine(DATABASE_URL)
 AsyncSessionLocal = async_sessionmaker(
     engine,
     class_=AsyncSession,
@@ -13,14 +98,27 @@ AsyncSessionLocal = async_sessionmaker(
 )
 
 async def init_db():
-    """Initialize database tables"""
+    """Initialize database tables and apply pending migrations"""
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        applied = await conn.run_sync(upgrade)
+        if applied:
+            print(f"✅ Applied schema migrations {applied}")
+        await conn.run_sync(ensure_search_index)
+
+async def warm_pool(connections: int = DB_WARM_CONNECTIONS) -> Dict[str, Any]:
+    """Open pooled connections up front so the first requests skip connect/auth"""
+    async def ping():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+
+    await asyncio.gather(*(ping() for _ in range(max(connections, 1))))
+    return pool_status(engine)
 
 async def get_db():
     """Dependency for getting database sessions"""
-    async with AsyncSessionLocal() as session:
-        try:
-            yield session
-        finally:
-            await session.close()
+    with span("db_session"):
+        async with AsyncSessionLocal() as session:
+            try:
+                yield session
+            finally:
+                await session.close()
@@ -0,0 +1,226 @@
+"""
+Ordered schema migrations.
+
+`create_all` only creates missing tables; it never adds columns or indexes to
+tables that already exist. Each migration below runs once, in order, and the
+applied version is recorded in the `schema_version` table. Migrations must be
+idempotent against a freshly created schema, since a new database gets the
+current models from the baseline step.
+
+    python -m app.migrations            # show status
+    python -m app.migrations upgrade    # apply pending migrations
+"""
+import asyncio
+import hashlib
+import re
+import sys
+import unicodedata
+from typing import Callable, List, Tuple
+from sqlalchemy import Column, Integer, String, DateTime, LargeBinary, MetaData, Table, inspect, select, insert, func, text
+from sqlalchemy.schema import CreateTable
+from app.models import Base
+
+version_table = Table(
+    "schema_version",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String(200)),
+    Column("applied_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+MIGRATIONS: List[Tuple[int, str, Callable]] = []
+
+# pg_advisory_xact_lock key held while upgrading ("lupin" in ASCII)
+SCHEMA_LOCK_KEY = 0x6C7570696E
+
+def migration(version: int, description: str):
+    """Register a migration function taking a sync Connection"""
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return register
+
+def create_indexes(conn, table_name: str):
+    """
+    Create any indexes declared on the model that the table is missing. Indexes over
+    columns a later migration adds are skipped; that migration creates them.
+    """
+    existing = {c["name"] for c in inspect(conn).get_columns(table_name)}
+    for index in Base.metadata.tables[table_name].indexes:
+        if all(column.name in existing for column in index.columns):
+            index.create(conn, checkfirst=True)
+
+def create_tables(conn, *table_names: str):
+    """Create tables added to the models after the baseline"""
+    for table_name in table_names:
+        Base.metadata.tables[table_name].create(conn, checkfirst=True)
+
+def add_column(conn, table_name: str, column: Column):
+    """ALTER TABLE ... ADD COLUMN unless the column already exists"""
+    existing = {c["name"] for c in inspect(conn).get_columns(table_name)}
+    if column.name not in existing:
+        column_type = column.type.compile(dialect=conn.dialect)
+        conn.exec_driver_sql(f'ALTER TABLE {table_name} ADD COLUMN {column.name} {column_type}')
+
+@migration(1, "baseline schema")
+def _baseline(conn):
+    Base.metadata.create_all(conn)
+
+@migration(2, "indexes for hot report and agent queries")
+def _hot_query_indexes(conn):
+    for table_name in ("prompts", "attempts", "test_runs", "jailbreak_notifications"):
+        create_indexes(conn, table_name)
+
+# Version 3 (the test_runs uniqueness index) was folded into 2, which creates every
+# index declared on test_runs; versions are never reused.
+
+@migration(4, "persisted agent sessions")
+def _agent_sessions(conn):
+    create_tables(conn, "agent_sessions")
+
+@migration(5, "content hash on prompts for corpus import dedup")
+def _prompt_content_hash(conn):
+    # The importer's dedup hash as of this migration, inlined so later changes to the
+    # importer cannot alter what the backfill writes
+    def content_hash(content: str) -> str:
+        normalized = re.sub(r"\s+", " ", unicodedata.normalize("NFKC", content)).strip().casefold()
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    add_column(conn, "prompts", Column("content_hash", String(64)))
+    # Backfill in batches; later duplicates of an existing prompt keep a NULL hash
+    # so the unique index can be built over historical data.
+    seen = set()
+    last_id = ""
+    while True:
+        rows = conn.execute(
+            text("SELECT id, content FROM prompts WHERE id > :last_id ORDER BY id LIMIT 1000"),
+            {"last_id": last_id}
+        ).all()
+        if not rows:
+            break
+        updates = []
+        for prompt_id, content in rows:
+            digest = content_hash(content or "")
+            if digest not in seen:
+                seen.add(digest)
+                updates.append({"prompt_id": prompt_id, "digest": digest})
+        if updates:
+            conn.execute(text("UPDATE prompts SET content_hash = :digest WHERE id = :prompt_id"), updates)
+        last_id = rows[-1][0]
+    create_indexes(conn, "prompts")
+
+@migration(6, "background agent jobs and their events")
+def _agent_jobs(conn):
+    create_tables(conn, "agent_jobs", "agent_job_events")
+
+@migration(7, "incrementally maintained success-rate stats")
+def _outcome_stats(conn):
+    # Starts empty: run `python -m app.cli reconcile-stats --all` once to fold in history
+    create_tables(conn, "outcome_stats")
+
+@migration(8, "notification dispatch: finding dedup, digests and retry schedule")
+def _notification_dispatch(conn):
+    for column in (
+        Column("finding_key", String(64)),
+        Column("idempotency_key", String(64)),
+        Column("delivery_attempts", Integer),
+        Column("next_attempt_at", DateTime(timezone=True)),
+    ):
+        add_column(conn, "jailbreak_notifications", column)
+    # Rows queued before the dispatcher existed become due now
+    conn.execute(text(
+        "UPDATE jailbreak_notifications SET next_attempt_at = sent_at, delivery_attempts = 0 "
+        "WHERE notification_status = 'pending' AND next_attempt_at IS NULL"
+    ))
+    create_indexes(conn, "jailbreak_notifications")
+
+@migration(9, "JSONB for extra_data and target_models on Postgres")
+def _jsonb_documents(conn):
+    if conn.dialect.name != "postgresql":
+        return
+    from sqlalchemy.dialects.postgresql import JSONB
+    from app.models import JSONDocument
+
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        current = {c["name"]: c["type"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.type is JSONDocument and not isinstance(current.get(column.name), JSONB):
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {table.name} ALTER COLUMN {column.name} TYPE JSONB USING {column.name}::jsonb"
+                )
+
+@migration(10, "token and spend buckets for budgets")
+def _usage_buckets(conn):
+    create_tables(conn, "usage_buckets")
+
+@migration(11, "zstd-compressed response text and the archive manifest")
+def _compressed_text(conn):
+    # SQLite stores bytes in the existing TEXT columns as they are; old rows stay readable
+    if conn.dialect.name == "postgresql":
+        for table_name, column in (
+            ("attempts", "response"), ("test_runs", "response"), ("jailbreak_notifications", "jailbreak_prompt")
+        ):
+            current = {c["name"]: c["type"] for c in inspect(conn).get_columns(table_name)}
+            if not isinstance(current[column], LargeBinary):
+                conn.exec_driver_sql(
+                    f"ALTER TABLE {table_name} ALTER COLUMN {column} TYPE BYTEA USING convert_to({column}, 'UTF8')"
+                )
+    create_tables(conn, "archive_parts")
+
+@migration(12, "stable full-text key for prompts")
+def _prompt_search_rowid(conn):
+    add_column(conn, "prompts", Column("search_rowid", Integer))
+    create_indexes(conn, "prompts")
+    if conn.dialect.name == "sqlite":
+        from app.services.prompt_search import SQLITE_FTS_OBJECTS
+
+        # The old index was keyed on the implicit rowid; ensure_search_index assigns
+        # search_rowid to existing prompts and rebuilds it on the new key
+        for kind, name in SQLITE_FTS_OBJECTS:
+            conn.exec_driver_sql(f"DROP {kind} IF EXISTS {name}")
+
+def current_version(conn) -> int:
+    version_table.create(conn, checkfirst=True)
+    return conn.execute(select(func.coalesce(func.max(version_table.c.version), 0))).scalar()
+
+def lock_schema(conn):
+    """
+    Serialize upgrades when several workers boot at once: the first holds the lock
+    until its transaction commits, the others then read the new version and skip.
+    """
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
+    conn.execute(CreateTable(version_table, if_not_exists=True))
+    if conn.dialect.name == "sqlite":
+        # Any write statement takes SQLite's RESERVED lock until commit
+        conn.execute(text("UPDATE schema_version SET version = version WHERE 0"))
+
+def upgrade(conn) -> List[int]:
+    """Apply pending migrations (sync, for run_sync). Returns the versions applied."""
+    applied = []
+    lock_schema(conn)
+    version = current_version(conn)
+    for number, description, fn in MIGRATIONS:
+        if number <= version:
+            continue
+        fn(conn)
+        conn.execute(insert(version_table).values(version=number, description=description))
+        applied.append(number)
+    return applied
+
+async def _main(argv: List[str]):
+    from app.database import engine
+
+    async with engine.begin() as conn:
+        if argv[:1] == ["upgrade"]:
+            applied = await conn.run_sync(upgrade)
+            print(f"Applied migrations: {applied or 'none'}")
+        version = await conn.run_sync(current_version)
+    latest = MIGRATIONS[-1][0]
+    print(f"Schema version {version} (latest {latest})")
+    await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv[1:]))
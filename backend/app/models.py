@@ -1,17 +1,51 @@
-from sqlalchemy import Column, String, Text, Float, Boolean, Integer, DateTime, JSON, func
+from sqlalchemy import Column, String, Text, Float, Boolean, Integer, BigInteger, DateTime, JSON, LargeBinary, Index, func
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.types import TypeDecorator
+from app.compression import compress_text, decompress_text
 import uuid
 
 Base = declarative_base()
 
+# JSONB on Postgres (parsed once on write, GIN-indexable), plain JSON elsewhere
+JSONDocument = JSON().with_variant(JSONB(), "postgresql")
+
+class RawBytes(LargeBinary):
+    """BLOB/BYTEA passed through as stored; SQLite rows from before the column held bytes come back as str"""
+
+    def bind_processor(self, dialect):
+        return None
+
+    def result_processor(self, dialect, coltype):
+        return None
+
+class CompressedText(TypeDecorator):
+    """Text stored zstd-compressed from COMPRESS_MIN_BYTES up (see app.compression)"""
+    impl = RawBytes
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else compress_text(value)
+
+    def process_result_value(self, value, dialect):
+        return decompress_text(value)
+
 def generate_uuid():
     return str(uuid.uuid4())
 
 class Prompt(Base):
     __tablename__ = "prompts"
+    __table_args__ = (
+        Index("ix_prompts_category_success_rate", "category", "success_rate"),
+        Index("ix_prompts_success_rate", "success_rate"),
+        Index("uq_prompts_content_hash", "content_hash", unique=True),
+        Index("uq_prompts_search_rowid", "search_rowid", unique=True),
+    )
 
     id = Column(String, primary_key=True, default=generate_uuid)
     content = Column(Text, nullable=False)
+    content_hash = Column(String(64))  # sha256 of normalized content, for import dedup
+    search_rowid = Column(Integer)  # SQLite full-text key; unlike the implicit rowid, VACUUM never renumbers it
     source = Column(String(100))  # 'L1B3RT4S' or 'CL4R1T4S'
     category = Column(String(50))  # 'jailbreak', 'system_prompt', etc.
     subcategory = Column(String(50))
@@ -20,19 +54,24 @@ class Prompt(Base):
     success_rate = Column(Float, default=0.0)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
-    extra_data = Column(JSON)
+    extra_data = Column(JSONDocument)
 
 class Attempt(Base):
     __tablename__ = "attempts"
+    __table_args__ = (
+        Index("ix_attempts_session_id_timestamp", "session_id", "timestamp"),
+        Index("ix_attempts_model_name_timestamp", "model_name", "timestamp"),
+        Index("ix_attempts_timestamp", "timestamp"),
+    )
 
     id = Column(String, primary_key=True, default=generate_uuid)
     session_id = Column(String, nullable=False)
     prompt = Column(Text, nullable=False)
-    response = Column(Text)
+    response = Column(CompressedText)
     success = Column(Boolean, default=False)
     model_name = Column(String(100))
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
-    extra_data = Column(JSON)
+    extra_data = Column(JSONDocument)
 
 class Exploit(Base):
     """CVE-style tracking for prompt injections and exploits"""
@@ -47,29 +86,35 @@ class Exploit(Base):
     severity = Column(String(20))  # 'low', 'medium', 'high', 'critical'
     source = Column(String(200))  # Where it was discovered
     source_type = Column(String(50))  # 'auto_agent', 'manual', 'github', etc.
-    target_models = Column(JSON)  # List of models vulnerable to this
+    target_models = Column(JSONDocument)  # List of models vulnerable to this
     mitigation = Column(Text)  # Mitigation strategies
     status = Column(String(20), default='active')  # 'active', 'patched', 'archived'
     discovered_date = Column(DateTime(timezone=True))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
-    extra_data = Column(JSON)
+    extra_data = Column(JSONDocument)
 
 class TestRun(Base):
     """Regression test runs to track safety metrics over time"""
     __tablename__ = "test_runs"
+    __table_args__ = (
+        Index("ix_test_runs_exploit_id_target_model", "exploit_id", "target_model"),
+        Index("ix_test_runs_target_model_timestamp", "target_model", "timestamp"),
+        Index("ix_test_runs_timestamp", "timestamp"),
+        Index("uq_test_runs_run_exploit_model", "run_name", "exploit_id", "target_model", unique=True),
+    )
 
     id = Column(String, primary_key=True, default=generate_uuid)
     run_name = Column(String(200))
     exploit_id = Column(String, nullable=False)
     target_model = Column(String(100), nullable=False)
     test_prompt = Column(Text, nullable=False)
-    response = Column(Text)
+    response = Column(CompressedText)
     success = Column(Boolean, default=False)
     blocked = Column(Boolean, default=False)
     execution_time_ms = Column(Integer)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
-    extra_data = Column(JSON)
+    extra_data = Column(JSONDocument)
 
 class AIProvider(Base):
     """Contact information for AI model providers for security notifications"""
@@ -86,11 +131,16 @@ class AIProvider(Base):
     model_patterns = Column(JSON)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
-    extra_data = Column(JSON)
+    extra_data = Column(JSONDocument)
 
 class JailbreakNotification(Base):
     """Log of all jailbreak notifications sent to AI providers"""
     __tablename__ = "jailbreak_notifications"
+    __table_args__ = (
+        Index("ix_jailbreak_notifications_provider_id_status", "provider_id", "notification_status"),
+        Index("ix_jailbreak_notifications_status_next_attempt_at", "notification_status", "next_attempt_at"),
+        Index("uq_jailbreak_notifications_provider_id_finding_key", "provider_id", "finding_key", unique=True),
+    )
 
     id = Column(String, primary_key=True, default=generate_uuid)
     provider_id = Column(String, nullable=False)
@@ -98,9 +148,115 @@ class JailbreakNotification(Base):
     test_run_id = Column(String)
     exploit_id = Column(String)
     model_name = Column(String(100), nullable=False)
-    jailbreak_prompt = Column(Text, nullable=False)
+    jailbreak_prompt = Column(CompressedText, nullable=False)
     notification_method = Column(String(20))
-    notification_status = Column(String(20), default='pending')
+    notification_status = Column(String(20), default='pending')  # 'pending', 'sending', 'sent', 'failed', 'skipped'
     notification_response = Column(Text)
+    finding_key = Column(String(64))  # sha256 of model + normalized prompt; one notification per finding
+    idempotency_key = Column(String(64))  # digest this row was delivered in, stable across retries
+    delivery_attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime(timezone=True))
     sent_at = Column(DateTime(timezone=True), server_default=func.now())
-    extra_data = Column(JSON)
+    extra_data = Column(JSONDocument)
+
+class AgentSession(Base):
+    """Persisted agent session state so conversations survive across requests"""
+    __tablename__ = "agent_sessions"
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    conversation = Column(JSON)
+    external_history = Column(JSON)  # {target model: messages}; a single list in older rows
+    notepad = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    extra_data = Column(JSONDocument)
+
+class AgentJob(Base):
+    """An agent run executed by the background worker pool"""
+    __tablename__ = "agent_jobs"
+    __table_args__ = (
+        Index("ix_agent_jobs_status_created_at", "status", "created_at"),
+        Index("ix_agent_jobs_session_id", "session_id"),
+    )
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    session_id = Column(String, nullable=False)
+    message = Column(Text, nullable=False)
+    max_iterations = Column(Integer)
+    status = Column(String(20), default='queued')  # 'queued', 'running', 'completed', 'failed', 'cancelled'
+    error = Column(Text)
+    last_seq = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+    extra_data = Column(JSONDocument)
+
+class AgentJobEvent(Base):
+    """Events emitted by an agent job, for Last-Event-ID replay"""
+    __tablename__ = "agent_job_events"
+    __table_args__ = (
+        Index("uq_agent_job_events_job_id_seq", "job_id", "seq", unique=True),
+    )
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    job_id = Column(String, nullable=False)
+    seq = Column(Integer, nullable=False)
+    event = Column(JSON, nullable=False)
+    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+
+class UsageBucket(Base):
+    """Tokens and priced spend per UTC hour, session, user, model and call kind"""
+    __tablename__ = "usage_buckets"
+    __table_args__ = (
+        Index("ix_usage_buckets_session_id", "session_id"),
+        Index("ix_usage_buckets_user_id_hour", "user_id", "hour"),
+    )
+
+    hour = Column(String(13), primary_key=True)  # 'YYYY-MM-DDTHH' (UTC)
+    session_id = Column(String, primary_key=True)  # '' for regression runs
+    user_id = Column(String(100), primary_key=True)  # '' when the caller named none
+    model_name = Column(String(100), primary_key=True)
+    kind = Column(String(20), primary_key=True)  # 'agent', 'target' or 'regression'
+    calls = Column(Integer, nullable=False, default=0)
+    estimated_calls = Column(Integer, nullable=False, default=0)  # usage estimated from text (stream cut short)
+    prompt_tokens = Column(Integer, nullable=False, default=0)
+    completion_tokens = Column(Integer, nullable=False, default=0)
+    cost_usd = Column(Float, nullable=False, default=0.0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class OutcomeStat(Base):
+    """Attempt/success counters per subject, model and UTC day, maintained as rows are written"""
+    __tablename__ = "outcome_stats"
+    __table_args__ = (
+        Index("ix_outcome_stats_bucket_model_name", "bucket", "model_name"),
+    )
+
+    subject_type = Column(String(20), primary_key=True)  # 'prompt' (attempts) or 'exploit' (test runs)
+    subject_id = Column(String, primary_key=True)  # '' for attempts that match no stored prompt
+    model_name = Column(String(100), primary_key=True)  # '' on the all-models 'all' row
+    bucket = Column(String(10), primary_key=True)  # 'YYYY-MM-DD', or 'all' for the all-time total
+    provider = Column(String(50))
+    category = Column(String(50))
+    attempts = Column(Integer, nullable=False, default=0)
+    successes = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class ArchivePart(Base):
+    """One zstd file of attempts or test runs moved out of the database by the archive job"""
+    __tablename__ = "archive_parts"
+    __table_args__ = (
+        Index("ix_archive_parts_table_name_max_timestamp", "table_name", "max_timestamp"),
+    )
+
+    id = Column(String, primary_key=True, default=generate_uuid)
+    table_name = Column(String(50), nullable=False)  # 'attempts' or 'test_runs'
+    partition = Column(String(7), nullable=False)  # 'YYYY-MM' of the rows' timestamps (UTC)
+    path = Column(String, nullable=False)  # relative to ARCHIVE_DIR
+    rows = Column(Integer, nullable=False)
+    distinct_texts = Column(Integer, nullable=False)  # texts stored once however many rows share them
+    raw_bytes = Column(BigInteger, nullable=False)  # rows as uncompressed JSON lines, before dedup
+    stored_bytes = Column(BigInteger, nullable=False)  # file size
+    min_timestamp = Column(DateTime(timezone=True))
+    max_timestamp = Column(DateTime(timezone=True))
+    archived_before = Column(DateTime(timezone=True), nullable=False)  # cutoff of the run that wrote it
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
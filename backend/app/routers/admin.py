@@ -0,0 +1,177 @@
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, File, Form, Header
+from pydantic import BaseModel
+from typing import List, Optional
+from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import ADMIN_TOKEN
+from app.database import get_db
+from app.models import AIProvider
+from app.services.corpus_importer import import_corpus, detect_format, provider_from_path, FORMATS
+from app.services.notifier import METHODS, get_notifier
+from app.services.archive import ARCHIVED, get_archiver, storage_report
+import io
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    """Admin endpoints are open unless ADMIN_TOKEN is configured"""
+    if ADMIN_TOKEN and x_admin_token != ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+@router.post("/prompts/import")
+async def import_prompts(
+    file: UploadFile = File(...),
+    format: Optional[str] = Form(default=None),
+    source: Optional[str] = Form(default=None),
+    category: Optional[str] = Form(default=None),
+    provider: Optional[str] = Form(default=None),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Import a JSONL/CSV/markdown corpus into the prompts table. The upload is spooled
+    to disk and parsed line by line in a worker thread, so large dumps neither load
+    into memory nor block the event loop.
+    Re-importing the same dump only inserts new prompts and updates changed ones.
+    """
+    filename = file.filename or ""
+    try:
+        corpus_format = format or detect_format(filename)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if corpus_format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(FORMATS)}")
+    if not provider and corpus_format == "markdown" and filename:
+        provider = provider_from_path(filename)
+
+    from app.services.embedding_index import get_embedding_index
+
+    stream = io.TextIOWrapper(file.file, encoding="utf-8", errors="replace", newline="")
+    try:
+        stats = await import_corpus(
+            db, stream, corpus_format, source=source, category=category, provider=provider,
+            index=get_embedding_index()
+        )
+    finally:
+        stream.detach()
+    return {"filename": filename, "format": corpus_format, **stats}
+
+class ProviderContact(BaseModel):
+    company_name: str
+    security_email: Optional[str] = None
+    webhook_url: Optional[str] = None
+    contact_name: Optional[str] = None
+    notification_enabled: bool = True
+    notification_method: str = "email"
+    model_patterns: Optional[List[str]] = None  # globs over model ids; default '<provider_name>/*'
+
+def _provider_dict(provider: AIProvider) -> dict:
+    return {c.name: getattr(provider, c.name) for c in AIProvider.__table__.columns}
+
+@router.get("/providers")
+async def list_providers(db: AsyncSession = Depends(get_db)):
+    result = await db.execute(select(AIProvider).order_by(AIProvider.provider_name))
+    return [_provider_dict(p) for p in result.scalars()]
+
+@router.put("/providers/{provider_name}")
+async def upsert_provider(provider_name: str, contact: ProviderContact, db: AsyncSession = Depends(get_db)):
+    """Create or update where a provider's jailbreak findings are sent"""
+    if contact.notification_method not in METHODS:
+        raise HTTPException(status_code=400, detail=f"notification_method must be one of {', '.join(METHODS)}")
+    result = await db.execute(select(AIProvider).where(AIProvider.provider_name == provider_name))
+    provider = result.scalar_one_or_none()
+    if provider is None:
+        provider = AIProvider(provider_name=provider_name)
+        db.add(provider)
+    for field, value in contact.model_dump().items():
+        setattr(provider, field, value)
+    await db.commit()
+    await db.refresh(provider)
+    get_notifier().invalidate()
+    return _provider_dict(provider)
+
+@router.get("/notifications")
+async def notification_summary():
+    """Notification counts by status, plus dispatcher counters"""
+    notifier = get_notifier()
+    return {"by_status": await notifier.summary(), "dispatcher": notifier.metrics()}
+
+@router.post("/notifications/dispatch")
+async def dispatch_notifications():
+    """Run a dispatch cycle now instead of waiting for the next interval"""
+    return await get_notifier().dispatch()
+
+@router.post("/index/sync")
+async def sync_embedding_index(db: AsyncSession = Depends(get_db)):
+    """Embed prompts/exploits the semantic index is missing and drop deleted ones"""
+    from app.services.embedding_index import get_embedding_index
+
+    return await get_embedding_index().sync(db)
+
+@router.get("/index/duplicates")
+async def near_duplicate_report(
+    kind: str = "prompts",
+    threshold: float = 0.9,
+    limit: int = 50,
+    db: AsyncSession = Depends(get_db)
+):
+    """Clusters of near-duplicate prompts or exploits, largest first"""
+    from app.services.embedding_index import get_embedding_index
+
+    index = get_embedding_index()
+    if kind not in index.SOURCES:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {', '.join(index.SOURCES)}")
+    if not 0 < threshold <= 1:
+        raise HTTPException(status_code=400, detail="threshold must be in (0, 1]")
+    return await index.near_duplicates(db, kind, threshold, limit)
+
+@router.get("/storage")
+async def storage(sample: int = 200, db: AsyncSession = Depends(get_db)):
+    """Space used and saved by compressed text columns and by the archive"""
+    return await storage_report(db, sample)
+
+@router.post("/archive")
+async def run_archive(after_days: Optional[int] = None):
+    """Move attempts and test runs older than after_days (default ARCHIVE_AFTER_DAYS) into archive files"""
+    if after_days is not None and after_days < 1:
+        raise HTTPException(status_code=400, detail="after_days must be at least 1")
+    return await get_archiver().archive(after_days)
+
+def _archive_filters(table: str, model, session_id, run_name, exploit_id, success) -> dict:
+    if table not in ARCHIVED:
+        raise HTTPException(status_code=400, detail=f"table must be one of {', '.join(ARCHIVED)}")
+    filters = {"model_name" if table == "attempts" else "target_model": model, "session_id": session_id,
+               "run_name": run_name, "exploit_id": exploit_id, "success": success}
+    return {name: value for name, value in filters.items() if value is not None}
+
+@router.get("/archive/{table}/rows")
+async def archived_rows(
+    table: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    model: Optional[str] = None,
+    session_id: Optional[str] = None,
+    run_name: Optional[str] = None,
+    exploit_id: Optional[str] = None,
+    success: Optional[bool] = None,
+    limit: int = 100
+):
+    """Archived attempts or test runs in [since, until), oldest first"""
+    filters = _archive_filters(table, model, session_id, run_name, exploit_id, success)
+    rows = await get_archiver().query(table, since, until, limit=max(min(limit, 1000), 1), **filters)
+    return {"table": table, "rows": rows}
+
+@router.get("/archive/{table}/summary")
+async def archived_summary(
+    table: str,
+    group_by: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    model: Optional[str] = None,
+    run_name: Optional[str] = None
+):
+    """Rows and success rate per model (or another column) over archived rows in [since, until)"""
+    filters = _archive_filters(table, model, None, run_name, None, None)
+    group_by = group_by or ("model_name" if table == "attempts" else "target_model")
+    rows = await get_archiver().summarize(table, group_by, since, until, **filters)
+    return {"table": table, "group_by": group_by, "rows": rows}
@@ -1,11 +1,10 @@
 from fastapi import APIRouter, HTTPException, Depends
-from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
-from sqlalchemy.ext.asyncio import AsyncSession
-from app.database import get_db
-from app.services.lupin_agent import LupinAgent
-import json
+from app.config import MAX_ITERATIONS
+from app.services.job_queue import JobQueue, QueueFull, get_job_queue
+from app.services.budget import BudgetExceeded
+from app.routers.jobs import stream_job
 
 router = APIRouter()
 
@@ -16,55 +15,71 @@ class Message(BaseModel):
 class ChatRequest(BaseModel):
     message: str
     history: Optional[List[Message]] = []
+    session_id: Optional[str] = None
+    cache_bypass: bool = False  # ignore cached target replies for this request
+    user_id: Optional[str] = None  # counted against the per-user daily budget
 
 class ChatResponse(BaseModel):
     response: str
     role: str = "assistant"
+    session_id: Optional[str] = None
+
+async def _submit(request: ChatRequest, queue: JobQueue, max_iterations: int = MAX_ITERATIONS) -> dict:
+    try:
+        return await queue.submit(
+            request.message,
+            session_id=request.session_id,
+            history=[m.model_dump() for m in request.history or []],
+            max_iterations=max_iterations,
+            cache_bypass=request.cache_bypass,
+            user_id=request.user_id or ""
+        )
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except BudgetExceeded as e:
+        raise HTTPException(status_code=429, detail=e.verdict)
 
 @router.post("/lupin/stream")
-async def chat_with_lupin_stream(request: ChatRequest, db: AsyncSession = Depends(get_db)):
+async def chat_with_lupin_stream(
+    request: ChatRequest,
+    queue: JobQueue = Depends(get_job_queue)
+):
     """
-    Chat with Lupin with real-time streaming via Server-Sent Events
+    Chat with Lupin with real-time streaming via Server-Sent Events.
+    The run is a background job: the first event carries its job_id, and a
+    dropped client can re-attach at /api/jobs/{job_id}/events with Last-Event-ID.
     """
-    agent = LupinAgent(db)
-
-    async def event_generator():
-        try:
-            async for event in agent.run(request.message):
-                yield f"data: {json.dumps(event)}\n\n"
-        except Exception as e:
-            yield f"data: {json.dumps({'type': 'error', 'content': str(e)})}\n\n"
-
-    return StreamingResponse(
-        event_generator(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "Connection": "keep-alive",
-        }
-    )
+    job = await _submit(request, queue)
+    return stream_job(queue, job["job_id"])
 
 @router.post("/lupin", response_model=ChatResponse)
-async def chat_with_lupin(request: ChatRequest, db: AsyncSession = Depends(get_db)):
+async def chat_with_lupin(
+    request: ChatRequest,
+    queue: JobQueue = Depends(get_job_queue)
+):
     """
     Chat with Lupin (non-streaming fallback)
     """
-    agent = LupinAgent(db)
+    job = await _submit(request, queue, max_iterations=10)
 
     final_response = ""
-    async for event in agent.run(request.message, max_iterations=10):
+    async for _, event in queue.subscribe(job["job_id"]):
         if event.get("type") == "final":
             final_response = event.get("content", "")
             break
         elif event.get("type") == "error":
             raise HTTPException(status_code=500, detail=event.get("content"))
+        elif event.get("type") == "budget_exceeded":
+            final_response = event["message"]
+            break
 
     if not final_response:
         final_response = "I'm working on your request. This may take a moment..."
 
     return ChatResponse(
         response=final_response,
-        role="assistant"
+        role="assistant",
+        session_id=job["session_id"]
     )
 
 @router.get("/health")
@@ -0,0 +1,86 @@
+from fastapi import APIRouter, HTTPException, Depends, Header
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import List, Optional
+from app.config import MAX_ITERATIONS
+from app.services.job_queue import JobQueue, QueueFull, get_job_queue, sse_event
+from app.services.budget import BudgetExceeded
+
+router = APIRouter()
+
+class JobMessage(BaseModel):
+    role: str
+    content: str
+
+class JobRequest(BaseModel):
+    message: str
+    history: Optional[List[JobMessage]] = []
+    session_id: Optional[str] = None
+    max_iterations: int = MAX_ITERATIONS
+    cache_bypass: bool = False
+    user_id: Optional[str] = None  # counted against the per-user daily budget
+
+def stream_job(queue: JobQueue, job_id: str, after: int = 0) -> StreamingResponse:
+    """SSE response relaying a job's events; disconnecting does not stop the job"""
+    async def event_generator():
+        async for seq, event in queue.subscribe(job_id, after):
+            yield sse_event(seq, event)
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        }
+    )
+
+@router.post("", status_code=202)
+async def submit_job(request: JobRequest, queue: JobQueue = Depends(get_job_queue)):
+    """Queue an agent run; follow it with GET /api/jobs/{job_id}/events"""
+    try:
+        return await queue.submit(
+            request.message,
+            session_id=request.session_id,
+            history=[m.model_dump() for m in request.history or []],
+            max_iterations=min(max(request.max_iterations, 1), MAX_ITERATIONS),
+            cache_bypass=request.cache_bypass,
+            user_id=request.user_id or ""
+        )
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except BudgetExceeded as e:
+        raise HTTPException(status_code=429, detail=e.verdict)
+
+@router.get("/{job_id}")
+async def get_job(job_id: str, queue: JobQueue = Depends(get_job_queue)):
+    job = await queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/{job_id}/events")
+async def job_events(
+    job_id: str,
+    after: int = 0,
+    last_event_id: Optional[str] = Header(default=None),
+    queue: JobQueue = Depends(get_job_queue)
+):
+    """
+    Attach to a job's event stream. Reconnecting clients send Last-Event-ID (or
+    ?after=) to resume; token deltas are only replayable while the job is recent.
+    """
+    if await queue.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if last_event_id and last_event_id.isdigit():
+        after = max(after, int(last_event_id))
+    return stream_job(queue, job_id, after)
+
+@router.delete("/{job_id}")
+async def cancel_job(job_id: str, queue: JobQueue = Depends(get_job_queue)):
+    if not await queue.cancel(job_id):
+        job = await queue.get(job_id)
+        if job is None:
+            raise HTTPException(status_code=404, detail="Job not found")
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    return {"job_id": job_id, "status": "cancelling"}
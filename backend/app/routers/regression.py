@@ -0,0 +1,56 @@
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from typing import List, Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db
+from app.services.http_pool import HttpPool
+from app.services.regression_runner import RegressionRunner, load_exploits
+import json
+
+router = APIRouter()
+
+def app_http_pool(request: Request) -> HttpPool:
+    """The pool the app lifespan created"""
+    return request.app.state.http_pool
+
+class RegressionRequest(BaseModel):
+    run_name: str
+    models: List[str]
+    exploit_ids: Optional[List[str]] = None
+    cache_bypass: bool = False  # re-probe instead of serving cached responses
+
+@router.post("/stream")
+async def run_regression_stream(
+    request: RegressionRequest,
+    db: AsyncSession = Depends(get_db),
+    http: HttpPool = Depends(app_http_pool)
+):
+    """
+    Run exploits against target models, streaming each TestRun result via Server-Sent Events.
+    Re-posting the same run_name resumes it, skipping pairs that are already recorded.
+    """
+    if not request.models:
+        raise HTTPException(status_code=400, detail="At least one target model is required")
+
+    exploits = await load_exploits(db, request.exploit_ids)
+    if not exploits:
+        raise HTTPException(status_code=404, detail="No matching exploits")
+
+    runner = RegressionRunner(http=http, cache_bypass=request.cache_bypass)
+
+    async def event_generator():
+        try:
+            async for event in runner.run(db, request.run_name, exploits, request.models):
+                yield f"data: {json.dumps(event)}\n\n"
+        except Exception as e:
+            yield f"data: {json.dumps({'type': 'error', 'content': str(e)})}\n\n"
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        }
+    )
@@ -0,0 +1,95 @@
+from fastapi import APIRouter, HTTPException, Depends, Query
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db
+from app.routers.admin import require_admin
+from app.services.outcome_stats import (
+    GROUP_BY, PROMPT, EXPLOIT, get_stats_reconciler, success_rates, subject_stats
+)
+from app.services.budget import GROUP_BY as SPEND_GROUP_BY, get_budget_tracker, spend_report, spend_timeseries
+
+router = APIRouter()
+
+@router.get("/success-rates")
+async def get_success_rates(
+    group_by: str = Query(default="model", description="model, provider or category"),
+    days: int = Query(default=7, ge=1, le=3650),
+    subject_type: Optional[str] = Query(default=None, description="prompt (agent attempts) or exploit (test runs)"),
+    by_day: bool = False,
+    model: Optional[str] = None,
+    provider: Optional[str] = None,
+    category: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Success rate over the last `days` days, read from the incrementally maintained
+    day buckets. by_day=true adds a per-day series.
+    """
+    if group_by not in GROUP_BY:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {', '.join(GROUP_BY)}")
+    if subject_type not in (None, PROMPT, EXPLOIT):
+        raise HTTPException(status_code=400, detail=f"subject_type must be {PROMPT} or {EXPLOIT}")
+    rows = await success_rates(
+        db, group_by=group_by, days=days, subject_type=subject_type, by_day=by_day,
+        model=model, provider=provider, category=category
+    )
+    return {"group_by": group_by, "days": days, "rows": rows}
+
+@router.get("/prompts/{prompt_id}")
+async def get_prompt_stats(prompt_id: str, db: AsyncSession = Depends(get_db)):
+    """All-time attempts and success rate of one prompt, per model"""
+    return await subject_stats(db, PROMPT, prompt_id)
+
+@router.get("/exploits/{exploit_id}")
+async def get_exploit_stats(exploit_id: str, db: AsyncSession = Depends(get_db)):
+    """All-time test runs and success rate of one exploit, per model"""
+    return await subject_stats(db, EXPLOIT, exploit_id)
+
+@router.post("/reconcile", dependencies=[Depends(require_admin)])
+async def reconcile_stats(days: Optional[int] = Query(default=None, ge=0, description="0 rebuilds all history")):
+    """Re-derive recent day buckets from attempts and test runs now, instead of waiting for the next run"""
+    return await get_stats_reconciler().reconcile(days)
+
+@router.get("/spend", dependencies=[Depends(require_admin)])
+async def get_spend(
+    group_by: str = Query(default="model", description="model, provider, user, session or kind"),
+    days: int = Query(default=7, ge=1, le=3650),
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    model: Optional[str] = None,
+    kind: Optional[str] = Query(default=None, description="agent, target or regression"),
+    limit: int = Query(default=50, ge=1, le=1000),
+    db: AsyncSession = Depends(get_db)
+):
+    """Calls, tokens and priced spend over the last `days` days, from the hourly usage buckets"""
+    if group_by not in SPEND_GROUP_BY:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {', '.join(SPEND_GROUP_BY)}")
+    rows = await spend_report(
+        db, group_by=group_by, days=days, user_id=user_id, session_id=session_id, model=model, kind=kind, limit=limit
+    )
+    return {"group_by": group_by, "days": days, "rows": rows}
+
+@router.get("/spend/timeseries", dependencies=[Depends(require_admin)])
+async def get_spend_timeseries(
+    granularity: str = Query(default="hour", description="hour or day"),
+    days: int = Query(default=1, ge=1, le=3650),
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    model: Optional[str] = None,
+    kind: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Spend and throughput (calls and tokens per minute) per UTC hour or day"""
+    if granularity not in ("hour", "day"):
+        raise HTTPException(status_code=400, detail="granularity must be hour or day")
+    series = await spend_timeseries(
+        db, granularity=granularity, days=days, user_id=user_id, session_id=session_id, model=model, kind=kind
+    )
+    return {"granularity": granularity, "days": days, "series": series}
+
+@router.get("/budget", dependencies=[Depends(require_admin)])
+async def get_budget(session_id: Optional[str] = None, user_id: Optional[str] = None):
+    """Live spend against the session, user and global limits (includes not-yet-persisted calls)"""
+    tracker = get_budget_tracker()
+    await tracker.prepare(session_id or "", user_id or "")
+    return tracker.status(session_id or "", user_id or "")
@@ -0,0 +1,449 @@
+"""
+Age-based archival of attempts and test runs, and the storage report.
+
+Rows older than ARCHIVE_AFTER_DAYS (cut at a UTC midnight) are written to
+ARCHIVE_DIR/<table>/<YYYY-MM>/<part id>.jsonl.zst - one zstd frame of JSON lines,
+partitioned by the month of each row's timestamp - and deleted from the database
+in the transaction that records the file in archive_parts. Within a file each
+distinct prompt/response text is stored once, on a line before the first row that
+uses it, and rows carry its digest. Success-rate reports keep reading outcome_stats
+(reconciliation never re-derives archived days); query() and summarize() scan the
+parts overlapping a time range for row-level reports.
+"""
+import asyncio
+import hashlib
+import io
+import json
+import os
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import bindparam, cast, delete, func, insert, literal, select, type_coerce, update
+from app.database import AsyncSessionLocal
+from app.models import ArchivePart, Attempt, JailbreakNotification, RawBytes, TestRun, generate_uuid
+from app.config import (
+    ARCHIVE_DIR, ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, ARCHIVE_INTERVAL, ARCHIVE_LEVEL, COMPRESS_MIN_BYTES
+)
+from app.compression import ZSTD_MAGIC, compressor, decompressor, decompress_text
+
+# Archived tables and their text columns stored once per file
+ARCHIVED = {
+    "attempts": (Attempt, ("prompt", "response")),
+    "test_runs": (TestRun, ("test_prompt", "response")),
+}
+COMPRESSED_COLUMNS = (
+    (Attempt, "response"),
+    (TestRun, "response"),
+    (JailbreakNotification, "jailbreak_prompt"),
+)
+
+# Shorter texts are inlined; a digest line would not save anything
+DEDUP_MIN_CHARS = 64
+
+# Unrecorded part files younger than this may belong to a batch still committing elsewhere
+ORPHAN_GRACE_SECONDS = 3600
+
+def archive_cutoff(after_days: int = ARCHIVE_AFTER_DAYS) -> datetime:
+    """UTC midnight `after_days` days ago; whole days are archived so day buckets stay exact"""
+    day = datetime.now(timezone.utc).date() - timedelta(days=max(after_days, 1))
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    # SQLite hands back naive datetimes for timezone=True columns; they are UTC
+    if value is not None and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+def _json_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return _utc(value).isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+def encode_part(rows: List[Dict[str, Any]], text_fields: Tuple[str, ...], level: int = ARCHIVE_LEVEL) -> Tuple[bytes, Dict[str, int]]:
+    """One part file's bytes, with each long text stored once, plus its size stats"""
+    seen = set()
+    lines = []
+    raw_bytes = 0
+    for row in rows:
+        row = {name: _json_value(value) for name, value in row.items()}
+        raw_bytes += len(json.dumps(row).encode("utf-8")) + 1
+        refs = []
+        for field in text_fields:
+            text = row.get(field)
+            if not isinstance(text, str) or len(text) < DEDUP_MIN_CHARS:
+                continue
+            digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            if digest not in seen:
+                seen.add(digest)
+                lines.append(json.dumps({"text": digest, "value": text}))
+            row[field] = digest
+            refs.append(field)
+        lines.append(json.dumps({"row": row, "refs": refs} if refs else {"row": row}))
+    data = compressor(level).compress(("\n".join(lines) + "\n").encode("utf-8"))
+    return data, {"rows": len(rows), "distinct_texts": len(seen), "raw_bytes": raw_bytes, "stored_bytes": len(data)}
+
+def read_part(path: str) -> Iterator[Dict[str, Any]]:
+    """Rows of one part file, texts restored, in the order they were written"""
+    texts: Dict[str, str] = {}
+    with open(path, "rb") as f, decompressor().stream_reader(f) as reader:
+        for line in io.TextIOWrapper(reader, encoding="utf-8"):
+            item = json.loads(line)
+            if "text" in item:
+                texts[item["text"]] = item["value"]
+                continue
+            row = item["row"]
+            for field in item.get("refs", ()):
+                row[field] = texts[row[field]]
+            yield row
+
+def _write_file(path: str, data: bytes):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def _part_files(directory: str, older_than: float) -> Iterator[str]:
+    """Part files (and interrupted .tmp writes) last modified before `older_than`, relative to directory"""
+    for table_name in ARCHIVED:
+        for root, _dirs, files in os.walk(os.path.join(directory, table_name)):
+            for name in files:
+                path = os.path.join(root, name)
+                if name.endswith((".jsonl.zst", ".tmp")) and os.path.getmtime(path) < older_than:
+                    yield os.path.relpath(path, directory)
+
+def _matches(row: Dict[str, Any], since: Optional[datetime], until: Optional[datetime], filters: Dict[str, Any]) -> bool:
+    if since is not None or until is not None:
+        timestamp = datetime.fromisoformat(row["timestamp"]) if row.get("timestamp") else None
+        if timestamp is None or (since is not None and timestamp < since) or (until is not None and timestamp >= until):
+            return False
+    return all(row.get(name) == value for name, value in filters.items())
+
+class Archiver:
+    """Moves old rows into compressed part files and reads them back for reports"""
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        directory: str = ARCHIVE_DIR,
+        after_days: int = ARCHIVE_AFTER_DAYS,
+        batch_size: int = ARCHIVE_BATCH_SIZE,
+        interval: float = ARCHIVE_INTERVAL,
+        level: int = ARCHIVE_LEVEL
+    ):
+        self.session_factory = session_factory
+        self.directory = directory
+        self.after_days = after_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self.level = level
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        self.runs = 0
+        self.failures = 0
+        self.rows_archived = 0
+        self.parts_written = 0
+        self.orphans_removed = 0
+        self.last_result: Optional[Dict[str, Any]] = None
+
+    async def _archive_batch(self, table_name: str, cutoff: datetime) -> Tuple[int, bool]:
+        """Archive up to batch_size of the oldest rows. Returns (rows archived, more left)."""
+        model, text_fields = ARCHIVED[table_name]
+        table = model.__table__
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(table).where(table.c.timestamp < cutoff).order_by(table.c.timestamp, table.c.id).limit(self.batch_size)
+            )
+            rows = [dict(row._mapping) for row in result.all()]
+        if not rows:
+            return 0, False
+
+        partitions: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        for row in rows:
+            partitions[_utc(row["timestamp"]).strftime("%Y-%m")].append(row)
+
+        archived = 0
+        for partition, part_rows in partitions.items():
+            part_id = generate_uuid()
+            relative = os.path.join(table_name, partition, f"{part_id}.jsonl.zst")
+            path = os.path.join(self.directory, relative)
+            data, stats = await asyncio.to_thread(encode_part, part_rows, text_fields, self.level)
+            await asyncio.to_thread(_write_file, path, data)
+
+            ids = [row["id"] for row in part_rows]
+            try:
+                async with self.session_factory() as db:
+                    deleted = (await db.execute(delete(table).where(table.c.id.in_(ids)))).rowcount
+                    if deleted != len(ids):
+                        # Another archiver (or a delete) got to some of these rows first
+                        await db.rollback()
+                        os.remove(path)
+                        return archived, False
+                    await db.execute(insert(ArchivePart).values(
+                        id=part_id, table_name=table_name, partition=partition, path=relative,
+                        min_timestamp=_utc(part_rows[0]["timestamp"]), max_timestamp=_utc(part_rows[-1]["timestamp"]),
+                        archived_before=cutoff, **stats
+                    ))
+                    await db.commit()
+            except Exception:
+                os.remove(path)
+                raise
+            archived += len(part_rows)
+            self.parts_written += 1
+        return archived, len(rows) == self.batch_size
+
+    async def archive(self, after_days: Optional[int] = None) -> Dict[str, Any]:
+        """Archive every attempt and test run older than the cutoff"""
+        cutoff = archive_cutoff(self.after_days if after_days is None else after_days)
+        started = time.perf_counter()
+        counts = {}
+        async with self._lock:
+            for table_name in ARCHIVED:
+                counts[table_name] = 0
+                more = True
+                while more:
+                    archived, more = await self._archive_batch(table_name, cutoff)
+                    counts[table_name] += archived
+        self.runs += 1
+        self.rows_archived += sum(counts.values())
+        self.last_result = {
+            "archived_before": cutoff.isoformat(), **counts,
+            "elapsed_s": round(time.perf_counter() - started, 2)
+        }
+        if any(counts.values()):
+            print(f"🗄️ Archived {counts} rows from before {cutoff.date()}")
+        return self.last_result
+
+    async def parts(
+        self,
+        table_name: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None
+    ) -> List[ArchivePart]:
+        query = select(ArchivePart).where(ArchivePart.table_name == table_name)
+        if since is not None:
+            query = query.where(ArchivePart.max_timestamp >= since)
+        if until is not None:
+            query = query.where(ArchivePart.min_timestamp < until)
+        async with self.session_factory() as db:
+            result = await db.execute(query.order_by(ArchivePart.min_timestamp))
+            return list(result.scalars().all())
+
+    def _scan(self, paths: List[str], since, until, filters) -> Iterator[Dict[str, Any]]:
+        for path in paths:
+            for row in read_part(os.path.join(self.directory, path)):
+                if _matches(row, since, until, filters):
+                    yield row
+
+    async def query(
+        self,
+        table_name: str,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        limit: int = 100,
+        **filters
+    ) -> List[Dict[str, Any]]:
+        """Archived rows in [since, until) whose columns equal the given filters, oldest first"""
+        paths = [part.path for part in await self.parts(table_name, since, until)]
+        since, until = _utc(since), _utc(until)
+
+        def collect():
+            rows = []
+            for row in self._scan(paths, since, until, filters):
+                rows.append(row)
+                if len(rows) >= limit:
+                    break
+            return rows
+        return await asyncio.to_thread(collect)
+
+    async def summarize(
+        self,
+        table_name: str,
+        group_by: str = "model_name",
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        **filters
+    ) -> List[Dict[str, Any]]:
+        """Rows and successes per value of one column over the archived rows in range"""
+        paths = [part.path for part in await self.parts(table_name, since, until)]
+        since, until = _utc(since), _utc(until)
+
+        def aggregate():
+            counts: Dict[Any, List[int]] = defaultdict(lambda: [0, 0])
+            for row in self._scan(paths, since, until, filters):
+                counts[row.get(group_by)][0] += 1
+                counts[row.get(group_by)][1] += bool(row.get("success"))
+            return [
+                {group_by: key, "rows": total, "successes": successes, "success_rate": round(successes / total, 4)}
+                for key, (total, successes) in sorted(counts.items(), key=lambda item: -item[1][0])
+            ]
+        return await asyncio.to_thread(aggregate)
+
+    async def sweep_orphans(self, grace: float = ORPHAN_GRACE_SECONDS) -> int:
+        """
+        Delete part files that no archive_parts row records: a process that died
+        between writing a file and committing its batch leaves one behind, and the
+        rows it holds are still in the database. Returns the number removed.
+        """
+        candidates = await asyncio.to_thread(lambda: list(_part_files(self.directory, time.time() - grace)))
+        if not candidates:
+            return 0
+        async with self.session_factory() as db:
+            recorded = set((await db.execute(select(ArchivePart.path))).scalars().all())
+        orphans = [path for path in candidates if path not in recorded]
+        for path in orphans:
+            try:
+                os.remove(os.path.join(self.directory, path))
+            except FileNotFoundError:
+                pass
+        self.orphans_removed += len(orphans)
+        if orphans:
+            print(f"🗄️ Removed {len(orphans)} unrecorded archive files")
+        return len(orphans)
+
+    def start(self):
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        try:
+            await self.sweep_orphans()
+        except Exception as e:
+            print(f"⚠️ Archive orphan sweep failed: {e}")
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.archive()
+            except Exception as e:
+                self.failures += 1
+                print(f"⚠️ Archival failed: {e}")
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "interval_s": self.interval,
+            "after_days": self.after_days,
+            "runs": self.runs,
+            "failures": self.failures,
+            "rows_archived": self.rows_archived,
+            "parts_written": self.parts_written,
+            "orphans_removed": self.orphans_removed,
+            "last": self.last_result
+        }
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+_archiver: Optional[Archiver] = None
+
+def get_archiver() -> Archiver:
+    global _archiver
+    if _archiver is None:
+        _archiver = Archiver()
+    return _archiver
+
+async def close_archiver():
+    global _archiver
+    if _archiver is not None:
+        await _archiver.close()
+        _archiver = None
+
+async def compress_existing(db, batch_size: int = 1000) -> Dict[str, int]:
+    """
+    Rewrite values stored before compression (or under a lower threshold) that are
+    now above COMPRESS_MIN_BYTES. Space is returned to the OS by VACUUM afterwards.
+    """
+    counts = {}
+    for model, column_name in COMPRESSED_COLUMNS:
+        table = model.__table__
+        column = table.c[column_name]
+        rewrite = update(table).where(table.c.id == bindparam("_id")).values({column_name: bindparam("_value")})
+        rewritten, last_id = 0, ""
+        while True:
+            rows = (await db.execute(
+                select(table.c.id, type_coerce(column, RawBytes()).label("stored"))
+                .where(table.c.id > last_id).order_by(table.c.id).limit(batch_size)
+            )).all()
+            if not rows:
+                break
+            updates = []
+            for row_id, stored in rows:
+                raw = stored.encode("utf-8") if isinstance(stored, str) else stored
+                if raw is not None and len(raw) >= COMPRESS_MIN_BYTES and bytes(raw[:4]) != ZSTD_MAGIC:
+                    updates.append({"_id": row_id, "_value": decompress_text(stored)})
+            if updates:
+                await db.execute(rewrite, updates)
+                await db.commit()
+            rewritten += len(updates)
+            last_id = rows[-1][0]
+        counts[f"{table.name}.{column_name}"] = rewritten
+    return counts
+
+async def storage_report(db, sample: int = 200) -> Dict[str, Any]:
+    """
+    Stored size of the compressed columns (raw size estimated from a sample of the
+    compressed values) and the archive's totals from archive_parts.
+    """
+    columns = []
+    for model, column_name in COMPRESSED_COLUMNS:
+        stored = type_coerce(model.__table__.c[column_name], RawBytes())
+        compressed = func.substr(stored, 1, 4) == literal(ZSTD_MAGIC, RawBytes())
+        totals = {}
+        for label, condition in (("plain", ~compressed), ("compressed", compressed)):
+            rows, size = (await db.execute(
+                # Byte length: SQLite's length() counts characters of the TEXT values written before compression
+                select(func.count(), func.coalesce(func.sum(func.length(cast(stored, RawBytes()))), 0))
+                .where(stored.is_not(None), condition)
+            )).one()
+            totals[label] = (int(rows), int(size))
+        sampled = (await db.execute(select(stored).where(compressed).limit(sample))).scalars().all()
+        sample_stored = sum(len(value) for value in sampled)
+        sample_raw = sum(len(decompress_text(value).encode("utf-8")) for value in sampled)
+        ratio = sample_raw / sample_stored if sample_stored else 1.0
+        stored_bytes = totals["plain"][1] + totals["compressed"][1]
+        estimated_raw = totals["plain"][1] + int(totals["compressed"][1] * ratio)
+        columns.append({
+            "column": f"{model.__tablename__}.{column_name}",
+            "rows": totals["plain"][0] + totals["compressed"][0],
+            "compressed_rows": totals["compressed"][0],
+            "stored_bytes": stored_bytes,
+            "estimated_raw_bytes": estimated_raw,
+            "saved_bytes": estimated_raw - stored_bytes,
+            "compression_ratio": round(ratio, 2),
+        })
+
+    archive = (await db.execute(
+        select(
+            ArchivePart.table_name,
+            func.count().label("parts"),
+            func.sum(ArchivePart.rows).label("rows"),
+            func.sum(ArchivePart.distinct_texts).label("distinct_texts"),
+            func.sum(ArchivePart.raw_bytes).label("raw_bytes"),
+            func.sum(ArchivePart.stored_bytes).label("stored_bytes"),
+            func.min(ArchivePart.min_timestamp).label("oldest"),
+            func.max(ArchivePart.archived_before).label("archived_before"),
+        ).group_by(ArchivePart.table_name)
+    )).all()
+    return {
+        "columns": columns,
+        "archive": [
+            {
+                "table": row.table_name, "parts": row.parts, "rows": int(row.rows), "distinct_texts": int(row.distinct_texts),
+                "raw_bytes": int(row.raw_bytes), "stored_bytes": int(row.stored_bytes),
+                "saved_bytes": int(row.raw_bytes) - int(row.stored_bytes),
+                "oldest": _json_value(row.oldest), "archived_before": _json_value(row.archived_before),
+            }
+            for row in archive
+        ],
+    }
@@ -0,0 +1,478 @@
+"""
+Token and spend budgets.
+
+Every completion's `usage` is priced with the model catalog's per-token pricing
+and added to in-memory counters: per session (lifetime), per user and global
+(both per UTC day). Agent runs check them before each agent and target call and
+stop with a `budget_exceeded` event once a limit is reached. Deltas are written
+to `usage_buckets` (one row per UTC hour, session, user, model and call kind)
+every BUDGET_PERSIST_INTERVAL seconds; each write re-reads today's totals, so
+several workers converge on their combined spend within one interval. The spend
+and throughput reports read only these rows.
+"""
+import asyncio
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from app.database import AsyncSessionLocal
+from app.models import UsageBucket
+from app.config import (
+    BUDGET_SESSION_USD, BUDGET_SESSION_TOKENS,
+    BUDGET_USER_DAILY_USD, BUDGET_USER_DAILY_TOKENS,
+    BUDGET_GLOBAL_DAILY_USD, BUDGET_GLOBAL_DAILY_TOKENS,
+    BUDGET_PERSIST_INTERVAL
+)
+from app.services.model_catalog import ModelCatalog, get_model_catalog
+from app.services.metrics import SPEND_USD, BUDGET_EXCEEDED
+from app.services.outcome_stats import window_start
+from app.services.throttle import provider_of
+
+AGENT = "agent"
+TARGET = "target"
+REGRESSION = "regression"
+
+SESSION = "session"
+USER = "user"
+GLOBAL = "global"
+
+# Rough size of a token, for streams cut short before their usage chunk
+CHARS_PER_TOKEN = 4
+
+GROUP_BY = {
+    "model": UsageBucket.model_name,
+    "provider": UsageBucket.model_name,  # folded by provider_of() after the query
+    "user": UsageBucket.user_id,
+    "session": UsageBucket.session_id,
+    "kind": UsageBucket.kind,
+}
+
+BucketKey = Tuple[str, str, str, str, str]  # (hour, session_id, user_id, model_name, kind)
+
+def hour_bucket(timestamp: Optional[datetime] = None) -> str:
+    """UTC hour of a timestamp, e.g. '2025-01-31T14'"""
+    return (timestamp or datetime.now(timezone.utc)).astimezone(timezone.utc).strftime("%Y-%m-%dT%H")
+
+def estimate_usage(messages: List[Dict[str, Any]], text: str) -> Dict[str, int]:
+    """Usage for a completion whose stream ended before the provider reported it"""
+    prompt_chars = sum(len(str(m.get("content") or "")) for m in messages)
+    return {
+        "prompt_tokens": -(-prompt_chars // CHARS_PER_TOKEN),
+        "completion_tokens": -(-len(text) // CHARS_PER_TOKEN)
+    }
+
+def _rate(pricing: Dict[str, Any], name: str) -> float:
+    try:
+        return float(pricing.get(name) or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+class BudgetExceeded(Exception):
+    """Raised instead of making a call that an exhausted budget no longer allows"""
+
+    def __init__(self, verdict: Dict[str, Any]):
+        super().__init__(verdict["message"])
+        self.verdict = verdict
+
+def _upsert(dialect: str):
+    """INSERT that adds to the counters of an existing bucket"""
+    module = postgresql if dialect == "postgresql" else sqlite
+    stmt = module.insert(UsageBucket)
+    return stmt.on_conflict_do_update(
+        index_elements=["hour", "session_id", "user_id", "model_name", "kind"],
+        set_={
+            "calls": UsageBucket.calls + stmt.excluded.calls,
+            "estimated_calls": UsageBucket.estimated_calls + stmt.excluded.estimated_calls,
+            "prompt_tokens": UsageBucket.prompt_tokens + stmt.excluded.prompt_tokens,
+            "completion_tokens": UsageBucket.completion_tokens + stmt.excluded.completion_tokens,
+            "cost_usd": UsageBucket.cost_usd + stmt.excluded.cost_usd,
+            "updated_at": func.now(),
+        }
+    )
+
+class BudgetTracker:
+    """In-memory spend counters with periodic persistence and limit checks"""
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        catalog: Optional[ModelCatalog] = None,
+        limits: Optional[Dict[str, Tuple[float, int]]] = None,
+        persist_interval: float = BUDGET_PERSIST_INTERVAL,
+        max_sessions: int = 10000
+    ):
+        self.session_factory = session_factory
+        self.catalog = catalog or get_model_catalog()
+        # scope -> (USD, tokens); 0 means no limit
+        self.limits = limits or {
+            SESSION: (BUDGET_SESSION_USD, BUDGET_SESSION_TOKENS),
+            USER: (BUDGET_USER_DAILY_USD, BUDGET_USER_DAILY_TOKENS),
+            GLOBAL: (BUDGET_GLOBAL_DAILY_USD, BUDGET_GLOBAL_DAILY_TOKENS),
+        }
+        self.persist_interval = persist_interval
+        self.max_sessions = max_sessions
+
+        # Counters are [usd, tokens]; users and total cover the current UTC day
+        self.day = ""
+        self.sessions: "OrderedDict[str, List[float]]" = OrderedDict()
+        self.users: Dict[str, List[float]] = defaultdict(lambda: [0.0, 0])
+        self.total: List[float] = [0.0, 0]
+        self._day_loaded = False
+        # Deltas not yet written: [calls, estimated_calls, prompt_tokens, completion_tokens, usd]
+        self._pending: Dict[BucketKey, List[float]] = {}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        self.charged = 0
+        self.estimated = 0
+        self.unpriced: Dict[str, int] = defaultdict(int)
+        self.stopped: Dict[str, int] = defaultdict(int)
+        self.flushes = 0
+        self.rows_written = 0
+        self.failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return any(usd or tokens for usd, tokens in self.limits.values())
+
+    def price(self, model: str, usage: Dict[str, int]) -> Optional[float]:
+        """USD for a completion at the catalog's per-token pricing; None if the model is unpriced"""
+        if not self.catalog.loaded:
+            self.catalog.load_snapshot()
+        # Variants ('model:free', 'model:beta') fall back to the base model's pricing
+        entry = self.catalog.by_id.get(model) or self.catalog.by_id.get(model.split(":")[0])
+        pricing = (entry or {}).get("pricing")
+        if not pricing:
+            return None
+        return (
+            usage["prompt_tokens"] * _rate(pricing, "prompt")
+            + usage["completion_tokens"] * _rate(pricing, "completion")
+            + _rate(pricing, "request")
+        )
+
+    def _roll(self):
+        day = datetime.now(timezone.utc).date().isoformat()
+        if day != self.day:
+            self.day = day
+            self.users.clear()
+            self.total = [0.0, 0]
+            self._day_loaded = False
+
+    def _session(self, session_id: str) -> List[float]:
+        counter = self.sessions.get(session_id)
+        if counter is None:
+            counter = self.sessions[session_id] = [0.0, 0]
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        else:
+            self.sessions.move_to_end(session_id)
+        return counter
+
+    def _pending_totals(self, match) -> Tuple[float, int]:
+        usd, tokens = 0.0, 0
+        for key, delta in self._pending.items():
+            if match(key):
+                usd += delta[4]
+                tokens += delta[2] + delta[3]
+        return usd, tokens
+
+    async def _load_day(self):
+        """Today's per-user and global totals: persisted rows plus this process's unwritten deltas"""
+        day = self.day
+        async with self.session_factory() as db:
+            rows = (await db.execute(
+                select(
+                    UsageBucket.user_id,
+                    func.sum(UsageBucket.cost_usd),
+                    func.sum(UsageBucket.prompt_tokens + UsageBucket.completion_tokens)
+                )
+                .where(UsageBucket.hour >= f"{day}T00")
+                .group_by(UsageBucket.user_id)
+            )).all()
+        if day != self.day:
+            return
+        users: Dict[str, List[float]] = defaultdict(lambda: [0.0, 0])
+        total = [0.0, 0]
+        for user_id, usd, tokens in rows:
+            users[user_id] = [float(usd or 0), int(tokens or 0)]
+        for (hour, _session_id, user_id, _model, _kind), delta in self._pending.items():
+            if hour.startswith(day):
+                users[user_id][0] += delta[4]
+                users[user_id][1] += delta[2] + delta[3]
+        for usd, tokens in users.values():
+            total[0] += usd
+            total[1] += tokens
+        self.users, self.total, self._day_loaded = users, total, True
+
+    async def prepare(self, session_id: str = "", user_id: str = ""):
+        """Load what this process has not counted yet: today's totals and the session's spend"""
+        self._roll()
+        if not self._day_loaded:
+            async with self._lock:
+                if not self._day_loaded:
+                    await self._load_day()
+        if session_id and session_id not in self.sessions:
+            # Under the flush lock, so every delta is either persisted or still pending while reading
+            async with self._lock:
+                async with self.session_factory() as db:
+                    usd, tokens = (await db.execute(
+                        select(
+                            func.coalesce(func.sum(UsageBucket.cost_usd), 0.0),
+                            func.coalesce(func.sum(UsageBucket.prompt_tokens + UsageBucket.completion_tokens), 0)
+                        ).where(UsageBucket.session_id == session_id)
+                    )).one()
+                # Replaces any counter a charge started meanwhile: its delta is counted in the pending totals
+                pending_usd, pending_tokens = self._pending_totals(lambda key: key[1] == session_id)
+                self._session(session_id)[:] = [float(usd) + pending_usd, int(tokens) + pending_tokens]
+
+    def charge(
+        self,
+        model: str,
+        usage: Dict[str, int],
+        kind: str,
+        session_id: str = "",
+        user_id: str = "",
+        estimated: bool = False
+    ) -> Dict[str, Any]:
+        """Add one completion to the counters; returns its cost"""
+        self._roll()
+        cost = self.price(model, usage)
+        if cost is None:
+            self.unpriced[model] += 1
+            cost = 0.0
+        tokens = usage["prompt_tokens"] + usage["completion_tokens"]
+
+        delta = self._pending.setdefault((hour_bucket(), session_id, user_id, model, kind), [0, 0, 0, 0, 0.0])
+        delta[0] += 1
+        delta[1] += int(estimated)
+        delta[2] += usage["prompt_tokens"]
+        delta[3] += usage["completion_tokens"]
+        delta[4] += cost
+
+        counters = [self.users[user_id], self.total]
+        if session_id:
+            counters.append(self._session(session_id))
+        for counter in counters:
+            counter[0] += cost
+            counter[1] += tokens
+
+        self.charged += 1
+        self.estimated += int(estimated)
+        if cost:
+            SPEND_USD.inc(cost, model=model, kind=kind)
+        return {"cost_usd": cost, "tokens": tokens, "estimated": estimated}
+
+    def _spent(self, session_id: str, user_id: str) -> List[Tuple[str, str, Optional[List[float]]]]:
+        return [
+            (SESSION, session_id, self.sessions.get(session_id) if session_id else None),
+            # Callers that name no user share the global limit only
+            (USER, user_id, self.users.get(user_id, [0.0, 0]) if user_id else None),
+            (GLOBAL, "", self.total),
+        ]
+
+    def exceeded(self, session_id: str = "", user_id: str = "") -> Optional[Dict[str, Any]]:
+        """The first exhausted budget (session, then user, then global), or None. Counts the stop."""
+        self._roll()
+        for scope, scope_id, spent in self._spent(session_id, user_id):
+            limit_usd, limit_tokens = self.limits[scope]
+            if spent is None or not (
+                (limit_usd and spent[0] >= limit_usd) or (limit_tokens and spent[1] >= limit_tokens)
+            ):
+                continue
+            self.stopped[scope] += 1
+            BUDGET_EXCEEDED.inc(scope=scope)
+            label = f"{scope} {scope_id}" if scope_id else scope
+            return {
+                "scope": scope,
+                "id": scope_id or None,
+                "spent_usd": round(spent[0], 6),
+                "tokens": int(spent[1]),
+                "limit_usd": limit_usd or None,
+                "limit_tokens": limit_tokens or None,
+                "message": f"Budget exceeded for {label}: ${spent[0]:.4f} / {int(spent[1])} tokens spent"
+            }
+        return None
+
+    def status(self, session_id: str = "", user_id: str = "") -> Dict[str, Any]:
+        """Live spend against each limit (session and user only when given)"""
+        self._roll()
+        scopes = {}
+        for scope, scope_id, spent in self._spent(session_id, user_id):
+            if spent is None:
+                continue
+            limit_usd, limit_tokens = self.limits[scope]
+            scopes[scope] = {
+                "id": scope_id or None,
+                "spent_usd": round(spent[0], 6),
+                "tokens": int(spent[1]),
+                "limit_usd": limit_usd or None,
+                "limit_tokens": limit_tokens or None,
+                "remaining_usd": round(max(limit_usd - spent[0], 0.0), 6) if limit_usd else None,
+                "remaining_tokens": max(limit_tokens - int(spent[1]), 0) if limit_tokens else None,
+            }
+        return {"day": self.day, "scopes": scopes}
+
+    async def flush(self, reload: bool = True) -> int:
+        """Write pending deltas (and re-read today's totals, picking up other workers). Returns rows written."""
+        async with self._lock:
+            pending, self._pending = self._pending, {}
+            if pending:
+                rows = [
+                    {
+                        "hour": hour, "session_id": session_id, "user_id": user_id, "model_name": model,
+                        "kind": kind, "calls": calls, "estimated_calls": estimated,
+                        "prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "cost_usd": usd,
+                    }
+                    for (hour, session_id, user_id, model, kind), (calls, estimated, prompt_tokens, completion_tokens, usd)
+                    in pending.items()
+                ]
+                try:
+                    async with self.session_factory() as db:
+                        await db.execute(_upsert(db.bind.dialect.name), rows)
+                        await db.commit()
+                except Exception:
+                    # Keep the deltas (and any added meanwhile) for the next attempt
+                    for key, delta in pending.items():
+                        merged = self._pending.setdefault(key, [0, 0, 0, 0, 0.0])
+                        for i, value in enumerate(delta):
+                            merged[i] += value
+                    raise
+                self.flushes += 1
+                self.rows_written += len(rows)
+            if reload:
+                self._roll()
+                await self._load_day()
+        return len(pending)
+
+    def start(self):
+        if self.persist_interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.persist_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                self.failures += 1
+                print(f"⚠️ Budget persistence failed: {e}")
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "persist_interval_s": self.persist_interval,
+            "charged": self.charged,
+            "estimated": self.estimated,
+            "unpriced": dict(self.unpriced),
+            "stopped": dict(self.stopped),
+            "pending_rows": len(self._pending),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "failures": self.failures,
+            "sessions_tracked": len(self.sessions),
+            "global_today": {"spent_usd": round(self.total[0], 6), "tokens": int(self.total[1])},
+        }
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush(reload=False)
+        except Exception as e:
+            print(f"⚠️ Could not persist final spend: {e}")
+
+_tracker: Optional[BudgetTracker] = None
+
+def get_budget_tracker() -> BudgetTracker:
+    global _tracker
+    if _tracker is None:
+        _tracker = BudgetTracker()
+    return _tracker
+
+async def close_budget_tracker():
+    global _tracker
+    if _tracker is not None:
+        await _tracker.close()
+        _tracker = None
+
+def _filtered(query, days: int, user_id: Optional[str], session_id: Optional[str], model: Optional[str], kind: Optional[str]):
+    query = query.where(UsageBucket.hour >= f"{window_start(days)}T00")
+    if user_id is not None:
+        query = query.where(UsageBucket.user_id == user_id)
+    if session_id:
+        query = query.where(UsageBucket.session_id == session_id)
+    if model:
+        query = query.where(UsageBucket.model_name == model)
+    if kind:
+        query = query.where(UsageBucket.kind == kind)
+    return query
+
+def _sums():
+    return (
+        func.sum(UsageBucket.calls).label("calls"),
+        func.sum(UsageBucket.estimated_calls).label("estimated_calls"),
+        func.sum(UsageBucket.prompt_tokens).label("prompt_tokens"),
+        func.sum(UsageBucket.completion_tokens).label("completion_tokens"),
+        func.sum(UsageBucket.cost_usd).label("cost_usd"),
+    )
+
+def _totals(row) -> Dict[str, Any]:
+    return {
+        "calls": int(row.calls or 0),
+        "estimated_calls": int(row.estimated_calls or 0),
+        "prompt_tokens": int(row.prompt_tokens or 0),
+        "completion_tokens": int(row.completion_tokens or 0),
+        "cost_usd": round(float(row.cost_usd or 0), 6),
+    }
+
+async def spend_report(
+    db,
+    group_by: str = "model",
+    days: int = 7,
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    model: Optional[str] = None,
+    kind: Optional[str] = None,
+    limit: int = 50
+) -> List[Dict[str, Any]]:
+    """Calls, tokens and spend per model/provider/user/session/kind over the last `days` days"""
+    column = GROUP_BY[group_by]
+    query = _filtered(select(column.label("key"), *_sums()), days, user_id, session_id, model, kind).group_by(column)
+    rows: Dict[str, Dict[str, Any]] = {}
+    for row in (await db.execute(query)).all():
+        key = provider_of(row.key) if group_by == "provider" else row.key
+        item = rows.setdefault(key, {group_by: key, **{name: 0 for name in _totals(row)}})
+        for name, value in _totals(row).items():
+            item[name] += value
+    ranked = sorted(rows.values(), key=lambda r: (-r["cost_usd"], -r["calls"]))[:max(limit, 1)]
+    for item in ranked:
+        item["cost_usd"] = round(item["cost_usd"], 6)
+    return ranked
+
+async def spend_timeseries(
+    db,
+    granularity: str = "hour",
+    days: int = 1,
+    user_id: Optional[str] = None,
+    session_id: Optional[str] = None,
+    model: Optional[str] = None,
+    kind: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Spend and throughput (calls and tokens per minute) per UTC hour or day"""
+    bucket = UsageBucket.hour if granularity == "hour" else func.substr(UsageBucket.hour, 1, 10)
+    minutes = 60 if granularity == "hour" else 24 * 60
+    query = _filtered(select(bucket.label("bucket"), *_sums()), days, user_id, session_id, model, kind)
+    series = []
+    for row in (await db.execute(query.group_by(bucket).order_by(bucket))).all():
+        item = {granularity: row.bucket, **_totals(row)}
+        tokens = item["prompt_tokens"] + item["completion_tokens"]
+        item["calls_per_min"] = round(item["calls"] / minutes, 3)
+        item["tokens_per_min"] = round(tokens / minutes, 1)
+        series.append(item)
+    return series
@@ -0,0 +1,222 @@
+import asyncio
+import csv
+import hashlib
+import json
+import os
+import re
+import time
+import unicodedata
+from typing import Dict, Any, Iterable, Iterator, List, Optional, TextIO
+from sqlalchemy import select, update, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import Prompt, generate_uuid
+from app.config import IMPORT_CHUNK_SIZE
+
+# Columns an import may set besides content; a row is "changed" when any of these differ
+METADATA_FIELDS = ("source", "category", "subcategory", "provider", "severity")
+CONTENT_KEYS = ("content", "prompt", "text")
+FORMATS = ("jsonl", "csv", "markdown")
+
+_WHITESPACE = re.compile(r"\s+")
+_HEADING = re.compile(r"^#{1,6}\s+(.*?)\s*#*\s*$")
+
+def normalize_content(content: str) -> str:
+    """Canonical form used for dedup: NFKC, case-folded, whitespace collapsed"""
+    return _WHITESPACE.sub(" ", unicodedata.normalize("NFKC", content)).strip().casefold()
+
+def content_hash(content: str) -> str:
+    return hashlib.sha256(normalize_content(content).encode("utf-8")).hexdigest()
+
+def _record(raw: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    content = next((raw[k] for k in CONTENT_KEYS if isinstance(raw.get(k), str) and raw[k].strip()), None)
+    if content is None:
+        return None
+    record = {"content": content.strip()}
+    for field in METADATA_FIELDS:
+        if raw.get(field):
+            record[field] = str(raw[field])
+    return record
+
+def parse_jsonl(lines: Iterable[str]) -> Iterator[Optional[Dict[str, Any]]]:
+    """One JSON object per line; yields None for lines that are not usable records"""
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            raw = json.loads(line)
+        except json.JSONDecodeError:
+            yield None
+            continue
+        yield _record(raw) if isinstance(raw, dict) else None
+
+def parse_csv(lines: Iterable[str]) -> Iterator[Optional[Dict[str, Any]]]:
+    """CSV with a header row naming at least a content/prompt/text column"""
+    csv.field_size_limit(16 * 1024 * 1024)
+    for raw in csv.DictReader(lines):
+        yield _record(raw)
+
+def parse_markdown(lines: Iterable[str]) -> Iterator[Optional[Dict[str, Any]]]:
+    """
+    L1B3RT4S/CL4R1T4S style dumps: every heading starts a new prompt, the heading
+    text becomes its subcategory. Headings inside code fences are prompt text.
+    """
+    heading, body, in_fence = None, [], False
+
+    def flush():
+        text = "".join(body).strip()
+        if text:
+            return _record({"content": text, "subcategory": heading})
+        return None
+
+    for line in lines:
+        if line.lstrip().startswith(("```", "~~~")):
+            in_fence = not in_fence
+        match = None if in_fence else _HEADING.match(line)
+        if match:
+            record = flush()
+            if record:
+                yield record
+            heading, body = match.group(1)[:50] or None, []
+        else:
+            body.append(line)
+    record = flush()
+    if record:
+        yield record
+
+PARSERS = {"jsonl": parse_jsonl, "csv": parse_csv, "markdown": parse_markdown}
+
+def detect_format(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    if ext == ".csv":
+        return "csv"
+    if ext in (".md", ".mkd", ".markdown", ".txt"):
+        return "markdown"
+    raise ValueError(f"Cannot infer corpus format from {path!r}; pass one of {', '.join(FORMATS)}")
+
+def provider_from_path(path: str) -> Optional[str]:
+    """L1B3RT4S names files after the provider, e.g. ANTHROPIC.mkd -> 'anthropic'"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return stem.lower()[:50] or None
+
+def _by_columns(rows: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    return list(groups.values())
+
+class CorpusImporter:
+    """
+    Streams a corpus into the prompts table in chunks. Rows are keyed by a hash of
+    their normalized content, so re-importing a dump inserts only new prompts and
+    updates only prompts whose metadata changed.
+    """
+
+    def __init__(self, db: AsyncSession, chunk_size: int = IMPORT_CHUNK_SIZE, index=None):
+        self.db = db
+        self.chunk_size = chunk_size
+        self.index = index  # EmbeddingIndex to extend with each chunk's new prompts
+        self.stats = {"read": 0, "invalid": 0, "duplicates": 0, "inserted": 0, "updated": 0, "unchanged": 0}
+
+    def _insert(self):
+        """Bulk insert that skips hashes a concurrent import already added"""
+        dialect = self.db.bind.dialect.name
+        if dialect == "sqlite":
+            return sqlite.insert(Prompt).on_conflict_do_nothing(index_elements=["content_hash"])
+        if dialect == "postgresql":
+            return postgresql.insert(Prompt).on_conflict_do_nothing(index_elements=["content_hash"])
+        return insert(Prompt)
+
+    async def _write_chunk(self, chunk: Dict[str, Dict[str, Any]]):
+        result = await self.db.execute(
+            select(Prompt.id, Prompt.content_hash, *[getattr(Prompt, f) for f in METADATA_FIELDS])
+            .where(Prompt.content_hash.in_(list(chunk)))
+        )
+        existing = {row.content_hash: row for row in result.all()}
+
+        new_rows, changed = [], []
+        for digest, record in chunk.items():
+            row = existing.get(digest)
+            if row is None:
+                new_rows.append({"id": generate_uuid(), "content_hash": digest, **record})
+                continue
+            # Only fields the corpus provides are compared; absent ones keep their stored value
+            diff = {f: record[f] for f in METADATA_FIELDS if f in record and record[f] != getattr(row, f)}
+            if diff:
+                changed.append({"id": row.id, **diff})
+            else:
+                self.stats["unchanged"] += 1
+
+        # executemany needs a uniform parameter shape, so batch by column set
+        for rows in _by_columns(new_rows):
+            await self.db.execute(self._insert(), rows)
+        for rows in _by_columns(changed):
+            await self.db.execute(update(Prompt), rows)
+        self.stats["inserted"] += len(new_rows)
+        self.stats["updated"] += len(changed)
+        await self.db.commit()
+        if self.index is not None and new_rows:
+            await self.index.add("prompts", [(row["id"], row["content"]) for row in new_rows])
+
+    def _next_chunk(self, records: Iterator[Optional[Dict[str, Any]]], defaults: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """Parse, hash and dedup up to chunk_size records (blocking; run in a worker thread)"""
+        chunk: Dict[str, Dict[str, Any]] = {}
+        for record in records:
+            self.stats["read"] += 1
+            if record is None:
+                self.stats["invalid"] += 1
+                continue
+            record = {**defaults, **record}
+            digest = content_hash(record["content"])
+            if digest in chunk:
+                self.stats["duplicates"] += 1
+            chunk[digest] = record
+            if len(chunk) >= self.chunk_size:
+                break
+        return chunk
+
+    async def run(
+        self,
+        records: Iterable[Optional[Dict[str, Any]]],
+        defaults: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Import records (None marks an unparseable input row). Returns counts and throughput.
+        Reading and parsing happen in a worker thread, so a large upload does not block
+        the event loop between chunk writes.
+        """
+        defaults = {k: v for k, v in (defaults or {}).items() if v}
+        started = time.perf_counter()
+        records = iter(records)
+
+        while True:
+            chunk = await asyncio.to_thread(self._next_chunk, records, defaults)
+            if not chunk:
+                break
+            await self._write_chunk(chunk)
+
+        elapsed = time.perf_counter() - started
+        return {
+            **self.stats,
+            "elapsed_s": round(elapsed, 2),
+            "rows_per_sec": round(self.stats["read"] / elapsed) if elapsed else 0
+        }
+
+async def import_corpus(
+    db: AsyncSession,
+    stream: TextIO,
+    format: str,
+    source: Optional[str] = None,
+    category: Optional[str] = None,
+    provider: Optional[str] = None,
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    index=None
+) -> Dict[str, Any]:
+    """Parse a text stream lazily and import it; memory use is bounded by chunk_size"""
+    if format not in PARSERS:
+        raise ValueError(f"Unknown corpus format {format!r}; expected one of {', '.join(FORMATS)}")
+    importer = CorpusImporter(db, chunk_size, index)
+    defaults = {"source": source, "category": category, "provider": provider}
+    return await importer.run(PARSERS[format](stream), defaults)
@@ -0,0 +1,482 @@
+"""
+Embedding index over prompts and exploits for semantic (paraphrase and
+near-duplicate) retrieval.
+
+Vectors are L2-normalized float32 rows in one flat file per kind, opened with
+np.memmap, so the OS pages them in on demand and a restart reloads instantly.
+Row i belongs to the i-th line of the matching .ids file. New rows are
+appended; removed or re-embedded rows are zeroed in place (a tombstone) and
+dropped by compact(). Queries are a single matrix-vector product plus
+argpartition for the top k.
+
+Several worker processes share the files: every change takes an exclusive
+flock on the kind's .lock file and first re-reads what other workers wrote,
+and a search picks up their changes when the files' size or mtime moved.
+
+Embeddings come from a local sentence-transformers model when EMBEDDING_MODEL
+is set and loadable, else from a feature-hashing embedder (words, word bigrams
+and character trigrams) that needs only NumPy and catches near-duplicates,
+re-spacing and leetspeak variants, though not deeper paraphrase.
+"""
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import select
+from app.models import Exploit, Prompt
+from app.config import EMBEDDING_MODEL, EMBEDDING_DIM, EMBEDDING_INDEX_DIR, EMBEDDING_SYNC_INTERVAL
+from app.services.corpus_importer import normalize_content
+
+try:
+    import fcntl  # POSIX only; elsewhere the index assumes a single worker process
+except ImportError:
+    fcntl = None
+
+_WORD = re.compile(r"\w+")
+
+# Rows embedded and appended per step when syncing with the database
+SYNC_CHUNK = 1000
+
+# Rows per side of each block when comparing the whole index against itself
+PAIRWISE_BLOCK = 1024
+
+class HashingEmbedder:
+    """Signed feature hashing of words, word bigrams and char trigrams; sublinear tf, L2-normalized"""
+
+    def __init__(self, dim: int = EMBEDDING_DIM):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> List[int]:
+        words = _WORD.findall(normalize_content(text))
+        features = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        for word in words:
+            padded = f"<{word}>"
+            features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+        return [zlib.crc32(f.encode("utf-8")) for f in features]
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            hashes = np.fromiter(self._features(text), dtype=np.uint32)
+            if not hashes.size:
+                continue
+            signs = np.where(hashes & 0x80000000, 1.0, -1.0).astype(np.float32)
+            np.add.at(vectors[row], (hashes % self.dim).astype(np.intp), signs)
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return (vectors / np.where(norms == 0, 1.0, norms)).astype(np.float32)
+
+class SentenceTransformerEmbedder:
+    """Local sentence-transformers model on CPU, loaded on first use"""
+
+    def __init__(self, model_name: str):
+        self.name = model_name
+        self._model = None
+        self.dim = None
+
+    def load(self) -> bool:
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.name, device="cpu")
+            self.dim = self._model.get_sentence_embedding_dimension()
+        return True
+
+    def embed(self, texts: Sequence[str]) -> np.ndarray:
+        self.load()
+        vectors = self._model.encode(list(texts), batch_size=64, normalize_embeddings=True, convert_to_numpy=True)
+        return np.asarray(vectors, dtype=np.float32)
+
+def load_embedder(model_name: str = EMBEDDING_MODEL):
+    if model_name:
+        embedder = SentenceTransformerEmbedder(model_name)
+        try:
+            embedder.load()
+            return embedder
+        except Exception as e:
+            print(f"⚠️ Embedding model '{model_name}' unavailable, using feature hashing: {e}")
+    return HashingEmbedder()
+
+class VectorStore:
+    """Append-only memory-mapped matrix of one kind's vectors, with its row ids"""
+
+    def __init__(self, directory: str, kind: str, dim: int):
+        self.kind = kind
+        self.dim = dim
+        self.vectors_path = os.path.join(directory, f"{kind}.f32")
+        self.ids_path = os.path.join(directory, f"{kind}.ids")
+        self.lock_path = os.path.join(directory, f"{kind}.lock")
+        self.ids: List[str] = []  # '' marks a tombstoned row
+        self.rows: Dict[str, int] = {}
+        self.vectors = np.zeros((0, dim), dtype=np.float32)
+        self.tombstones = 0
+        self._stamp: Optional[tuple] = None
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool = True):
+        """flock shared by every process using the directory (exclusive for writers)"""
+        if fcntl is None:
+            yield
+            return
+        with open(self.lock_path, "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _disk_stamp(self) -> Optional[tuple]:
+        try:
+            ids, vectors = os.stat(self.ids_path), os.stat(self.vectors_path)
+        except FileNotFoundError:
+            return None
+        return (ids.st_mtime_ns, ids.st_size, vectors.st_mtime_ns, vectors.st_size)
+
+    def load(self):
+        with self._file_lock(exclusive=False):
+            self._load()
+
+    def _load(self):
+        self.ids, self.rows, self.tombstones = [], {}, 0
+        if not os.path.exists(self.ids_path) or not os.path.exists(self.vectors_path):
+            self._map(0)
+            self._stamp = self._disk_stamp()
+            return
+        with open(self.ids_path, encoding="utf-8") as f:
+            ids = f.read().split("\n")[:-1]
+        # A crash between the two appends leaves the files out of step; keep the common prefix
+        count = min(len(ids), os.path.getsize(self.vectors_path) // (4 * self.dim))
+        if os.path.getsize(self.vectors_path) != count * 4 * self.dim:
+            os.truncate(self.vectors_path, count * 4 * self.dim)
+        if len(ids) != count:
+            self._write_ids(ids[:count])
+        self.ids = ids[:count]
+        self.rows = {row_id: i for i, row_id in enumerate(self.ids) if row_id}
+        self.tombstones = count - len(self.rows)
+        self._map(count)
+        self._stamp = self._disk_stamp()
+
+    def _catch_up(self):
+        """Re-read the files if another process changed them (call under the file lock)"""
+        if self._disk_stamp() != self._stamp:
+            self._load()
+
+    def reload_if_changed(self):
+        """Pick up rows other workers added or removed since this one last looked"""
+        if self._disk_stamp() != self._stamp:
+            self.load()
+
+    def _map(self, count: int):
+        if count:
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(count, self.dim))
+        else:
+            self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+
+    def add(self, ids: List[str], vectors: np.ndarray):
+        with self._file_lock():
+            self._catch_up()
+            self._remove([i for i in ids if i in self.rows])
+            with open(self.vectors_path, "ab") as f:
+                f.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            with open(self.ids_path, "a", encoding="utf-8") as f:
+                f.write("".join(f"{row_id}\n" for row_id in ids))
+            start = len(self.ids)
+            self.ids.extend(ids)
+            self.rows.update({row_id: start + i for i, row_id in enumerate(ids)})
+            self._map(len(self.ids))
+            self._stamp = self._disk_stamp()
+
+    def remove(self, ids: List[str]):
+        with self._file_lock():
+            self._catch_up()
+            self._remove(ids)
+            self._stamp = self._disk_stamp()
+
+    def _remove(self, ids: List[str]):
+        rows = sorted(self.rows.pop(row_id) for row_id in ids if row_id in self.rows)
+        if not rows:
+            return
+        zeros = bytes(4 * self.dim)
+        with open(self.vectors_path, "r+b") as f:
+            for row in rows:
+                f.seek(row * 4 * self.dim)
+                f.write(zeros)
+                self.ids[row] = ""
+        self._write_ids(self.ids)
+        self.tombstones += len(rows)
+        self._map(len(self.ids))
+
+    def _write_ids(self, ids: List[str]):
+        temp = self.ids_path + ".tmp"
+        with open(temp, "w", encoding="utf-8") as f:
+            f.write("".join(f"{row_id}\n" for row_id in ids))
+        os.replace(temp, self.ids_path)
+
+    def compact(self):
+        """Rewrite both files without tombstoned rows"""
+        with self._file_lock():
+            self._catch_up()
+            live = [i for i, row_id in enumerate(self.ids) if row_id]
+            if len(live) == len(self.ids):
+                return
+            vectors = np.array(self.vectors[live]) if live else np.zeros((0, self.dim), dtype=np.float32)
+            ids = [self.ids[i] for i in live]
+            temp = self.vectors_path + ".tmp"
+            with open(temp, "wb") as f:
+                f.write(vectors.tobytes())
+            os.replace(temp, self.vectors_path)
+            self._write_ids(ids)
+            self.ids = ids
+            self.rows = {row_id: i for i, row_id in enumerate(ids)}
+            self.tombstones = 0
+            self._map(len(ids))
+            self._stamp = self._disk_stamp()
+
+    def clear(self):
+        with self._file_lock():
+            for path in (self.vectors_path, self.ids_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.ids, self.rows, self.tombstones = [], {}, 0
+            self._map(0)
+            self._stamp = None
+
+    def search(self, query: np.ndarray, k: int) -> List[Tuple[str, float]]:
+        """Top-k (id, cosine) by one vectorized product over the whole matrix"""
+        vectors = self.vectors
+        if not len(vectors) or k <= 0:
+            return []
+        scores = vectors @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.ids[i], float(scores[i])) for i in top if self.ids[i] and scores[i] > 0]
+
+    def pairs_above(self, threshold: float) -> List[Tuple[int, int, float]]:
+        """(row, row, cosine) for every pair of live rows at or above threshold, blockwise"""
+        vectors = self.vectors
+        pairs = []
+        for a in range(0, len(vectors), PAIRWISE_BLOCK):
+            left = np.asarray(vectors[a:a + PAIRWISE_BLOCK])
+            for b in range(a, len(vectors), PAIRWISE_BLOCK):
+                scores = left @ np.asarray(vectors[b:b + PAIRWISE_BLOCK]).T
+                if a == b:
+                    # Upper triangle only: each pair once, no self-matches
+                    scores[np.tril_indices(len(left))] = 0.0
+                for i, j in zip(*np.nonzero(scores >= threshold)):
+                    pairs.append((a + int(i), b + int(j), float(scores[i, j])))
+        return pairs
+
+class EmbeddingIndex:
+    """Semantic index over prompts and exploits, kept in step with the database"""
+
+    SOURCES = {
+        "prompts": (Prompt, lambda row: row.content),
+        "exploits": (Exploit, lambda row: f"{row.title}\n{row.exploit_content}"),
+    }
+
+    def __init__(self, directory: str = EMBEDDING_INDEX_DIR, embedder=None, sync_interval: float = EMBEDDING_SYNC_INTERVAL):
+        self.directory = directory
+        self.embedder = embedder
+        self.sync_interval = sync_interval
+        self.stores: Dict[str, VectorStore] = {}
+        self._lock = threading.Lock()
+        self._sync_lock = asyncio.Lock()
+        self._sync_task: Optional[asyncio.Task] = None
+        self._loaded = False
+        self.last_sync = 0.0
+
+        self.queries = 0
+        self.query_time_total = 0.0
+        self.embedded = 0
+
+    def _load(self):
+        """Open (or start) the on-disk index; a different embedder means re-embedding everything"""
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            if self.embedder is None:
+                self.embedder = load_embedder()
+            os.makedirs(self.directory, exist_ok=True)
+            meta_path = os.path.join(self.directory, "meta.json")
+            meta = {}
+            if os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    meta = json.load(f)
+            probe_dim = self.embedder.embed(["dimension probe"]).shape[1]
+            current = {"embedder": self.embedder.name, "dim": int(probe_dim)}
+            for kind in self.SOURCES:
+                self.stores[kind] = VectorStore(self.directory, kind, current["dim"])
+                if meta == current:
+                    self.stores[kind].load()
+                else:
+                    self.stores[kind].clear()
+            if meta != current:
+                with open(meta_path, "w") as f:
+                    json.dump(current, f)
+            self._loaded = True
+
+    def _add(self, kind: str, rows: List[Tuple[str, str]]):
+        self._load()
+        if not rows:
+            return
+        vectors = self.embedder.embed([text for _, text in rows])
+        with self._lock:
+            self.stores[kind].add([row_id for row_id, _ in rows], vectors)
+        self.embedded += len(rows)
+
+    async def add(self, kind: str, rows: List[Tuple[str, str]]):
+        """Embed and append (id, text) rows, replacing any earlier vector for the same id"""
+        await asyncio.to_thread(self._add, kind, rows)
+
+    async def sync(self, db, kinds: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Embed rows the index is missing and drop ids no longer in the table"""
+        await asyncio.to_thread(self._load)
+        stats = {}
+        async with self._sync_lock:
+            for kind in kinds or list(self.SOURCES):
+                model, text_of = self.SOURCES[kind]
+                store = self.stores[kind]
+                present = set((await db.execute(select(model.id))).scalars())
+                missing = [row_id for row_id in present if row_id not in store.rows]
+                stale = [row_id for row_id in store.rows if row_id not in present]
+                for start in range(0, len(missing), SYNC_CHUNK):
+                    result = await db.execute(select(model).where(model.id.in_(missing[start:start + SYNC_CHUNK])))
+                    await self.add(kind, [(row.id, text_of(row)) for row in result.scalars()])
+                if stale:
+                    with self._lock:
+                        store.remove(stale)
+                stats[kind] = {"added": len(missing), "removed": len(stale), "rows": len(store.rows)}
+            self.last_sync = time.monotonic()
+        return stats
+
+    def _search(self, kind: str, text: str, k: int) -> List[Tuple[str, float]]:
+        self._load()
+        started = time.perf_counter()
+        query = self.embedder.embed([text])[0]
+        with self._lock:
+            self.stores[kind].reload_if_changed()
+        results = self.stores[kind].search(query, k)
+        self.queries += 1
+        self.query_time_total += time.perf_counter() - started
+        return results
+
+    async def search(self, kind: str, text: str, k: int = 5) -> List[Tuple[str, float]]:
+        """Top-k (id, cosine similarity) of one kind for free text"""
+        return await asyncio.to_thread(self._search, kind, text, k)
+
+    async def preload(self, session_factory=None) -> Dict[str, Any]:
+        """
+        Open the index files and load the embedder now instead of on the first search;
+        with a session factory, also run this process's first sync.
+        """
+        await asyncio.to_thread(self._load)
+        if session_factory is not None:
+            async with session_factory() as db:
+                return {**self.metrics(), "synced": await self.sync(db)}
+        return self.metrics()
+
+    def stale(self) -> bool:
+        return not self.last_sync or time.monotonic() - self.last_sync > self.sync_interval
+
+    async def refresh(self, session_factory):
+        """
+        Catch up with the database in the background when stale (or never synced here).
+        Never syncs inline: until it finishes, searches use the index as it is on disk.
+        """
+        if self.stale() and (self._sync_task is None or self._sync_task.done()):
+            self._sync_task = asyncio.create_task(self._background_sync(session_factory))
+
+    async def _background_sync(self, session_factory):
+        try:
+            async with session_factory() as db:
+                await self.sync(db)
+        except Exception as e:
+            print(f"⚠️ Embedding index sync failed: {e}")
+
+    def clusters(self, kind: str, threshold: float) -> List[List[Tuple[str, float]]]:
+        self._load()
+        store = self.stores[kind]
+        parent = list(range(len(store.ids)))
+        best: Dict[int, float] = {}
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for i, j, score in store.pairs_above(threshold):
+            parent[find(i)] = find(j)
+            best[i] = max(best.get(i, 0.0), score)
+            best[j] = max(best.get(j, 0.0), score)
+
+        groups: Dict[int, List[int]] = {}
+        for row in best:
+            groups.setdefault(find(row), []).append(row)
+        clusters = [[(store.ids[row], round(best[row], 4)) for row in rows] for rows in groups.values()]
+        return sorted(clusters, key=len, reverse=True)
+
+    async def near_duplicates(self, db, kind: str = "prompts", threshold: float = 0.9, limit: int = 50) -> Dict[str, Any]:
+        """
+        Clusters of rows whose pairwise cosine similarity chains above threshold,
+        largest first, with a content preview. Cost is quadratic in the index size,
+        computed in blocks, so this is a report, not a request-path query.
+        """
+        started = time.perf_counter()
+        clusters = await asyncio.to_thread(self.clusters, kind, threshold)
+        shown = clusters[:limit]
+        model, text_of = self.SOURCES[kind]
+        ids = [row_id for cluster in shown for row_id, _ in cluster]
+        previews = {}
+        for start in range(0, len(ids), SYNC_CHUNK):
+            result = await db.execute(select(model).where(model.id.in_(ids[start:start + SYNC_CHUNK])))
+            previews.update({row.id: text_of(row)[:120] for row in result.scalars()})
+        return {
+            "kind": kind,
+            "threshold": threshold,
+            "indexed": len(self.stores[kind].rows),
+            "clusters": len(clusters),
+            "duplicate_rows": sum(len(c) for c in clusters) - len(clusters),
+            "elapsed_s": round(time.perf_counter() - started, 2),
+            "top": [
+                {
+                    "size": len(cluster),
+                    "members": [{"id": row_id, "similarity": score, "preview": previews.get(row_id)} for row_id, score in cluster]
+                }
+                for cluster in shown
+            ]
+        }
+
+    def compact(self):
+        self._load()
+        with self._lock:
+            for store in self.stores.values():
+                store.compact()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "loaded": self._loaded,
+            "embedder": getattr(self.embedder, "name", None),
+            "rows": {kind: len(store.rows) for kind, store in self.stores.items()},
+            "tombstones": {kind: store.tombstones for kind, store in self.stores.items()},
+            "embedded": self.embedded,
+            "queries": self.queries,
+            "avg_query_ms": round(self.query_time_total / self.queries * 1000, 3) if self.queries else 0.0,
+        }
+
+_index: Optional[EmbeddingIndex] = None
+
+def get_embedding_index() -> EmbeddingIndex:
+    global _index
+    if _index is None:
+        _index = EmbeddingIndex()
+    return _index
@@ -0,0 +1,153 @@
+import asyncio
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional
+from urllib.parse import urlsplit
+import httpx
+from app.config import (
+    HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE, HTTP_KEEPALIVE_EXPIRY,
+    HTTP_MAX_PER_HOST, HTTP_ENABLE_HTTP2
+)
+from app.services.metrics import HTTP_REQUESTS, SPAN_SECONDS, span
+
+class HttpPool:
+    """Shared, pooled HTTP client used for all outbound LLM traffic"""
+
+    def __init__(
+        self,
+        max_connections: int = HTTP_MAX_CONNECTIONS,
+        max_keepalive: int = HTTP_MAX_KEEPALIVE,
+        keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY,
+        max_per_host: int = HTTP_MAX_PER_HOST,
+        http2: bool = HTTP_ENABLE_HTTP2,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        self.max_per_host = max_per_host
+        self.client = httpx.AsyncClient(
+            http2=http2,
+            transport=transport,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive,
+                keepalive_expiry=keepalive_expiry
+            ),
+            timeout=httpx.Timeout(60.0, connect=10.0)
+        )
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+
+        # Pool statistics, all counted here rather than read from httpx internals
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.host_in_flight: Dict[str, int] = defaultdict(int)
+        self.waiting = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    def _slot_for(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        if host not in self._host_slots:
+            self._host_slots[host] = asyncio.Semaphore(self.max_per_host)
+        return self._host_slots[host]
+
+    @asynccontextmanager
+    async def _acquire(self, url: str):
+        """Wait for a per-host connection slot, recording how long it took"""
+        host = urlsplit(url).netloc
+        slot = self._slot_for(url)
+        self.waiting += 1
+        started = time.perf_counter()
+        try:
+            await slot.acquire()
+        finally:
+            self.waiting -= 1
+        waited = time.perf_counter() - started
+        self.wait_time_total += waited
+        self.wait_time_max = max(self.wait_time_max, waited)
+        self.requests += 1
+        self.in_flight += 1
+        self.host_in_flight[host] += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.host_in_flight[host] -= 1
+            slot.release()
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        host = urlsplit(url).netloc
+        async with self._acquire(url):
+            with span("http", host):
+                try:
+                    response = await self.client.request(method, url, **kwargs)
+                except httpx.TransportError:
+                    self.errors += 1
+                    HTTP_REQUESTS.inc(host=host, status="error")
+                    raise
+        HTTP_REQUESTS.inc(host=host, status=response.status_code)
+        return response
+
+    @asynccontextmanager
+    async def stream(self, method: str, url: str, **kwargs):
+        """Streamed request; the host slot is held until the response is closed"""
+        host = urlsplit(url).netloc
+        async with self._acquire(url):
+            started = time.perf_counter()
+            response = None
+            try:
+                async with self.client.stream(method, url, **kwargs) as response:
+                    # Time to response headers; the streamed body is timed by the caller
+                    SPAN_SECONDS.observe(time.perf_counter() - started, span="http", name=host)
+                    HTTP_REQUESTS.inc(host=host, status=response.status_code)
+                    yield response
+            except httpx.TransportError:
+                if response is None:
+                    self.errors += 1
+                    HTTP_REQUESTS.inc(host=host, status="error")
+                raise
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Pool metrics for sizing under concurrent sessions"""
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_per_host": self.max_per_host,
+            "wait_time_avg_ms": round(self.wait_time_total / self.requests * 1000, 3) if self.requests else 0.0,
+            "wait_time_max_ms": round(self.wait_time_max * 1000, 3),
+            "hosts": {host: count for host, count in self.host_in_flight.items() if count}
+        }
+
+    async def aclose(self):
+        await self.client.aclose()
+
+_pool: Optional[HttpPool] = None
+
+def use_http_pool(pool: HttpPool) -> HttpPool:
+    """
+    Install the process's shared pool. The app lifespan (and the CLI) create it and
+    own its lifetime; services constructed afterwards pick it up by default.
+    """
+    global _pool
+    _pool = pool
+    return pool
+
+def get_http_pool() -> HttpPool:
+    """The pool installed by use_http_pool()"""
+    if _pool is None:
+        raise RuntimeError("No HTTP pool installed: create one with use_http_pool(HttpPool()) at startup")
+    return _pool
+
+async def close_http_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.aclose()
+        _pool = None
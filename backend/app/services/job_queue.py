@@ -0,0 +1,345 @@
+import asyncio
+import json
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, Any, List, Optional, Tuple
+from sqlalchemy import select, update
+from app.database import AsyncSessionLocal
+from app.models import AgentJob, AgentJobEvent, generate_uuid
+from app.config import MAX_ITERATIONS, JOB_CONCURRENCY, JOB_MAX_QUEUED, JOB_RETENTION_SECONDS
+from app.services.http_pool import HttpPool, get_http_pool
+from app.services.write_buffer import WriteBuffer, get_write_buffer
+from app.services.session_store import SessionStore, get_session_store
+from app.services.budget import BudgetTracker, BudgetExceeded, get_budget_tracker
+from app.services.lupin_agent import LupinAgent
+
+TERMINAL_STATUSES = {"completed", "failed", "cancelled"}
+
+# Token-level events are replayable from memory only; everything else is persisted
+DELTA_EVENTS = {"thought_delta", "target_delta"}
+
+class QueueFull(Exception):
+    """Raised by submit() when JOB_MAX_QUEUED jobs are already waiting"""
+
+def sse_event(seq: int, event: Dict[str, Any]) -> str:
+    """One SSE frame; the id lets clients resume with Last-Event-ID"""
+    return f"id: {seq}\ndata: {json.dumps(event)}\n\n"
+
+def _job_dict(job: AgentJob) -> Dict[str, Any]:
+    return {
+        "job_id": job.id,
+        "session_id": job.session_id,
+        "status": job.status,
+        "error": job.error,
+        "last_seq": job.last_seq,
+        "created_at": job.created_at.isoformat() if job.created_at else None,
+        "started_at": job.started_at.isoformat() if job.started_at else None,
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None
+    }
+
+class JobStream:
+    """In-memory event log of one job; attached clients wait on it for new events"""
+
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.events: List[Dict[str, Any]] = []  # events[i] has seq i + 1
+        self.status = "queued"
+        self._wakeup = asyncio.Event()
+
+    @property
+    def seq(self) -> int:
+        return len(self.events)
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL_STATUSES
+
+    def _notify(self):
+        self._wakeup.set()
+        self._wakeup = asyncio.Event()
+
+    def append(self, event: Dict[str, Any]) -> int:
+        self.events.append(event)
+        self._notify()
+        return self.seq
+
+    def finish(self, status: str):
+        self.status = status
+        self._notify()
+
+    async def events_after(self, after: int) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        index = max(after, 0)
+        while True:
+            wakeup = self._wakeup
+            while index < len(self.events):
+                index += 1
+                yield index, self.events[index - 1]
+            if self.done:
+                return
+            await wakeup.wait()
+
+class JobQueue:
+    """
+    Runs agent jobs on a fixed pool of worker tasks, independent of any HTTP
+    request. Jobs and their (non-delta) events are persisted, so clients can
+    detach and re-attach by job id, resuming after the last event they saw.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = JOB_CONCURRENCY,
+        max_queued: int = JOB_MAX_QUEUED,
+        retention: float = JOB_RETENTION_SECONDS,
+        session_factory=AsyncSessionLocal,
+        store: Optional[SessionStore] = None,
+        writer: Optional[WriteBuffer] = None,
+        http: Optional[HttpPool] = None,
+        budget: Optional[BudgetTracker] = None
+    ):
+        self.concurrency = concurrency
+        self.max_queued = max_queued
+        self.retention = retention
+        self.session_factory = session_factory
+        self.store = store or get_session_store()
+        self.writer = writer or get_write_buffer()
+        self.http = http or get_http_pool()
+        self.budget = budget or get_budget_tracker()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._streams: Dict[str, JobStream] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._workers: List[asyncio.Task] = []
+
+        self.submitted = 0
+        self.finished: Dict[str, int] = {status: 0 for status in TERMINAL_STATUSES}
+
+    def _ensure_started(self):
+        self._workers = [w for w in self._workers if not w.done()]
+        while len(self._workers) < self.concurrency:
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    async def _update(self, job_id: str, **values):
+        async with self.session_factory() as db:
+            await db.execute(update(AgentJob).where(AgentJob.id == job_id).values(**values))
+            await db.commit()
+
+    def _publish(self, stream: JobStream, event: Dict[str, Any]) -> int:
+        seq = stream.append(event)
+        if event.get("type") not in DELTA_EVENTS:
+            self.writer.add(AgentJobEvent, job_id=stream.job_id, seq=seq, event=event)
+        return seq
+
+    async def submit(
+        self,
+        message: str,
+        session_id: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        max_iterations: int = MAX_ITERATIONS,
+        cache_bypass: bool = False,
+        user_id: str = ""
+    ) -> Dict[str, Any]:
+        """
+        Persist and enqueue an agent run. Returns the job (status 'queued'). Raises
+        BudgetExceeded when the session's, user's or global budget is already spent.
+        """
+        if self._queue.qsize() >= self.max_queued:
+            raise QueueFull(f"{self._queue.qsize()} jobs already queued")
+
+        session = await self.store.get_or_create(session_id, history)
+        await self.budget.prepare(session.session_id, user_id)
+        verdict = self.budget.exceeded(session.session_id, user_id)
+        if verdict:
+            raise BudgetExceeded(verdict)
+        # Persist now so the job can find its session even if evicted from the cache
+        await self.store.save(session)
+
+        job = AgentJob(
+            id=generate_uuid(),
+            session_id=session.session_id,
+            message=message,
+            max_iterations=max_iterations,
+            status="queued",
+            extra_data={"cache_bypass": cache_bypass, "user_id": user_id}
+        )
+        async with self.session_factory() as db:
+            db.add(job)
+            await db.commit()
+
+        stream = self._streams[job.id] = JobStream(job.id)
+        self._publish(stream, {"type": "session", "session_id": session.session_id, "job_id": job.id})
+        self._queue.put_nowait(job.id)
+        self.submitted += 1
+        self._ensure_started()
+        return {"job_id": job.id, "session_id": session.session_id, "status": "queued"}
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                stream = self._streams.get(job_id)
+                if stream is None or stream.done:
+                    continue  # cancelled while queued
+                task = asyncio.create_task(self._run_job(job_id, stream))
+                self._running[job_id] = task
+                try:
+                    await asyncio.shield(task)
+                except asyncio.CancelledError:
+                    if not task.done():
+                        # The worker itself is being cancelled (shutdown)
+                        task.cancel()
+                        raise
+                finally:
+                    self._running.pop(job_id, None)
+            finally:
+                self._queue.task_done()
+
+    async def _run_job(self, job_id: str, stream: JobStream):
+        status, error = "completed", None
+        try:
+            async with self.session_factory() as db:
+                job = await db.get(AgentJob, job_id)
+            session = await self.store.get_or_create(job.session_id)
+
+            # One run at a time per session; a second job for it waits here
+            async with session.lock:
+                stream.status = "running"
+                await self._update(job_id, status="running", started_at=datetime.now(timezone.utc))
+                agent = LupinAgent(
+                    self.session_factory,
+                    http=self.http,
+                    session=session,
+                    cache_bypass=bool((job.extra_data or {}).get("cache_bypass")),
+                    user_id=(job.extra_data or {}).get("user_id") or "",
+                    budget=self.budget
+                )
+                try:
+                    async for event in agent.run(job.message, max_iterations=job.max_iterations or MAX_ITERATIONS):
+                        self._publish(stream, event)
+                        if event.get("type") == "error":
+                            status, error = "failed", event.get("content")
+                finally:
+                    await self.store.save(session)
+        except asyncio.CancelledError:
+            status, error = "cancelled", None
+            self._publish(stream, {"type": "cancelled", "job_id": job_id})
+        except Exception as e:
+            status, error = "failed", str(e)
+            self._publish(stream, {"type": "error", "content": str(e)})
+
+        await self._finish(job_id, stream, status, error)
+
+    async def _finish(self, job_id: str, stream: JobStream, status: str, error: Optional[str] = None):
+        # Flush first, so a client re-attaching from the DB sees every event
+        await self.writer.flush()
+        await self._update(
+            job_id, status=status, error=error, last_seq=stream.seq,
+            finished_at=datetime.now(timezone.utc)
+        )
+        stream.finish(status)
+        self.finished[status] += 1
+        asyncio.get_running_loop().call_later(self.retention, self._streams.pop, job_id, None)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        async with self.session_factory() as db:
+            job = await db.get(AgentJob, job_id)
+        return _job_dict(job) if job else None
+
+    async def subscribe(self, job_id: str, after: int = 0) -> AsyncIterator[Tuple[int, Dict[str, Any]]]:
+        """(seq, event) pairs after `after`: live from memory, else replayed from the DB"""
+        stream = self._streams.get(job_id)
+        if stream is not None:
+            async for item in stream.events_after(after):
+                yield item
+            return
+
+        # Finished and past retention (or from an earlier process): persisted events only
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(AgentJobEvent.seq, AgentJobEvent.event)
+                .where(AgentJobEvent.job_id == job_id, AgentJobEvent.seq > after)
+                .order_by(AgentJobEvent.seq)
+            )
+            rows = result.all()
+        for seq, event in rows:
+            yield seq, event
+
+    async def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job. Returns False if it is not active here."""
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+            return True
+        stream = self._streams.get(job_id)
+        if stream is not None and stream.status == "queued":
+            self._publish(stream, {"type": "cancelled", "job_id": job_id})
+            await self._finish(job_id, stream, "cancelled")
+            return True
+        return False
+
+    async def recover(self):
+        """On startup: requeue jobs that never started, fail ones a previous process was running"""
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(AgentJob.id, AgentJob.status)
+                .where(AgentJob.status.in_(["queued", "running"]))
+                .order_by(AgentJob.created_at)
+            )
+            jobs = result.all()
+            events: Dict[str, List[Tuple[int, Dict[str, Any]]]] = {job_id: [] for job_id, _ in jobs}
+            if jobs:
+                result = await db.execute(
+                    select(AgentJobEvent.job_id, AgentJobEvent.seq, AgentJobEvent.event)
+                    .where(AgentJobEvent.job_id.in_(list(events)))
+                    .order_by(AgentJobEvent.job_id, AgentJobEvent.seq)
+                )
+                for job_id, seq, event in result.all():
+                    events[job_id].append((seq, event))
+
+        for job_id, status in jobs:
+            if status == "running":
+                last_seq = events[job_id][-1][0] if events[job_id] else 0
+                await self._update(
+                    job_id, status="failed", error="Interrupted by a server restart",
+                    finished_at=datetime.now(timezone.utc), last_seq=last_seq
+                )
+                continue
+            # A job that never started only has its opening events, so seqs are contiguous
+            stream = self._streams[job_id] = JobStream(job_id)
+            stream.events = [event for _, event in events[job_id]]
+            self._queue.put_nowait(job_id)
+        if jobs:
+            print(f"♻️ Recovered {len(jobs)} unfinished agent jobs")
+            self._ensure_started()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "workers": len([w for w in self._workers if not w.done()]),
+            "queued": self._queue.qsize(),
+            "running": len(self._running),
+            "streams": len(self._streams),
+            "submitted": self.submitted,
+            **self.finished
+        }
+
+    async def close(self):
+        """Cancel running jobs (recording them as cancelled) and stop the workers"""
+        for task in list(self._running.values()):
+            task.cancel()
+        if self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+_queue: Optional[JobQueue] = None
+
+def get_job_queue() -> JobQueue:
+    global _queue
+    if _queue is None:
+        _queue = JobQueue()
+    return _queue
+
+async def close_job_queue():
+    global _queue
+    if _queue is not None:
+        await _queue.close()
+        _queue = None
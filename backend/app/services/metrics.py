@@ -0,0 +1,162 @@
+"""
+In-process metrics with Prometheus text exposition (served at /metrics).
+
+Counters and histograms are plain dicts keyed by label values, updated from the
+event loop without locks, so instrumenting a hot path costs a few microseconds.
+"""
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Tuple[str, ...], values: Tuple[Any, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.values: Dict[Tuple[Any, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_number(value)}")
+        return lines
+
+class Histogram:
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Tuple[str, ...] = (),
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # label values -> [per-bucket counts..., sum, count]
+        self.values: Dict[Tuple[Any, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        series = self.values.get(key)
+        if series is None:
+            series = self.values[key] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+                break
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, series in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {_number(series[-1])}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {_number(series[-1])}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[Any] = []
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        """Prometheus text format; `gauges` adds point-in-time values (name -> value)"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, value in (gauges or {}).items():
+            if value is not None:
+                lines.extend([f"# TYPE {name} gauge", f"{name} {_number(value)}"])
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+SPAN_SECONDS = REGISTRY.histogram(
+    "lupin_span_seconds", "Duration of instrumented operations", ("span", "name")
+)
+FIRST_TOKEN_SECONDS = REGISTRY.histogram(
+    "lupin_first_token_seconds", "Time from request to first streamed token", ("model",)
+)
+AGENT_ITERATIONS = REGISTRY.counter("lupin_agent_iterations_total", "Agent loop iterations")
+TOOL_CALLS = REGISTRY.counter("lupin_tool_calls_total", "Agent tool calls", ("tool", "status"))
+TOKENS = REGISTRY.counter("lupin_tokens_total", "Tokens reported in completion usage", ("model", "kind"))
+HTTP_REQUESTS = REGISTRY.counter("lupin_http_requests_total", "Outbound HTTP requests", ("host", "status"))
+HTTP_RETRIES = REGISTRY.counter("lupin_http_retries_total", "Outbound request retries", ("reason",))
+SPEND_USD = REGISTRY.counter("lupin_spend_usd_total", "Priced completion spend", ("model", "kind"))
+BUDGET_EXCEEDED = REGISTRY.counter("lupin_budget_exceeded_total", "Runs and calls stopped by a budget", ("scope",))
+NOTIFICATIONS = REGISTRY.counter(
+    "lupin_notifications_total", "Provider notification findings by delivery outcome", ("method", "status")
+)
+
+class Span:
+    """Times a block into lupin_span_seconds; `.ms` is readable after (or during) the block"""
+
+    __slots__ = ("span", "name", "started", "ended")
+
+    def __init__(self, span: str, name: str = ""):
+        self.span = span
+        self.name = name
+        self.started = 0.0
+        self.ended: Optional[float] = None
+
+    def __enter__(self) -> "Span":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.ended = time.perf_counter()
+        SPAN_SECONDS.observe(self.ended - self.started, span=self.span, name=self.name)
+
+    @property
+    def ms(self) -> float:
+        end = self.ended if self.ended is not None else time.perf_counter()
+        return round((end - self.started) * 1000, 1)
+
+def span(kind: str, name: str = "") -> Span:
+    return Span(kind, name)
+
+def record_usage(model: str, usage: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    """Count a completion's usage tokens; returns {prompt_tokens, completion_tokens}"""
+    counts = {
+        "prompt_tokens": int((usage or {}).get("prompt_tokens") or 0),
+        "completion_tokens": int((usage or {}).get("completion_tokens") or 0)
+    }
+    if counts["prompt_tokens"]:
+        TOKENS.inc(counts["prompt_tokens"], model=model, kind="prompt")
+    if counts["completion_tokens"]:
+        TOKENS.inc(counts["completion_tokens"], model=model, kind="completion")
+    return counts
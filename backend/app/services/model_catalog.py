@@ -0,0 +1,194 @@
+import asyncio
+import json
+import os
+import time
+from collections import defaultdict
+from typing import Dict, Any, List, Optional
+from app.config import OPENROUTER_API_KEY, OPENROUTER_BASE_URL, MODEL_CATALOG_TTL, MODEL_CATALOG_SNAPSHOT
+from app.services.http_pool import HttpPool, get_http_pool
+from app.services.throttle import provider_of
+
+# Distinct provider filters whose matches are remembered until the next refresh
+FILTER_CACHE_SIZE = 256
+
+class ModelCatalog:
+    """
+    Process-wide OpenRouter model catalog. Serves from memory, revalidates in the
+    background once older than the TTL (using the ETag, so unchanged catalogs cost a
+    304), and snapshots to disk so cold starts and offline runs have a catalog.
+    """
+
+    def __init__(
+        self,
+        http: Optional[HttpPool] = None,
+        api_key: str = OPENROUTER_API_KEY,
+        ttl: float = MODEL_CATALOG_TTL,
+        snapshot_path: str = MODEL_CATALOG_SNAPSHOT
+    ):
+        self.http = http
+        self.api_key = api_key
+        self.ttl = ttl
+        self.snapshot_path = snapshot_path
+        self.models: List[Dict[str, Any]] = []
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        self.by_provider: Dict[str, List[Dict[str, Any]]] = {}
+        self._matches: Dict[str, List[Dict[str, Any]]] = {}
+        self.etag: Optional[str] = None
+        self.fetched_at = 0.0
+        self._snapshot_loaded = False
+        self._refresh_lock = asyncio.Lock()
+        self._refresh_task: Optional[asyncio.Task] = None
+
+        self.hits = 0
+        self.refreshes = 0
+        self.not_modified = 0
+
+    def _index(self, models: List[Dict[str, Any]]):
+        by_provider = defaultdict(list)
+        for model in models:
+            by_provider[provider_of(model.get("id", ""))].append(model)
+        self.models = models
+        self.by_id = {m.get("id"): m for m in models}
+        self.by_provider = dict(by_provider)
+        # A provider's index entry is only a valid answer when no other id contains its name
+        self._matches = {
+            key: group for key, group in self.by_provider.items()
+            if sum(key in m.get("id", "").lower() for m in models) == len(group)
+        }
+
+    def load_snapshot(self) -> bool:
+        self._snapshot_loaded = True
+        try:
+            with open(self.snapshot_path) as f:
+                snapshot = json.load(f)
+        except (OSError, ValueError):
+            return False
+        self._index(snapshot.get("models", []))
+        self.etag = snapshot.get("etag")
+        self.fetched_at = snapshot.get("fetched_at", 0.0)
+        return True
+
+    def _save_snapshot(self):
+        tmp_path = f"{self.snapshot_path}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"fetched_at": self.fetched_at, "etag": self.etag, "models": self.models}, f)
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            print(f"⚠️ Could not write model catalog snapshot: {e}")
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the on-disk snapshot has been read (successfully or not)"""
+        return self._snapshot_loaded
+
+    @property
+    def is_stale(self) -> bool:
+        return time.time() - self.fetched_at > self.ttl
+
+    async def refresh(self, only_if_empty: bool = False):
+        """Fetch /models, sending If-None-Match so an unchanged catalog is a cheap 304"""
+        async with self._refresh_lock:
+            if only_if_empty and self.models:
+                # Another caller finished the cold-start fetch while we waited
+                return
+            http = self.http or get_http_pool()
+            headers = {"Authorization": f"Bearer {self.api_key}", "HTTP-Referer": "https://lupin.ai"}
+            if self.etag and self.models:
+                headers["If-None-Match"] = self.etag
+
+            response = await http.get(f"{OPENROUTER_BASE_URL}/models", headers=headers, timeout=10.0)
+            self.refreshes += 1
+            if response.status_code == 304:
+                self.not_modified += 1
+            else:
+                response.raise_for_status()
+                self._index(response.json().get("data", []))
+                self.etag = response.headers.get("ETag")
+            self.fetched_at = time.time()
+            self._save_snapshot()
+
+    async def _background_refresh(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            print(f"⚠️ Model catalog refresh failed, serving stale copy: {e}")
+
+    async def preload(self) -> Dict[str, Any]:
+        """
+        Startup warm-up: parse the snapshot off the event loop; fetch only when there is
+        none (a stale snapshot is served and revalidated in the background). A failed
+        fetch is reported, not raised - get_models() retries on first use.
+        """
+        if not self._snapshot_loaded:
+            await asyncio.to_thread(self.load_snapshot)
+        source, error = "snapshot", None
+        if not self.models:
+            try:
+                await self.refresh(only_if_empty=True)
+                source = "fetched"
+            except Exception as e:
+                source, error = "none", str(e) or type(e).__name__
+        elif self.is_stale and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self._background_refresh())
+        return {"models": len(self.models), "source": source, "error": error}
+
+    async def get_models(self) -> List[Dict[str, Any]]:
+        if not self._snapshot_loaded:
+            self.load_snapshot()
+        if not self.models:
+            await self.refresh(only_if_empty=True)
+        elif self.is_stale:
+            # Stale-while-revalidate: answer from memory, refresh behind the caller
+            if self._refresh_task is None or self._refresh_task.done():
+                self._refresh_task = asyncio.create_task(self._background_refresh())
+        else:
+            self.hits += 1
+        return self.models
+
+    def _filter(self, provider: Optional[str]) -> List[Dict[str, Any]]:
+        if not provider:
+            return self.models
+        key = provider.lower()
+        matches = self._matches.get(key)
+        if matches is None:
+            # Any id containing the text ("gpt" also finds "openai/chatgpt-4o-latest")
+            matches = [m for m in self.models if key in m.get("id", "").lower()]
+            if len(self._matches) >= len(self.by_provider) + FILTER_CACHE_SIZE:
+                self._matches = {k: v for k, v in self._matches.items() if k in self.by_provider}
+            self._matches[key] = matches
+        return matches
+
+    async def page(self, provider: Optional[str] = None, offset: int = 0, limit: int = 20) -> Dict[str, Any]:
+        await self.get_models()
+        matches = self._filter(provider)
+        offset = max(offset, 0)
+        limit = max(min(limit, 100), 1)
+        window = matches[offset:offset + limit]
+        return {
+            "models": [
+                {"id": m.get("id"), "name": m.get("name", m.get("id")), "pricing": m.get("pricing", {})}
+                for m in window
+            ],
+            "total": len(matches),
+            "offset": offset,
+            "next_offset": offset + limit if offset + limit < len(matches) else None
+        }
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "models": len(self.models),
+            "age_s": round(time.time() - self.fetched_at, 1) if self.fetched_at else None,
+            "stale": self.is_stale,
+            "hits": self.hits,
+            "refreshes": self.refreshes,
+            "not_modified": self.not_modified
+        }
+
+_catalog: Optional[ModelCatalog] = None
+
+def get_model_catalog() -> ModelCatalog:
+    global _catalog
+    if _catalog is None:
+        _catalog = ModelCatalog()
+    return _catalog
@@ -0,0 +1,506 @@
+"""
+Disclosure notifications to model providers.
+
+Successful attempts and test runs are matched to AIProvider rows by their
+model_patterns (shell-style globs over model ids, default '<provider_name>/*')
+as they are flushed, and queued as pending JailbreakNotification rows. The same
+finding (provider, model, normalized prompt) is only ever queued once.
+
+A background dispatcher claims due rows, groups each provider's findings into
+digests and delivers them by webhook or email concurrently. A claim is one
+conditional UPDATE (SKIP LOCKED on Postgres), so with several workers each row
+is claimed by exactly one of them; a claim not settled within NOTIFY_SEND_LEASE
+(the worker died) is requeued. A digest's
+idempotency key is derived from its rows and kept across retries, so a receiver
+can drop redeliveries; a retried digest split into parts gives each part a key
+of its own. Outcomes are written back in one bulk update per cycle;
+failures back off exponentially until NOTIFY_MAX_ATTEMPTS.
+"""
+import asyncio
+import fnmatch
+import hashlib
+import re
+import smtplib
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from typing import Dict, Any, List, Optional, Tuple
+import httpx
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from app.database import AsyncSessionLocal
+from app.models import AIProvider, Attempt, JailbreakNotification, TestRun, generate_uuid
+from app.config import (
+    NOTIFY_INTERVAL, NOTIFY_BATCH_LIMIT, NOTIFY_DIGEST_SIZE, NOTIFY_CONCURRENCY, NOTIFY_RETRIES,
+    NOTIFY_MAX_ATTEMPTS, NOTIFY_RETRY_BASE, NOTIFY_PROVIDER_TTL, NOTIFY_SEND_LEASE,
+    SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASSWORD, SMTP_FROM, SMTP_STARTTLS
+)
+from app.services.corpus_importer import content_hash
+from app.services.http_pool import HttpPool, get_http_pool
+from app.services.metrics import NOTIFICATIONS
+from app.services.throttle import with_retries
+from app.services.write_buffer import WriteBuffer, get_write_buffer
+
+METHODS = ("email", "webhook")
+
+def finding_key(model: str, prompt: str) -> str:
+    """Identity of a finding: the same prompt (after normalization) against the same model"""
+    return hashlib.sha256(f"{model}\0{content_hash(prompt)}".encode("utf-8")).hexdigest()
+
+def part_digest_key(key: str, part: int) -> str:
+    """Key of one part of a retried digest that had to be split"""
+    return hashlib.sha256(f"{key}\0{part}".encode("utf-8")).hexdigest()
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+class ProviderMatcher:
+    """
+    Maps model ids to providers with a single compiled alternation of every
+    provider's patterns; results are memoized per model id, so a flush costs
+    one dict lookup per row. The first provider (by name) whose pattern matches wins.
+    """
+
+    def __init__(self, providers: List[Dict[str, Any]]):
+        self.providers = {p["id"]: p for p in providers}
+        groups = []
+        for index, provider in enumerate(providers):
+            patterns = provider.get("model_patterns") or [f"{provider['provider_name']}/*"]
+            alternatives = "|".join(fnmatch.translate(str(p).lower()) for p in patterns)
+            groups.append(f"(?P<p{index}>{alternatives})")
+        self._ids = [p["id"] for p in providers]
+        self._regex = re.compile("|".join(groups)) if groups else None
+        self._memo: Dict[str, Optional[Dict[str, Any]]] = {}
+
+    def match(self, model: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not model or self._regex is None:
+            return None
+        if model not in self._memo:
+            found = self._regex.match(model.lower())
+            self._memo[model] = self.providers[self._ids[int(found.lastgroup[1:])]] if found else None
+        return self._memo[model]
+
+class Digest:
+    """Up to NOTIFY_DIGEST_SIZE findings for one provider, delivered as one message"""
+
+    def __init__(self, provider: Dict[str, Any], rows: List[JailbreakNotification], key: Optional[str] = None):
+        self.provider = provider
+        self.rows = rows
+        self.key = key or hashlib.sha256("\n".join(sorted(r.id for r in rows)).encode()).hexdigest()
+
+    @property
+    def method(self) -> str:
+        return self.provider.get("notification_method") or "email"
+
+    def payload(self) -> Dict[str, Any]:
+        return {
+            "idempotency_key": self.key,
+            "provider": self.provider["provider_name"],
+            "count": len(self.rows),
+            "findings": [
+                {
+                    "id": row.id,
+                    "model": row.model_name,
+                    "prompt": row.jailbreak_prompt,
+                    "exploit_id": row.exploit_id,
+                    "attempt_id": row.attempt_id,
+                    "test_run_id": row.test_run_id,
+                    "found_at": row.sent_at.isoformat() if row.sent_at else None,
+                }
+                for row in self.rows
+            ],
+        }
+
+    def email(self) -> EmailMessage:
+        message = EmailMessage()
+        message["Subject"] = f"[Lupin] {len(self.rows)} jailbreak finding(s) for {self.provider['company_name']}"
+        message["From"] = SMTP_FROM
+        message["To"] = self.provider["security_email"]
+        message["Message-ID"] = f"<{self.key}@lupin>"
+        message["X-Idempotency-Key"] = self.key
+        greeting = f"Hello {self.provider.get('contact_name') or self.provider['company_name']} security team,"
+        lines = [greeting, "", f"Lupin found {len(self.rows)} prompt(s) that bypassed safety guardrails:", ""]
+        for n, finding in enumerate(self.payload()["findings"], 1):
+            lines += [f"{n}. {finding['model']} (found {finding['found_at']})", finding["prompt"], ""]
+        message.set_content("\n".join(lines))
+        return message
+
+class Notifier:
+    """Queues findings from flushed attempts/test runs and dispatches them in digests"""
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        writer: Optional[WriteBuffer] = None,
+        http: Optional[HttpPool] = None,
+        interval: float = NOTIFY_INTERVAL,
+        batch_limit: int = NOTIFY_BATCH_LIMIT,
+        digest_size: int = NOTIFY_DIGEST_SIZE,
+        concurrency: int = NOTIFY_CONCURRENCY,
+        retries: int = NOTIFY_RETRIES,
+        max_attempts: int = NOTIFY_MAX_ATTEMPTS,
+        retry_base: float = NOTIFY_RETRY_BASE,
+        smtp_host: str = SMTP_HOST,
+        send_lease: float = NOTIFY_SEND_LEASE
+    ):
+        self.session_factory = session_factory
+        self.writer = writer or get_write_buffer()
+        self.http = http or get_http_pool()
+        self.interval = interval
+        self.batch_limit = batch_limit
+        self.digest_size = digest_size
+        self.retries = retries
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.smtp_host = smtp_host
+        self.send_lease = send_lease
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._matcher: Optional[ProviderMatcher] = None
+        self._matcher_loaded = 0.0
+        self._dispatch_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+        self.findings = 0
+        self.cycles = 0
+        self.counts: Dict[str, int] = defaultdict(int)
+
+    def invalidate(self):
+        """Reload providers on the next flush (after providers are edited)"""
+        self._matcher = None
+
+    async def _matcher_for(self, db) -> ProviderMatcher:
+        if self._matcher is None or time.monotonic() - self._matcher_loaded > NOTIFY_PROVIDER_TTL:
+            result = await db.execute(
+                select(AIProvider).where(AIProvider.notification_enabled.is_not(False)).order_by(AIProvider.provider_name)
+            )
+            self._matcher = ProviderMatcher([
+                {c.name: getattr(p, c.name) for c in AIProvider.__table__.columns}
+                for p in result.scalars()
+            ])
+            self._matcher_loaded = time.monotonic()
+        return self._matcher
+
+    async def _queue(self, db, findings: List[Dict[str, Any]]):
+        rows: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        matcher = await self._matcher_for(db)
+        now = _utcnow()
+        for finding in findings:
+            provider = matcher.match(finding["model_name"])
+            if provider is None:
+                continue
+            key = finding_key(finding["model_name"], finding["jailbreak_prompt"])
+            rows.setdefault((provider["id"], key), {
+                "id": generate_uuid(),
+                "attempt_id": finding.get("attempt_id"),
+                "test_run_id": finding.get("test_run_id"),
+                "exploit_id": finding.get("exploit_id"),
+                "model_name": finding["model_name"],
+                "jailbreak_prompt": finding["jailbreak_prompt"],
+                "provider_id": provider["id"],
+                "finding_key": key,
+                "notification_method": provider.get("notification_method") or "email",
+                "notification_status": "pending",
+                "delivery_attempts": 0,
+                "next_attempt_at": now,
+                "sent_at": finding.get("found_at") or now,
+            })
+        if not rows:
+            return
+        dialect = db.bind.dialect.name
+        module = postgresql if dialect == "postgresql" else sqlite
+        # A finding already queued (or disclosed) for this provider is not queued again
+        stmt = module.insert(JailbreakNotification).on_conflict_do_nothing(
+            index_elements=["provider_id", "finding_key"]
+        )
+        await db.execute(stmt, list(rows.values()))
+        self.findings += len(rows)
+
+    async def attempts_written(self, db, rows: List[Dict[str, Any]]):
+        """Write-buffer flush hook for Attempt rows"""
+        await self._queue(db, [
+            {
+                "attempt_id": row["id"], "model_name": row.get("model_name"),
+                "jailbreak_prompt": row.get("prompt") or "", "found_at": row.get("timestamp")
+            }
+            for row in rows if row.get("success") and row.get("model_name")
+        ])
+
+    async def test_runs_written(self, db, rows: List[Dict[str, Any]]):
+        """Write-buffer flush hook for TestRun rows"""
+        await self._queue(db, [
+            {
+                "test_run_id": row["id"], "exploit_id": row.get("exploit_id"), "model_name": row.get("target_model"),
+                "jailbreak_prompt": row.get("test_prompt") or "", "found_at": row.get("timestamp")
+            }
+            for row in rows if row.get("success")
+        ])
+
+    def _digests(
+        self,
+        rows: List[JailbreakNotification],
+        providers: Dict[str, Dict[str, Any]]
+    ) -> Tuple[List[Digest], List[Dict[str, Any]]]:
+        """Group claimed rows into digests; returns (digests, updates for rows that cannot be sent)"""
+        digests, updates = [], []
+        now = _utcnow()
+        by_provider: Dict[Tuple[str, Optional[str]], List[JailbreakNotification]] = defaultdict(list)
+        for row in rows:
+            provider = providers.get(row.provider_id)
+            if provider is None or provider.get("notification_enabled") is False:
+                updates.append({"id": row.id, "notification_status": "skipped",
+                                "notification_response": "Provider removed or notifications disabled"})
+                continue
+            method = provider.get("notification_method") or "email"
+            if method not in METHODS:
+                updates.append({"id": row.id, "notification_status": "skipped",
+                                "notification_response": f"Unknown notification method {method!r}"})
+                continue
+            if (method == "email" and not provider.get("security_email")) or (method == "webhook" and not provider.get("webhook_url")):
+                updates.append({"id": row.id, "notification_status": "skipped",
+                                "notification_response": f"Provider has no {method} address"})
+                continue
+            if method == "email" and not self.smtp_host:
+                # Not a delivery failure: keep it queued until SMTP is configured
+                updates.append({"id": row.id, "notification_status": "pending",
+                                "next_attempt_at": now + timedelta(seconds=self.retry_base)})
+                self.counts["deferred"] += 1
+                continue
+            # Rows of a digest that failed before keep its key, so the retry is recognisable
+            by_provider[(row.provider_id, row.idempotency_key)].append(row)
+
+        for (provider_id, key), group in by_provider.items():
+            if key is not None:
+                # Split deterministically (e.g. after digest_size was lowered); each part needs
+                # its own key, or a receiver dropping duplicates would discard all but the first
+                group.sort(key=lambda row: row.id)
+            parts = [group[start:start + self.digest_size] for start in range(0, len(group), self.digest_size)]
+            for n, part in enumerate(parts):
+                part_key = key if key is None or len(parts) == 1 else part_digest_key(key, n)
+                digests.append(Digest(providers[provider_id], part, part_key))
+        return digests, updates
+
+    async def _post_webhook(self, digest: Digest) -> str:
+        response = await with_retries(
+            lambda: self.http.post(
+                digest.provider["webhook_url"],
+                json=digest.payload(),
+                headers={"Idempotency-Key": digest.key},
+                timeout=30.0
+            ),
+            retries=self.retries
+        )
+        return f"HTTP {response.status_code}: {response.text[:200]}"
+
+    def _smtp_send(self, message: EmailMessage) -> str:
+        with smtplib.SMTP(self.smtp_host, SMTP_PORT, timeout=30) as smtp:
+            if SMTP_STARTTLS:
+                smtp.starttls()
+            if SMTP_USER:
+                smtp.login(SMTP_USER, SMTP_PASSWORD)
+            refused = smtp.send_message(message)
+        return f"Accepted by {self.smtp_host}" + (f"; refused {sorted(refused)}" if refused else "")
+
+    async def _send_email(self, digest: Digest) -> str:
+        message = digest.email()
+        for attempt in range(self.retries + 1):
+            try:
+                return await asyncio.to_thread(self._smtp_send, message)
+            except smtplib.SMTPResponseException as e:
+                if e.smtp_code >= 500 or attempt == self.retries:
+                    raise
+            except (smtplib.SMTPException, OSError):
+                if attempt == self.retries:
+                    raise
+            await asyncio.sleep(min(30.0, 2 ** attempt))
+
+    async def _deliver(self, digest: Digest) -> List[Dict[str, Any]]:
+        """Send one digest; returns the status update for each of its rows"""
+        async with self._semaphore:
+            try:
+                if digest.method == "webhook":
+                    response = await self._post_webhook(digest)
+                else:
+                    response = await self._send_email(digest)
+                ok, permanent = True, False
+            except Exception as e:
+                ok = False
+                response = f"{type(e).__name__}: {e}"[:500]
+                # Client errors other than throttling will not succeed on a retry
+                permanent = (
+                    (isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500 and e.response.status_code != 429)
+                    or (isinstance(e, smtplib.SMTPResponseException) and e.smtp_code >= 500)
+                )
+
+        now = _utcnow()
+        updates = []
+        for row in digest.rows:
+            attempts = (row.delivery_attempts or 0) + 1
+            update_row = {"id": row.id, "delivery_attempts": attempts, "notification_response": response}
+            if ok:
+                update_row.update(notification_status="sent", sent_at=now)
+            elif permanent or attempts >= self.max_attempts:
+                update_row.update(notification_status="failed")
+            else:
+                update_row.update(
+                    notification_status="pending",
+                    next_attempt_at=now + timedelta(seconds=self.retry_base * 2 ** (attempts - 1))
+                )
+            updates.append(update_row)
+        status = updates[0]["notification_status"] if updates else "empty"
+        NOTIFICATIONS.inc(len(updates), method=digest.method, status=status)
+        self.counts[status] += len(updates)
+        return updates
+
+    async def _claim(self, db) -> List[JailbreakNotification]:
+        """
+        Atomically mark due rows 'sending' and return them (the caller commits). The
+        status check in the UPDATE itself means a row another worker claimed first is
+        never returned.
+        """
+        now = _utcnow()
+        due = (
+            select(JailbreakNotification.id)
+            .where(
+                JailbreakNotification.notification_status == "pending",
+                JailbreakNotification.next_attempt_at <= now
+            )
+            .order_by(JailbreakNotification.next_attempt_at)
+            .limit(self.batch_limit)
+        )
+        if db.bind.dialect.name == "postgresql":
+            due = due.with_for_update(skip_locked=True)
+        result = await db.execute(
+            update(JailbreakNotification)
+            .where(
+                JailbreakNotification.id.in_(due.scalar_subquery()),
+                JailbreakNotification.notification_status == "pending"
+            )
+            # next_attempt_at doubles as the claim's lease; see recover()
+            .values(notification_status="sending", next_attempt_at=now + timedelta(seconds=self.send_lease))
+            .returning(JailbreakNotification)
+            .execution_options(synchronize_session=False)
+        )
+        return list(result.scalars())
+
+    async def dispatch(self) -> Dict[str, Any]:
+        """Claim due notifications, deliver them in digests, and record the outcomes"""
+        async with self._dispatch_lock:
+            started = time.perf_counter()
+            await self.recover()
+            async with self.session_factory() as db:
+                rows = await self._claim(db)
+                if not rows:
+                    return {"claimed": 0, "digests": 0}
+                result = await db.execute(
+                    select(AIProvider).where(AIProvider.id.in_({row.provider_id for row in rows}))
+                )
+                providers = {
+                    p.id: {c.name: getattr(p, c.name) for c in AIProvider.__table__.columns}
+                    for p in result.scalars()
+                }
+                digests, updates = self._digests(rows, providers)
+                claims = [
+                    {"id": row.id, "notification_status": "sending", "idempotency_key": digest.key}
+                    for digest in digests for row in digest.rows
+                ]
+                if claims + updates:
+                    await db.execute(update(JailbreakNotification), claims + updates)
+                await db.commit()
+
+            results = await asyncio.gather(*(self._deliver(digest) for digest in digests))
+            outcomes = [u for digest_updates in results for u in digest_updates]
+            if outcomes:
+                async with self.session_factory() as db:
+                    # One executemany for every row of every digest
+                    await db.execute(update(JailbreakNotification), outcomes)
+                    await db.commit()
+
+            self.cycles += 1
+            summary = defaultdict(int)
+            for outcome in outcomes:
+                summary[outcome["notification_status"]] += 1
+            return {
+                "claimed": len(rows),
+                "digests": len(digests),
+                **summary,
+                "elapsed_s": round(time.perf_counter() - started, 3)
+            }
+
+    async def recover(self):
+        """
+        Rows left 'sending' past their lease (their worker died mid-delivery) are
+        retried under the same idempotency key. Live claims of other workers are not touched.
+        """
+        now = _utcnow()
+        async with self.session_factory() as db:
+            result = await db.execute(
+                update(JailbreakNotification)
+                .where(
+                    JailbreakNotification.notification_status == "sending",
+                    JailbreakNotification.next_attempt_at <= now
+                )
+                .values(notification_status="pending", next_attempt_at=now)
+            )
+            await db.commit()
+        if result.rowcount:
+            print(f"♻️ Requeued {result.rowcount} notifications interrupted mid-delivery")
+
+    async def summary(self) -> Dict[str, int]:
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(JailbreakNotification.notification_status, func.count())
+                .group_by(JailbreakNotification.notification_status)
+            )
+            return dict(result.all())
+
+    def install(self):
+        self.writer.on_flush(Attempt, self.attempts_written)
+        self.writer.on_flush(TestRun, self.test_runs_written)
+
+    async def start(self):
+        self.install()
+        await self.recover()
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.dispatch()
+            except Exception as e:
+                self.counts["cycle_errors"] += 1
+                print(f"⚠️ Notification dispatch failed: {e}")
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "interval_s": self.interval,
+            "smtp_configured": bool(self.smtp_host),
+            "findings": self.findings,
+            "cycles": self.cycles,
+            **self.counts
+        }
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+_notifier: Optional[Notifier] = None
+
+def get_notifier() -> Notifier:
+    global _notifier
+    if _notifier is None:
+        _notifier = Notifier()
+    return _notifier
+
+async def close_notifier():
+    global _notifier
+    if _notifier is not None:
+        await _notifier.close()
+        _notifier = None
@@ -0,0 +1,129 @@
+import json
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Any, Optional
+from app.config import OPENROUTER_BASE_URL
+from app.services.http_pool import HttpPool
+from app.services.metrics import FIRST_TOKEN_SECONDS
+
+class CompletionStream:
+    """Iterates the text deltas of a streamed chat completion, accumulating the full text"""
+
+    def __init__(self, response, model: str = "", started: Optional[float] = None):
+        self.response = response
+        self.model = model
+        self.started = started if started is not None else time.perf_counter()
+        self.first_token_ms: Optional[float] = None
+        self.text = ""
+        self.usage: Optional[Dict[str, Any]] = None
+        self.finish_reason: Optional[str] = None
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        async for line in self.response.aiter_lines():
+            # Skip blank separators and SSE comments such as ": OPENROUTER PROCESSING"
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+
+            chunk = json.loads(data)
+            if "error" in chunk:
+                error = chunk["error"]
+                raise RuntimeError(error.get("message", str(error)) if isinstance(error, dict) else str(error))
+            if chunk.get("usage"):
+                self.usage = chunk["usage"]
+
+            for choice in chunk.get("choices") or []:
+                if choice.get("finish_reason"):
+                    self.finish_reason = choice["finish_reason"]
+                delta = (choice.get("delta") or {}).get("content")
+                if delta:
+                    if self.first_token_ms is None:
+                        elapsed = time.perf_counter() - self.started
+                        self.first_token_ms = round(elapsed * 1000, 1)
+                        FIRST_TOKEN_SECONDS.observe(elapsed, model=self.model)
+                    self.text += delta
+                    yield delta
+
+@asynccontextmanager
+async def open_completion_stream(
+    http: HttpPool,
+    headers: Dict[str, str],
+    payload: Dict[str, Any],
+    timeout: float = 60.0
+):
+    """
+    POST a streaming chat/completions request. Leaving the block early closes the
+    connection, which cancels the generation upstream.
+    """
+    started = time.perf_counter()
+    async with http.stream(
+        "POST",
+        f"{OPENROUTER_BASE_URL}/chat/completions",
+        headers=headers,
+        json={**payload, "stream": True},
+        timeout=timeout
+    ) as response:
+        if response.status_code >= 400:
+            await response.aread()
+            response.raise_for_status()
+        yield CompletionStream(response, payload.get("model", ""), started)
+
+class JsonObjectScanner:
+    """
+    Detects, chunk by chunk, when a streamed message that starts with a JSON object
+    (or an array of tool-call objects) has closed it, so the tool calls can be
+    dispatched without waiting for the rest of the generation.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.started = False
+        self.rejected = False
+        self.complete = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> bool:
+        """Consume a chunk. Returns True once the top-level value is complete."""
+        if self.rejected or self.complete:
+            return self.complete
+
+        for i, ch in enumerate(chunk):
+            if not self.started:
+                if ch.isspace():
+                    continue
+                if ch not in "{[":
+                    self.rejected = True
+                    return False
+                self.started = True
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    candidate = self.text + chunk[:i + 1]
+                    try:
+                        json.loads(candidate)
+                    except ValueError:
+                        # Prose that merely starts with a bracket, e.g. "[Step 1] ..."
+                        self.rejected = True
+                        self.text += chunk
+                        return False
+                    self.text = candidate
+                    self.complete = True
+                    return True
+
+        self.text += chunk
+        return False
@@ -0,0 +1,475 @@
+"""
+Success-rate statistics maintained incrementally.
+
+Every flushed batch of attempts and test runs adds its counts to `outcome_stats`
+in the same transaction: one row per (subject, model, UTC day) plus an all-time
+row per subject, which also keeps Prompt.success_rate current. Reports read only
+these rows, never a scan of `attempts` or `test_runs`. A periodic reconciliation
+re-derives the most recent day buckets from the source rows (a timestamp range,
+by index) to correct drift from failed hooks, replays or manual edits.
+"""
+import asyncio
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple
+from sqlalchemy import Float, cast, delete, func, insert, literal, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from app.database import AsyncSessionLocal
+from app.models import ArchivePart, Attempt, Exploit, OutcomeStat, Prompt, TestRun
+from app.config import STATS_RECONCILE_INTERVAL, STATS_RECONCILE_DAYS
+from app.services.corpus_importer import content_hash
+from app.services.throttle import provider_of
+from app.services.write_buffer import WriteBuffer, get_write_buffer
+
+PROMPT = "prompt"
+EXPLOIT = "exploit"
+ALL_TIME = "all"
+GROUP_BY = {
+    "model": OutcomeStat.model_name,
+    "provider": OutcomeStat.provider,
+    "category": OutcomeStat.category,
+}
+
+StatKey = Tuple[str, str, str, str]  # (subject_type, subject_id, model_name, bucket)
+
+def day_bucket(timestamp: Optional[datetime]) -> str:
+    """UTC date of a row's timestamp, e.g. '2025-01-31'"""
+    timestamp = timestamp or datetime.now(timezone.utc)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc)
+    return timestamp.date().isoformat()
+
+def window_start(days: int) -> str:
+    """First day bucket of a window of `days` days ending today"""
+    return (datetime.now(timezone.utc).date() - timedelta(days=max(days, 1) - 1)).isoformat()
+
+class StatsBatch:
+    """Count deltas for a set of rows, applied with one upsert per distinct key"""
+
+    def __init__(self):
+        self.counts: Dict[StatKey, List[int]] = defaultdict(lambda: [0, 0])
+        self.categories: Dict[Tuple[str, str], Optional[str]] = {}
+
+    def add(
+        self,
+        subject_type: str,
+        subject_id: str,
+        category: Optional[str],
+        model: Optional[str],
+        timestamp: Optional[datetime],
+        attempts: int = 1,
+        successes: int = 0
+    ):
+        self.categories[(subject_type, subject_id)] = category
+        for key in (
+            (subject_type, subject_id, model or "", day_bucket(timestamp)),
+            (subject_type, subject_id, "", ALL_TIME),
+        ):
+            counts = self.counts[key]
+            counts[0] += attempts
+            counts[1] += successes
+
+    def rows(self, buckets: str = "any") -> List[Dict[str, Any]]:
+        """Rows for the upsert; buckets 'day' or 'all' restricts to one kind"""
+        rows = []
+        for (subject_type, subject_id, model, bucket), (attempts, successes) in self.counts.items():
+            if (buckets == "day" and bucket == ALL_TIME) or (buckets == "all" and bucket != ALL_TIME):
+                continue
+            rows.append({
+                "subject_type": subject_type,
+                "subject_id": subject_id,
+                "model_name": model,
+                "bucket": bucket,
+                "provider": provider_of(model) if model else None,
+                "category": self.categories.get((subject_type, subject_id)),
+                "attempts": attempts,
+                "successes": successes,
+            })
+        return rows
+
+    def prompt_ids(self) -> Set[str]:
+        return {sid for (stype, sid) in self.categories if stype == PROMPT and sid}
+
+def _upsert(dialect: str):
+    """INSERT that adds to the counters of an existing row"""
+    module = postgresql if dialect == "postgresql" else sqlite
+    stmt = module.insert(OutcomeStat)
+    return stmt.on_conflict_do_update(
+        index_elements=["subject_type", "subject_id", "model_name", "bucket"],
+        set_={
+            "attempts": OutcomeStat.attempts + stmt.excluded.attempts,
+            "successes": OutcomeStat.successes + stmt.excluded.successes,
+            "category": func.coalesce(stmt.excluded.category, OutcomeStat.category),
+            "updated_at": func.now(),
+        }
+    )
+
+async def refresh_prompt_rates(db, prompt_ids: Optional[Iterable[str]] = None):
+    """Copy all-time success rates onto Prompt.success_rate (all counted prompts if ids is None)"""
+    totals = (
+        select(cast(OutcomeStat.successes, Float) / OutcomeStat.attempts)
+        .where(
+            OutcomeStat.subject_type == PROMPT,
+            OutcomeStat.subject_id == Prompt.id,
+            OutcomeStat.model_name == "",
+            OutcomeStat.bucket == ALL_TIME,
+            OutcomeStat.attempts > 0
+        )
+        .scalar_subquery()
+    )
+    query = update(Prompt).values(success_rate=totals)
+    if prompt_ids is None:
+        counted = select(OutcomeStat.subject_id).where(
+            OutcomeStat.subject_type == PROMPT, OutcomeStat.bucket == ALL_TIME, OutcomeStat.attempts > 0
+        )
+        query = query.where(Prompt.id.in_(counted))
+    else:
+        prompt_ids = list(prompt_ids)
+        if not prompt_ids:
+            return
+        query = query.where(Prompt.id.in_(prompt_ids))
+    await db.execute(query.execution_options(synchronize_session=False))
+
+async def apply_batch(db, batch: StatsBatch):
+    """Add a batch's counts to outcome_stats and refresh the affected prompts' success rates"""
+    rows = batch.rows()
+    if not rows:
+        return
+    await db.execute(_upsert(db.bind.dialect.name), rows)
+    await refresh_prompt_rates(db, batch.prompt_ids())
+
+async def _match_prompts(db, rows: List[Dict[str, Any]]) -> List[Tuple[str, Optional[str]]]:
+    """
+    (prompt id, category) for each attempt row: the prompt_id the agent passed, else
+    the stored prompt with the same normalized content, else ('', None).
+    """
+    ids = {(r.get("extra_data") or {}).get("prompt_id") for r in rows} - {None}
+    hashes = {r["_hash"] for r in rows}
+    by_id: Dict[str, Optional[str]] = {}
+    by_hash: Dict[str, str] = {}
+    if ids or hashes:
+        result = await db.execute(
+            select(Prompt.id, Prompt.content_hash, Prompt.category)
+            .where(or_(Prompt.id.in_(list(ids)), Prompt.content_hash.in_(list(hashes))))
+        )
+        for prompt_id, digest, category in result.all():
+            by_id[prompt_id] = category
+            if digest:
+                by_hash[digest] = prompt_id
+
+    matches = []
+    for row in rows:
+        prompt_id = (row.get("extra_data") or {}).get("prompt_id")
+        if prompt_id not in by_id:
+            prompt_id = by_hash.get(row["_hash"])
+        matches.append((prompt_id, by_id[prompt_id]) if prompt_id else ("", None))
+    return matches
+
+async def count_attempts(db, rows: List[Dict[str, Any]], batch: StatsBatch):
+    for row in rows:
+        row["_hash"] = content_hash(row.get("prompt") or "")
+    for row, (prompt_id, category) in zip(rows, await _match_prompts(db, rows)):
+        batch.add(PROMPT, prompt_id, category, row.get("model_name"), row.get("timestamp"), 1, int(bool(row.get("success"))))
+
+async def count_test_runs(db, rows: List[Dict[str, Any]], batch: StatsBatch):
+    exploit_ids = list({row["exploit_id"] for row in rows})
+    result = await db.execute(select(Exploit.id, Exploit.exploit_type).where(Exploit.id.in_(exploit_ids)))
+    types = dict(result.all())
+    for row in rows:
+        batch.add(
+            EXPLOIT, row["exploit_id"], types.get(row["exploit_id"]), row.get("target_model"),
+            row.get("timestamp"), 1, int(bool(row.get("success")))
+        )
+
+async def attempts_written(db, rows: List[Dict[str, Any]]):
+    """Write-buffer flush hook for Attempt rows"""
+    batch = StatsBatch()
+    await count_attempts(db, [dict(row) for row in rows], batch)
+    await apply_batch(db, batch)
+
+async def test_runs_written(db, rows: List[Dict[str, Any]]):
+    """Write-buffer flush hook for TestRun rows"""
+    batch = StatsBatch()
+    await count_test_runs(db, rows, batch)
+    await apply_batch(db, batch)
+
+async def reconcile_range(db, days: int = STATS_RECONCILE_DAYS) -> List[str]:
+    """
+    Day buckets to reconcile, oldest first: the last `days` days, or (0) every day
+    with source rows or buckets. Archived days have no source rows left, so their
+    buckets are kept as they are.
+    """
+    today = day_bucket(None)
+    if days > 0:
+        first = window_start(days)
+    else:
+        earliest = [
+            (await db.execute(select(func.min(column)))).scalar()
+            for column in (Attempt.timestamp, TestRun.timestamp)
+        ]
+        buckets = (await db.execute(select(func.min(OutcomeStat.bucket)).where(OutcomeStat.bucket != ALL_TIME))).scalar()
+        first = min([day_bucket(t) for t in earliest if t is not None] + ([buckets] if buckets else []), default=today)
+    archived_before = (await db.execute(select(func.max(ArchivePart.archived_before)))).scalar()
+    if archived_before is not None and first < day_bucket(archived_before):
+        first = day_bucket(archived_before)
+    day, last = datetime.fromisoformat(first).date(), datetime.fromisoformat(today).date()
+    return [(day + timedelta(days=n)).isoformat() for n in range((last - day).days + 1)]
+
+def _day_range(day: str) -> Tuple[datetime, datetime]:
+    start = datetime.fromisoformat(day).replace(tzinfo=timezone.utc)
+    return start, start + timedelta(days=1)
+
+async def day_row_counts(db, day: str) -> Tuple[int, int]:
+    """Source rows of a day; the write buffer only inserts, so a changed count means new rows"""
+    start, end = _day_range(day)
+    return tuple([
+        (await db.execute(select(func.count()).where(column >= start, column < end))).scalar()
+        for column in (Attempt.timestamp, TestRun.timestamp)
+    ])
+
+async def count_day(db, day: str, chunk_size: int = 1000) -> Tuple[StatsBatch, int]:
+    """Re-derive one day's counts from attempts and test_runs (a timestamp range, by index)"""
+    start, end = _day_range(day)
+    batch = StatsBatch()
+    scanned = 0
+    attempts = select(Attempt.prompt, Attempt.model_name, Attempt.success, Attempt.timestamp, Attempt.extra_data)
+    test_runs = select(TestRun.exploit_id, TestRun.target_model, TestRun.success, TestRun.timestamp)
+    for query, column, count in ((attempts, Attempt.timestamp, count_attempts), (test_runs, TestRun.timestamp, count_test_runs)):
+        query = query.where(column >= start, column < end)
+        stream = await db.stream(query.execution_options(yield_per=chunk_size))
+        async for partition in stream.partitions():
+            rows = [dict(row._mapping) for row in partition]
+            await count(db, rows, batch)
+            scanned += len(rows)
+    return batch, scanned
+
+async def replace_day(db, day: str, batch: StatsBatch) -> int:
+    """Swap one day's buckets for freshly counted ones. Returns how many rows differed."""
+    result = await db.execute(
+        select(
+            OutcomeStat.subject_type, OutcomeStat.subject_id, OutcomeStat.model_name,
+            OutcomeStat.bucket, OutcomeStat.attempts, OutcomeStat.successes
+        ).where(OutcomeStat.bucket == day)
+    )
+    existing = {tuple(row[:4]): [row[4], row[5]] for row in result.all()}
+    fresh = {key: counts for key, counts in batch.counts.items() if key[3] == day}
+    corrected = sum(1 for key in existing.keys() | fresh.keys() if existing.get(key) != fresh.get(key))
+    if corrected:
+        await db.execute(delete(OutcomeStat).where(OutcomeStat.bucket == day))
+        day_rows = batch.rows("day")
+        if day_rows:
+            await db.execute(insert(OutcomeStat), day_rows)
+    return corrected
+
+async def rebuild_all_time(db):
+    """All-time rows are the sum of every day bucket, including archived days"""
+    await db.execute(delete(OutcomeStat).where(OutcomeStat.bucket == ALL_TIME))
+    totals = (
+        select(
+            OutcomeStat.subject_type, OutcomeStat.subject_id, literal(""), literal(ALL_TIME),
+            func.max(OutcomeStat.category), func.sum(OutcomeStat.attempts), func.sum(OutcomeStat.successes)
+        )
+        .where(OutcomeStat.bucket != ALL_TIME)
+        .group_by(OutcomeStat.subject_type, OutcomeStat.subject_id)
+    )
+    await db.execute(
+        insert(OutcomeStat).from_select(
+            ["subject_type", "subject_id", "model_name", "bucket", "category", "attempts", "successes"],
+            totals
+        )
+    )
+    await refresh_prompt_rates(db)
+
+async def success_rates(
+    db,
+    group_by: str = "model",
+    days: int = 7,
+    subject_type: Optional[str] = None,
+    by_day: bool = False,
+    model: Optional[str] = None,
+    provider: Optional[str] = None,
+    category: Optional[str] = None
+) -> List[Dict[str, Any]]:
+    """Success rate per model/provider/category over the last `days` days, from the day buckets"""
+    column = GROUP_BY[group_by]
+    columns = [column.label("key")] + ([OutcomeStat.bucket] if by_day else [])
+    query = (
+        select(
+            *columns,
+            func.sum(OutcomeStat.attempts).label("attempts"),
+            func.sum(OutcomeStat.successes).label("successes")
+        )
+        .where(OutcomeStat.bucket != ALL_TIME, OutcomeStat.bucket >= window_start(days))
+        .group_by(*columns)
+    )
+    if subject_type:
+        query = query.where(OutcomeStat.subject_type == subject_type)
+    if model:
+        query = query.where(OutcomeStat.model_name == model)
+    if provider:
+        query = query.where(OutcomeStat.provider == provider)
+    if category:
+        query = query.where(OutcomeStat.category == category)
+
+    rows = []
+    for row in (await db.execute(query)).all():
+        item = {group_by: row.key, "attempts": row.attempts, "successes": row.successes}
+        if by_day:
+            item["day"] = row.bucket
+        item["success_rate"] = round(row.successes / row.attempts, 4) if row.attempts else None
+        rows.append(item)
+    rows.sort(key=lambda r: (r.get("day", ""), -r["attempts"]))
+    return rows
+
+async def subject_stats(db, subject_type: str, subject_id: str) -> Dict[str, Any]:
+    """All-time totals for one prompt or exploit, with a per-model breakdown"""
+    result = await db.execute(
+        select(
+            OutcomeStat.model_name,
+            func.sum(OutcomeStat.attempts).label("attempts"),
+            func.sum(OutcomeStat.successes).label("successes")
+        )
+        .where(
+            OutcomeStat.subject_type == subject_type,
+            OutcomeStat.subject_id == subject_id,
+            OutcomeStat.bucket != ALL_TIME
+        )
+        .group_by(OutcomeStat.model_name)
+    )
+    models = [
+        {
+            "model": row.model_name, "attempts": row.attempts, "successes": row.successes,
+            "success_rate": round(row.successes / row.attempts, 4) if row.attempts else None
+        }
+        for row in result.all()
+    ]
+    attempts = sum(m["attempts"] for m in models)
+    successes = sum(m["successes"] for m in models)
+    return {
+        "subject_type": subject_type,
+        "subject_id": subject_id,
+        "attempts": attempts,
+        "successes": successes,
+        "success_rate": round(successes / attempts, 4) if attempts else None,
+        "models": sorted(models, key=lambda m: -m["attempts"])
+    }
+
+class StatsReconciler:
+    """Registers the write-buffer hooks and periodically reconciles recent buckets"""
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        writer: Optional[WriteBuffer] = None,
+        interval: float = STATS_RECONCILE_INTERVAL,
+        days: int = STATS_RECONCILE_DAYS
+    ):
+        self.session_factory = session_factory
+        self.writer = writer or get_write_buffer()
+        self.interval = interval
+        self.days = days
+        self._task: Optional[asyncio.Task] = None
+
+        self.runs = 0
+        self.failures = 0
+        self.corrected = 0
+        self.last_result: Optional[Dict[str, Any]] = None
+
+    def install(self):
+        self.writer.on_flush(Attempt, attempts_written)
+        self.writer.on_flush(TestRun, test_runs_written)
+
+    def start(self):
+        self.install()
+        if self.interval > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.reconcile()
+            except Exception as e:
+                self.failures += 1
+                print(f"⚠️ Stats reconciliation failed: {e}")
+
+    async def reconcile(self, days: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Reconcile the last `days` days (default: the configured window; 0: all history),
+        one day at a time. Each day is counted without blocking the write buffer; only
+        the swap of its buckets holds off flushes, and a day that gained rows while it
+        was being counted is recounted under the lock.
+        """
+        days = self.days if days is None else days
+        started = time.perf_counter()
+        async with self.session_factory() as db:
+            day_list = await reconcile_range(db, days)
+
+        scanned = buckets = corrected = 0
+        for day in day_list:
+            async with self.session_factory() as db:
+                rows = await day_row_counts(db, day)
+                batch, counted = await count_day(db, day)
+            async with self.writer.exclusive():
+                async with self.session_factory() as db:
+                    if await day_row_counts(db, day) != rows:
+                        batch, counted = await count_day(db, day)
+                    corrected += await replace_day(db, day, batch)
+                    await db.commit()
+            scanned += counted
+            buckets += len(batch.rows("day"))
+
+        # Flushes add to the all-time rows as well, so the rebuild is swapped under the lock too
+        async with self.writer.exclusive():
+            async with self.session_factory() as db:
+                await rebuild_all_time(db)
+                await db.commit()
+
+        result = {
+            "since": day_list[0] if day_list else None,
+            "scanned": scanned,
+            "buckets": buckets,
+            "corrected": corrected,
+            "elapsed_s": round(time.perf_counter() - started, 3)
+        }
+        self.runs += 1
+        self.corrected += result["corrected"]
+        self.last_result = result
+        if result["corrected"]:
+            print(f"🔧 Stats reconciliation corrected {result['corrected']} buckets since {result['since']}")
+        return result
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "interval_s": self.interval,
+            "window_days": self.days,
+            "runs": self.runs,
+            "failures": self.failures,
+            "corrected": self.corrected,
+            "hook_failures": self.writer.hook_failures,
+            "last": self.last_result
+        }
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+_reconciler: Optional[StatsReconciler] = None
+
+def get_stats_reconciler() -> StatsReconciler:
+    global _reconciler
+    if _reconciler is None:
+        _reconciler = StatsReconciler()
+    return _reconciler
+
+async def close_stats_reconciler():
+    global _reconciler
+    if _reconciler is not None:
+        await _reconciler.close()
+        _reconciler = None
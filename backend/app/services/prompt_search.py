@@ -0,0 +1,195 @@
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional, TYPE_CHECKING
+from sqlalchemy import select, func, literal_column, table, column
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import Prompt, Exploit
+from app.config import SEARCH_SUCCESS_WEIGHT
+
+if TYPE_CHECKING:  # numpy-backed; imported on first semantic search
+    from app.services.embedding_index import EmbeddingIndex
+
+SEARCH_MODES = ("keyword", "semantic")
+
+# With a category filter, semantic search over-fetches this many candidates per result
+SEMANTIC_CATEGORY_OVERFETCH = 8
+
+# SQLite: external-content FTS5 table over prompts.content, kept in sync by triggers.
+# prompts has a string primary key, so its implicit rowid may be renumbered by VACUUM;
+# the index is keyed on prompts.search_rowid instead, which the insert trigger assigns.
+SQLITE_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS prompts_fts USING fts5(
+        content, content='prompts', content_rowid='search_rowid', tokenize='porter unicode61'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS prompts_fts_ai AFTER INSERT ON prompts BEGIN
+        UPDATE prompts SET search_rowid = (SELECT coalesce(max(search_rowid), 0) + 1 FROM prompts)
+            WHERE rowid = new.rowid AND search_rowid IS NULL;
+        INSERT INTO prompts_fts(rowid, content)
+            SELECT search_rowid, content FROM prompts WHERE rowid = new.rowid;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS prompts_fts_ad AFTER DELETE ON prompts BEGIN
+        INSERT INTO prompts_fts(prompts_fts, rowid, content) VALUES ('delete', old.search_rowid, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS prompts_fts_au AFTER UPDATE OF content ON prompts BEGIN
+        INSERT INTO prompts_fts(prompts_fts, rowid, content) VALUES ('delete', old.search_rowid, old.content);
+        INSERT INTO prompts_fts(rowid, content) VALUES (new.search_rowid, new.content);
+    END""",
+]
+
+# Dropped by migration 12 so ensure_search_index recreates them on search_rowid
+SQLITE_FTS_OBJECTS = [
+    ("TRIGGER", "prompts_fts_ai"), ("TRIGGER", "prompts_fts_ad"),
+    ("TRIGGER", "prompts_fts_au"), ("TABLE", "prompts_fts"),
+]
+
+# Postgres: expression GIN index, maintained by the database on every write
+POSTGRES_FTS_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_prompts_content_fts ON prompts "
+    "USING GIN (to_tsvector('english'::regconfig, content))",
+]
+
+fts_available = False
+
+prompts_fts = table("prompts_fts", column("rowid"))
+
+def ensure_search_index(conn):
+    """Create the full-text index for the connection's dialect (sync, for run_sync)"""
+    global fts_available
+    dialect = conn.dialect.name
+
+    try:
+        if dialect == "sqlite":
+            exists = conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'prompts_fts'"
+            ).first()
+            for statement in SQLITE_FTS_DDL:
+                conn.exec_driver_sql(statement)
+            if not exists:
+                # Key and index any rows that were written before the FTS table existed
+                top = conn.exec_driver_sql("SELECT coalesce(max(search_rowid), 0) FROM prompts").scalar()
+                conn.exec_driver_sql(
+                    "UPDATE prompts SET search_rowid = rowid + ? WHERE search_rowid IS NULL", (top,)
+                )
+                conn.exec_driver_sql("INSERT INTO prompts_fts(prompts_fts) VALUES ('rebuild')")
+            fts_available = True
+        elif dialect == "postgresql":
+            for statement in POSTGRES_FTS_DDL:
+                conn.exec_driver_sql(statement)
+            fts_available = True
+    except (OperationalError, ProgrammingError) as e:
+        # e.g. SQLite built without FTS5 - fall back to LIKE scans
+        print(f"⚠️ Full-text search unavailable: {e}")
+        fts_available = False
+
+# unicode61 token characters: letters and digits; everything else (apostrophes,
+# punctuation, underscores) separates tokens
+FTS_TOKEN = re.compile(r"[^\W_]+")
+
+def fts5_terms(search: str) -> List[str]:
+    """Split text the way the unicode61 tokenizer does: casefolded, diacritics removed"""
+    decomposed = unicodedata.normalize("NFKD", search)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return FTS_TOKEN.findall(stripped.casefold())
+
+def fts5_query(search: str) -> str:
+    """Turn free text into an FTS5 query: every term must match (as a prefix)"""
+    return " ".join(f'"{t}"*' for t in fts5_terms(search))
+
+def _substring_query(query, search: str):
+    # The pre-FTS search: case-insensitive substring, so it finds word fragments too
+    return query.where(Prompt.content.icontains(search, autoescape=True)).order_by(Prompt.success_rate.desc())
+
+async def search_prompts(
+    db: AsyncSession,
+    search: str = "",
+    category: Optional[str] = None,
+    limit: int = 5,
+    use_fts: bool = True
+) -> List[Prompt]:
+    """
+    Search prompts, ranking full-text relevance blended with success_rate. When the
+    full-text query has no terms or finds nothing, falls back to a substring search,
+    which also matches word fragments and punctuation the index does not.
+    """
+    dialect = db.bind.dialect.name
+    success = func.coalesce(Prompt.success_rate, 0.0)
+    base = select(Prompt)
+
+    if category:
+        base = base.where(Prompt.category == category)
+
+    if not search:
+        result = await db.execute(base.order_by(Prompt.success_rate.desc()).limit(limit))
+        return list(result.scalars().all())
+
+    query = None
+    if use_fts and fts_available and dialect == "sqlite":
+        match = fts5_query(search)
+        if match:
+            # bm25() is negative (lower is better), so scaling it up favours proven prompts
+            rank = func.bm25(literal_column("prompts_fts")) * (1 + SEARCH_SUCCESS_WEIGHT * success)
+            query = (
+                base.join(prompts_fts, prompts_fts.c.rowid == Prompt.search_rowid)
+                .where(literal_column("prompts_fts").op("MATCH")(match))
+                .order_by(rank)
+            )
+    elif use_fts and fts_available and dialect == "postgresql":
+        vector = func.to_tsvector(literal_column("'english'::regconfig"), Prompt.content)
+        tsquery = func.plainto_tsquery(literal_column("'english'::regconfig"), search)
+        rank = func.ts_rank_cd(vector, tsquery) * (1 + SEARCH_SUCCESS_WEIGHT * success)
+        query = base.where(vector.op("@@")(tsquery)).order_by(rank.desc())
+
+    if query is not None:
+        prompts = list((await db.execute(query.limit(limit))).scalars().all())
+        if prompts:
+            return prompts
+
+    result = await db.execute(_substring_query(base, search).limit(limit))
+    return list(result.scalars().all())
+
+async def semantic_search(
+    db: AsyncSession,
+    search: str,
+    category: Optional[str] = None,
+    limit: int = 5,
+    index: Optional["EmbeddingIndex"] = None
+) -> List[Dict[str, Any]]:
+    """Prompts and exploits most similar to the text (cosine over the embedding index), best first"""
+    if index is None:
+        from app.services.embedding_index import get_embedding_index
+        index = get_embedding_index()
+    prompt_hits = dict(await index.search("prompts", search, limit * (SEMANTIC_CATEGORY_OVERFETCH if category else 1)))
+    exploit_hits = dict(await index.search("exploits", search, limit))
+
+    results = []
+    if prompt_hits:
+        query = select(Prompt).where(Prompt.id.in_(list(prompt_hits)))
+        if category:
+            query = query.where(Prompt.category == category)
+        for p in (await db.execute(query)).scalars():
+            results.append({
+                "kind": "prompt",
+                "id": p.id,
+                "content": p.content,
+                "category": p.category,
+                "provider": p.provider,
+                "success_rate": p.success_rate,
+                "severity": p.severity,
+                "similarity": round(prompt_hits[p.id], 4)
+            })
+    if exploit_hits:
+        for e in (await db.execute(select(Exploit).where(Exploit.id.in_(list(exploit_hits))))).scalars():
+            results.append({
+                "kind": "exploit",
+                "id": e.id,
+                "cve_id": e.cve_id,
+                "title": e.title,
+                "content": e.exploit_content,
+                "category": e.exploit_type,
+                "severity": e.severity,
+                "target_models": e.target_models,
+                "similarity": round(exploit_hits[e.id], 4)
+            })
+    results.sort(key=lambda r: r["similarity"], reverse=True)
+    return results[:limit]
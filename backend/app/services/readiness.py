@@ -0,0 +1,87 @@
+"""
+Startup progress, served at /ready.
+
+/health only says the process is up; /ready says whether this worker should take
+traffic. The lifespan registers each warm-up step here: required steps gate
+readiness, optional ones (heavy models and indexes) are reported but run behind it.
+"""
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+class Readiness:
+    """Status, duration and detail of each startup step"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.steps: Dict[str, Dict[str, Any]] = {}
+        self.required: List[str] = []
+        self.ready_ms: Optional[float] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def expect(self, *names: str):
+        """Declare the required steps up front so readiness waits for ones not yet started"""
+        for name in names:
+            if name not in self.required:
+                self.required.append(name)
+            self.steps.setdefault(name, {"status": "pending", "required": True})
+
+    async def run(self, name: str, step: Callable[[], Awaitable[Any]], required: bool = True) -> bool:
+        """Run one warm-up step, recording pending -> ready/failed; never raises"""
+        if required and name not in self.required:
+            self.required.append(name)
+        self.steps[name] = {"status": "pending", "required": required}
+        started = time.perf_counter()
+        try:
+            detail = await step()
+            self.steps[name].update(status="ready", detail=detail)
+        except Exception as e:
+            self.steps[name].update(status="failed", error=str(e) or type(e).__name__)
+            print(f"⚠️ Startup step '{name}' failed: {e}")
+        self.steps[name]["ms"] = round((time.perf_counter() - started) * 1000, 1)
+        if self.ready_ms is None and self.is_ready:
+            self.ready_ms = round((time.perf_counter() - self.started) * 1000, 1)
+            print(f"✅ Ready in {self.ready_ms:.0f} ms")
+        return self.steps[name]["status"] == "ready"
+
+    def start(self, name: str, step: Callable[[], Awaitable[Any]], required: bool = True):
+        """Run a step in the background; a required one is pending until it finishes"""
+        if required and name not in self.required:
+            self.required.append(name)
+        self.steps[name] = {"status": "pending", "required": required}
+        self._tasks.append(asyncio.create_task(self.run(name, step, required)))
+
+    @property
+    def is_ready(self) -> bool:
+        # Nothing registered yet (or shut down) is not ready
+        return bool(self.required) and all(self.steps[name]["status"] == "ready" for name in self.required)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "ready": self.is_ready,
+            "pid": os.getpid(),
+            "ready_ms": self.ready_ms,
+            "uptime_s": round(time.perf_counter() - self.started, 1),
+            "steps": self.steps,
+        }
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+_readiness: Optional[Readiness] = None
+
+def get_readiness() -> Readiness:
+    global _readiness
+    if _readiness is None:
+        _readiness = Readiness()
+    return _readiness
+
+async def close_readiness():
+    global _readiness
+    if _readiness is not None:
+        await _readiness.close()
+        _readiness = None
@@ -0,0 +1,244 @@
+import asyncio
+import time
+from typing import AsyncIterator, Dict, Any, List, Optional, Set, Tuple
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.models import Exploit, TestRun
+from app.config import (
+    OPENROUTER_API_KEY, OPENROUTER_BASE_URL, REGRESSION_MAX_RETRIES, REGRESSION_MAX_WORKERS
+)
+from app.services.http_pool import HttpPool, get_http_pool
+from app.services.write_buffer import WriteBuffer, get_write_buffer
+from app.services.throttle import ProviderLimiter, get_regression_limiter, provider_of, with_retries
+from app.services.refusal_classifier import RefusalClassifier, get_refusal_classifier
+from app.services.response_cache import ResponseCache, get_response_cache, cache_key
+from app.services.outcome_stats import EXPLOIT, StatsBatch, apply_batch
+from app.services.budget import REGRESSION, BudgetTracker, BudgetExceeded, estimate_usage, get_budget_tracker
+from app.services.metrics import record_usage
+
+async def load_exploits(db: AsyncSession, exploit_ids: Optional[List[str]] = None) -> List[Exploit]:
+    """Exploits to regress: the given ids, or every active exploit"""
+    query = select(Exploit)
+    if exploit_ids:
+        query = query.where(Exploit.id.in_(exploit_ids))
+    else:
+        query = query.where(Exploit.status == "active")
+    result = await db.execute(query.order_by(Exploit.cve_id))
+    return list(result.scalars().all())
+
+class RegressionRunner:
+    """Fans a set of exploits out across target models and records each outcome as a TestRun"""
+
+    def __init__(
+        self,
+        api_key: str = OPENROUTER_API_KEY,
+        http: Optional[HttpPool] = None,
+        writer: Optional[WriteBuffer] = None,
+        limiter: Optional[ProviderLimiter] = None,
+        max_retries: int = REGRESSION_MAX_RETRIES,
+        max_workers: int = REGRESSION_MAX_WORKERS,
+        classifier: Optional[RefusalClassifier] = None,
+        cache: Optional[ResponseCache] = None,
+        cache_bypass: bool = False,
+        budget: Optional[BudgetTracker] = None
+    ):
+        self.api_key = api_key
+        self.http = http or get_http_pool()
+        self.writer = writer or get_write_buffer()
+        # Shared by every run in the process, so the limits hold per provider, not per run
+        self.limiter = limiter or get_regression_limiter()
+        self.max_retries = max_retries
+        self.max_workers = max_workers
+        self.classifier = classifier or get_refusal_classifier()
+        self.cache = cache or get_response_cache()
+        # Bypass skips cache reads (fresh responses are still recorded); replay ignores it
+        self.cache_bypass = cache_bypass
+        self.budget = budget or get_budget_tracker()
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "HTTP-Referer": "https://lupin.ai",
+            "Content-Type": "application/json"
+        }
+
+    async def completed_pairs(self, db: AsyncSession, run_name: str) -> Set[Tuple[str, str]]:
+        """(exploit_id, target_model) pairs already recorded for this run"""
+        result = await db.execute(
+            select(TestRun.exploit_id, TestRun.target_model).where(TestRun.run_name == run_name)
+        )
+        return {(exploit_id, model) for exploit_id, model in result.all()}
+
+    async def _probe(self, run_name: str, exploit: Exploit, model: str) -> Dict[str, Any]:
+        calls = 0
+        elapsed_ms = 0
+        messages = [{"role": "user", "content": exploit.exploit_content}]
+        key = cache_key(model, messages)
+
+        async def send():
+            nonlocal calls, elapsed_ms
+            calls += 1
+            started = time.perf_counter()
+            response = await self.http.post(
+                f"{OPENROUTER_BASE_URL}/chat/completions",
+                headers=self._headers(),
+                json={"model": model, "messages": messages},
+                timeout=60.0
+            )
+            elapsed_ms = int((time.perf_counter() - started) * 1000)
+            return response
+
+        try:
+            cached = None
+            if self.cache.enabled and (self.cache.replay or not self.cache_bypass):
+                cached = await self.cache.get(key)
+            if cached is not None:
+                content, elapsed_ms = cached["content"], cached.get("elapsed_ms", 0)
+            else:
+                async with self.limiter.slot(model):
+                    # Regression runs belong to no session or user: only the global budget applies
+                    verdict = self.budget.exceeded()
+                    if verdict:
+                        raise BudgetExceeded(verdict)
+                    response = await with_retries(send, retries=self.max_retries)
+                    body = response.json()
+                    content = body["choices"][0]["message"]["content"]
+                usage = body.get("usage")
+                self.budget.charge(
+                    model, record_usage(model, usage) if usage else estimate_usage(messages, content),
+                    REGRESSION, estimated=not usage
+                )
+                await self.cache.put(key, model, {"content": content, "elapsed_ms": elapsed_ms})
+        except Exception as e:
+            # Not recorded, so a resumed run will retry this pair
+            return {
+                "type": "error", "exploit_id": exploit.id, "cve_id": exploit.cve_id,
+                "model": model, "error": str(e), "retries": max(calls - 1, 0)
+            }
+
+        verdict = (await self.classifier.aclassify_many([content]))[0]
+        blocked = verdict["refused"]
+        success = verdict["success"]
+        test_run_id = self.writer.add(
+            TestRun,
+            run_name=run_name,
+            exploit_id=exploit.id,
+            target_model=model,
+            test_prompt=exploit.exploit_content,
+            response=content,
+            success=success,
+            blocked=blocked,
+            execution_time_ms=elapsed_ms,
+            extra_data={"retries": max(calls - 1, 0), "cached": cached is not None}
+        )
+        return {
+            "type": "result", "test_run_id": test_run_id, "exploit_id": exploit.id,
+            "cve_id": exploit.cve_id, "model": model, "success": success, "blocked": blocked,
+            "execution_time_ms": elapsed_ms, "retries": max(calls - 1, 0), "cached": cached is not None
+        }
+
+    async def run(
+        self,
+        db: AsyncSession,
+        run_name: str,
+        exploits: List[Exploit],
+        models: List[str]
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Run every (exploit, model) pair not yet recorded under run_name, yielding results as they finish"""
+        done = await self.completed_pairs(db, run_name)
+        await self.budget.prepare()
+        pairs = [
+            (exploit, model)
+            for exploit in exploits
+            for model in dict.fromkeys(models)
+            if (exploit.id, model) not in done
+        ]
+        yield {
+            "type": "start", "run_name": run_name,
+            "total": len(exploits) * len(set(models)), "pending": len(pairs)
+        }
+
+        counts = {"success": 0, "blocked": 0, "error": 0, "completed": 0}
+        started = time.perf_counter()
+        queued: asyncio.Queue = asyncio.Queue()
+        for pair in pairs:
+            queued.put_nowait(pair)
+        finished: asyncio.Queue = asyncio.Queue()
+
+        async def worker():
+            while not queued.empty():
+                exploit, model = queued.get_nowait()
+                try:
+                    event = await self._probe(run_name, exploit, model)
+                except Exception as e:
+                    event = {"type": "error", "exploit_id": exploit.id, "cve_id": exploit.cve_id, "model": model, "error": str(e)}
+                finished.put_nowait(event)
+
+        # Enough workers to fill every provider's slots; the rest of the pairs wait in the queue
+        providers = len({provider_of(model) for _, model in pairs})
+        workers = min(len(pairs), self.limiter.concurrency * providers, self.max_workers)
+        tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+        try:
+            for _ in range(len(pairs)):
+                event = await finished.get()
+                if event["type"] == "error":
+                    counts["error"] += 1
+                else:
+                    counts["completed"] += 1
+                    counts["success"] += event["success"]
+                    counts["blocked"] += event["blocked"]
+                yield event
+        finally:
+            for task in tasks:
+                task.cancel()
+            await self.writer.flush()
+
+        yield {
+            "type": "complete", "run_name": run_name, **counts,
+            "elapsed_s": round(time.perf_counter() - started, 2)
+        }
+
+async def rescore_test_runs(
+    db: AsyncSession,
+    run_name: Optional[str] = None,
+    classifier: Optional[RefusalClassifier] = None,
+    batch_size: int = 500
+) -> Dict[str, int]:
+    """Re-classify stored TestRun responses in batches, bulk-updating rows whose verdict changed"""
+    classifier = classifier or get_refusal_classifier()
+    scanned = changed = 0
+    last_id = ""
+
+    while True:
+        query = select(
+            TestRun.id, TestRun.response, TestRun.success, TestRun.blocked,
+            TestRun.exploit_id, TestRun.target_model, TestRun.timestamp
+        ).where(TestRun.id > last_id)
+        if run_name:
+            query = query.where(TestRun.run_name == run_name)
+        rows = (await db.execute(query.order_by(TestRun.id).limit(batch_size))).all()
+        if not rows:
+            break
+
+        verdicts = await classifier.aclassify_many([row.response or "" for row in rows])
+        updates = [
+            {"id": row.id, "success": verdict["success"], "blocked": verdict["refused"]}
+            for row, verdict in zip(rows, verdicts)
+            if (row.success, row.blocked) != (verdict["success"], verdict["refused"])
+        ]
+        if updates:
+            await db.execute(update(TestRun), updates)
+            # Move flipped verdicts between the success counters of their original day
+            deltas = StatsBatch()
+            for row, verdict in zip(rows, verdicts):
+                if row.success != verdict["success"]:
+                    step = 1 if verdict["success"] else -1
+                    deltas.add(EXPLOIT, row.exploit_id, None, row.target_model, row.timestamp, 0, step)
+            await apply_batch(db, deltas)
+            await db.commit()
+
+        scanned += len(rows)
+        changed += len(updates)
+        last_id = rows[-1].id
+
+    return {"scanned": scanned, "changed": changed}
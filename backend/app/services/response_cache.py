@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+from app.config import (
+    RESPONSE_CACHE_MODE, RESPONSE_CACHE_PATH, RESPONSE_CACHE_MEMORY_SIZE,
+    RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MODEL_TTLS
+)
+
+MODES = ("off", "on", "replay")
+
+# Disk eviction (expired rows, then least recently used) runs every this many writes
+EVICT_EVERY = 100
+
+class CacheMiss(Exception):
+    """Raised in replay mode when a probe has no recorded response"""
+
+def parse_model_ttls(spec: str) -> Dict[str, float]:
+    """'openai/=86400,anthropic/claude-3.5-sonnet=3600' -> {model or provider prefix: seconds}"""
+    ttls = {}
+    for item in spec.split(","):
+        if "=" in item:
+            model, seconds = item.rsplit("=", 1)
+            ttls[model.strip()] = float(seconds)
+    return ttls
+
+def cache_key(model: str, messages: List[Dict[str, Any]], params: Optional[Dict[str, Any]] = None) -> str:
+    """Content address of a completion request: model, canonical messages, sampling params"""
+    canonical = {
+        "model": model,
+        "messages": [{"role": m.get("role"), "content": m.get("content")} for m in messages],
+        "params": {k: v for k, v in (params or {}).items() if k != "stream"}
+    }
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    Content-addressed cache of target-model completions: an in-memory LRU over a
+    SQLite file. Mode "on" serves hits and records misses; "replay" serves only
+    recorded responses (ignoring TTLs) and raises CacheMiss instead of calling out,
+    so CI can re-run TestRun suites offline.
+    """
+
+    def __init__(
+        self,
+        path: str = RESPONSE_CACHE_PATH,
+        mode: str = RESPONSE_CACHE_MODE,
+        memory_size: int = RESPONSE_CACHE_MEMORY_SIZE,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl: float = RESPONSE_CACHE_TTL,
+        model_ttls: Optional[Dict[str, float]] = None
+    ):
+        if mode not in MODES:
+            raise ValueError(f"Unknown response cache mode {mode!r}; expected one of {', '.join(MODES)}")
+        self.path = path
+        self.mode = mode
+        self.memory_size = memory_size
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.model_ttls = parse_model_ttls(RESPONSE_CACHE_MODEL_TTLS) if model_ttls is None else model_ttls
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.stores = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    @property
+    def replay(self) -> bool:
+        return self.mode == "replay"
+
+    def ttl_for(self, model: str) -> float:
+        """Exact model TTL, else the longest matching prefix (e.g. 'openai/'), else the default"""
+        if model in self.model_ttls:
+            return self.model_ttls[model]
+        prefixes = [p for p in self.model_ttls if model.startswith(p)]
+        return self.model_ttls[max(prefixes, key=len)] if prefixes else self.ttl
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS response_cache (
+                    key TEXT PRIMARY KEY, model TEXT NOT NULL, entry TEXT NOT NULL,
+                    created_at REAL NOT NULL, expires_at REAL NOT NULL, last_used REAL NOT NULL
+                )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS ix_response_cache_last_used ON response_cache (last_used)")
+        return self._conn
+
+    def _remember(self, key: str, entry: Dict[str, Any], expires_at: float):
+        self._memory[key] = (entry, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str) -> Optional[tuple]:
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute("SELECT entry, expires_at FROM response_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE response_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+        return (json.loads(row[0]), row[1]) if row else None
+
+    def _disk_put(self, key: str, model: str, entry: Dict[str, Any], expires_at: float):
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, json.dumps(entry), now, expires_at, now)
+            )
+            self._writes += 1
+            if self._writes % EVICT_EVERY == 0:
+                self._evict(conn, now)
+            conn.commit()
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        removed = conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (now,)).rowcount
+        excess = conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0] - self.max_entries
+        if excess > 0:
+            removed += conn.execute(
+                "DELETE FROM response_cache WHERE key IN "
+                "(SELECT key FROM response_cache ORDER BY last_used LIMIT ?)",
+                (excess,)
+            ).rowcount
+        self.evictions += removed
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """The cached entry for key, or None. In replay mode a miss raises CacheMiss."""
+        now = time.time()
+        cached = self._memory.get(key)
+        if cached is not None and (self.replay or cached[1] > now):
+            self.memory_hits += 1
+            self._memory.move_to_end(key)
+            return cached[0]
+
+        try:
+            stored = await asyncio.to_thread(self._disk_get, key)
+        except sqlite3.Error as e:
+            print(f"⚠️ Response cache read failed: {e}")
+            stored = None
+        if stored is not None and (self.replay or stored[1] > now):
+            self.disk_hits += 1
+            self._remember(key, *stored)
+            return stored[0]
+
+        if stored is not None:
+            self.expired += 1
+        self.misses += 1
+        if self.replay:
+            raise CacheMiss(f"No recorded response for request {key[:12]} (response cache in replay mode)")
+        return None
+
+    async def put(self, key: str, model: str, entry: Dict[str, Any]):
+        """Record a completion; models with a TTL of 0 are never cached"""
+        ttl = self.ttl_for(model)
+        if self.mode != "on" or ttl <= 0:
+            return
+        expires_at = time.time() + ttl
+        self._remember(key, entry, expires_at)
+        try:
+            await asyncio.to_thread(self._disk_put, key, model, entry, expires_at)
+        except sqlite3.Error as e:
+            # The probe itself succeeded; a cache that cannot persist must not fail it
+            print(f"⚠️ Response cache write failed: {e}")
+            return
+        self.stores += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "mode": self.mode,
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else None,
+            "stores": self.stores,
+            "evictions": self.evictions
+        }
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+_cache: Optional[ResponseCache] = None
+
+def get_response_cache() -> ResponseCache:
+    global _cache
+    if _cache is None:
+        _cache = ResponseCache()
+    return _cache
+
+def close_response_cache():
+    global _cache
+    if _cache is not None:
+        _cache.close()
+        _cache = None
@@ -0,0 +1,181 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+from app.database import AsyncSessionLocal
+from app.models import AgentSession, generate_uuid
+from app.services.metrics import span
+from app.config import (
+    SESSION_CACHE_SIZE, SESSION_TTL_SECONDS,
+    SESSION_KEEP_RECENT, SESSION_MAX_MESSAGES, SESSION_TOOL_RESULT_CHARS
+)
+
+COMPACTED_MARKER = "[compacted]"
+
+class SessionState:
+    """Mutable state of one agent session: conversation, per-target history and notepad"""
+
+    def __init__(
+        self,
+        session_id: str,
+        conversation: Optional[List[Dict[str, str]]] = None,
+        external_history: Optional[Dict[str, List[Dict[str, str]]]] = None,
+        notepad: str = ""
+    ):
+        self.session_id = session_id
+        self.conversation = conversation or []
+        # Keyed by target model so concurrent targets never see each other's turns.
+        # Sessions saved before that kept one shared list, which is not carried over.
+        self.external_history = external_history if isinstance(external_history, dict) else {}
+        self.notepad = notepad
+        self.lock = asyncio.Lock()
+
+class SessionStore:
+    """Sessions keyed by session_id: an LRU/TTL in-memory tier over the agent_sessions table"""
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        max_sessions: int = SESSION_CACHE_SIZE,
+        ttl: float = SESSION_TTL_SECONDS
+    ):
+        self.session_factory = session_factory
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _remember(self, state: SessionState):
+        self._cache[state.session_id] = (state, time.monotonic() + self.ttl)
+        self._cache.move_to_end(state.session_id)
+        while len(self._cache) > self.max_sessions:
+            self._cache.popitem(last=False)
+
+    async def get(self, session_id: str) -> Optional[SessionState]:
+        cached = self._cache.get(session_id)
+        if cached is not None and cached[1] > time.monotonic():
+            self.hits += 1
+            self._remember(cached[0])
+            return cached[0]
+        self._cache.pop(session_id, None)
+
+        self.misses += 1
+        async with self.session_factory() as db:
+            row = await db.get(AgentSession, session_id)
+        if row is None:
+            return None
+        state = SessionState(row.id, row.conversation, row.external_history, row.notepad or "")
+        self._remember(state)
+        return state
+
+    async def get_or_create(
+        self,
+        session_id: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> SessionState:
+        """Resume a session, or start one seeded with client-supplied history"""
+        if session_id:
+            state = await self.get(session_id)
+            if state is not None:
+                return state
+        state = SessionState(session_id or generate_uuid(), conversation=list(history or []))
+        self._remember(state)
+        return state
+
+    async def save(self, state: SessionState):
+        """Persist a session with a short-lived DB session"""
+        with span("db_commit", "session_save"):
+            async with self.session_factory() as db:
+                await db.merge(AgentSession(
+                    id=state.session_id,
+                    conversation=state.conversation,
+                    external_history=state.external_history,
+                    notepad=state.notepad
+                ))
+                await db.commit()
+        self._remember(state)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {"cached": len(self._cache), "hits": self.hits, "misses": self.misses}
+
+def _summarize_tool_result(content: str, max_chars: int) -> str:
+    """Shrink a tool result message, keeping the fields the agent actually reasons about"""
+    try:
+        payload = json.loads(content)
+    except json.JSONDecodeError:
+        return f"{content[:max_chars]} ... {COMPACTED_MARKER}"
+
+    if isinstance(payload, list):
+        # Several tool results from one turn
+        share = max(max_chars // max(len(payload), 1), 200)
+        parts = [_summarize_tool_result(json.dumps(item), share) for item in payload]
+        return f"[{', '.join(p[:-len(COMPACTED_MARKER) - 1] for p in parts)}] {COMPACTED_MARKER}"
+    if not isinstance(payload, dict):
+        return f"{content[:max_chars]} ... {COMPACTED_MARKER}"
+
+    result = payload.get("result")
+    if isinstance(result, list):
+        # query_db / list_models: keep ids plus a short preview of each entry
+        result = [
+            {k: (v[:80] if isinstance(v, str) else v) for k, v in item.items() if k in ("id", "content", "success_rate", "name", "error")}
+            if isinstance(item, dict) else item
+            for item in result
+        ]
+    elif isinstance(result, dict) and isinstance(result.get("response"), str):
+        # jailbreak_attempt / chat_with_external: keep the verdict, trim the reply
+        result = {**result, "response": result["response"][:200]}
+    elif isinstance(result, dict) and isinstance(result.get("results"), list):
+        # multi-model jailbreak_attempt: keep the per-model verdicts, trim each reply
+        result = {**result, "results": [
+            {**item, "response": item["response"][:80]} if isinstance(item, dict) and isinstance(item.get("response"), str) else item
+            for item in result["results"]
+        ]}
+
+    summary = json.dumps({**payload, "result": result})
+    if len(summary) > max_chars:
+        summary = summary[:max_chars] + " ..."
+    return f"{summary} {COMPACTED_MARKER}"
+
+def compact_conversation(
+    conversation: List[Dict[str, str]],
+    keep_recent: int = SESSION_KEEP_RECENT,
+    max_messages: int = SESSION_MAX_MESSAGES,
+    max_tool_chars: int = SESSION_TOOL_RESULT_CHARS
+) -> List[Dict[str, str]]:
+    """
+    Bound the size of the conversation re-sent on every agent call (in place).
+    Tool results older than the last keep_recent messages are summarized, and
+    beyond max_messages the oldest exchanges are dropped, keeping the system
+    prompt and the first user request.
+    """
+    older = len(conversation) - keep_recent
+    for i, message in enumerate(conversation[:max(older, 0)]):
+        content = message.get("content") or ""
+        if (
+            message.get("role") == "user"
+            and content.startswith(('{"tool"', '[{"tool"'))
+            and len(content) > max_tool_chars
+            and not content.endswith(COMPACTED_MARKER)
+        ):
+            conversation[i] = {**message, "content": _summarize_tool_result(content, max_tool_chars)}
+
+    head = 2 if conversation and conversation[0].get("role") == "system" else 1
+    excess = len(conversation) - max_messages
+    if excess > 0:
+        # Cut on an assistant turn so the remaining tool call/result pairs stay intact
+        cut = head + excess + 1
+        while cut < len(conversation) and conversation[cut].get("role") != "assistant":
+            cut += 1
+        del conversation[head:cut]
+        conversation.insert(head, {"role": "user", "content": f"[earlier messages omitted] {COMPACTED_MARKER}"})
+    return conversation
+
+_store: Optional[SessionStore] = None
+
+def get_session_store() -> SessionStore:
+    global _store
+    if _store is None:
+        _store = SessionStore()
+    return _store
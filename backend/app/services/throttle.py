@@ -0,0 +1,110 @@
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Optional
+import httpx
+from app.services.metrics import HTTP_RETRIES
+from app.config import (
+    TARGET_PER_PROVIDER, TARGET_RATE_PER_SEC, TARGET_BURST,
+    REGRESSION_PER_PROVIDER, REGRESSION_RATE_PER_SEC, REGRESSION_BURST
+)
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+def provider_of(model: str) -> str:
+    """'anthropic/claude-3.5-sonnet' -> 'anthropic'"""
+    return model.split("/", 1)[0].lower() if "/" in model else model.lower()
+
+class TokenBucket:
+    """Token-bucket rate limiter: `rate` requests/sec with bursts up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class ProviderLimiter:
+    """Bounded concurrency plus a token bucket for each model provider"""
+
+    def __init__(self, concurrency: int, rate: float = 0.0, burst: float = 1.0):
+        self.concurrency = concurrency
+        self.rate = rate
+        self.burst = burst
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    @asynccontextmanager
+    async def slot(self, model: str):
+        provider = provider_of(model)
+        if provider not in self._semaphores:
+            self._semaphores[provider] = asyncio.Semaphore(self.concurrency)
+            self._buckets[provider] = TokenBucket(self.rate, self.burst)
+        async with self._semaphores[provider]:
+            await self._buckets[provider].acquire()
+            yield
+
+_target_limiter: Optional[ProviderLimiter] = None
+_regression_limiter: Optional[ProviderLimiter] = None
+
+def get_target_limiter() -> ProviderLimiter:
+    """Process-wide limiter for agent target calls, shared by every session"""
+    global _target_limiter
+    if _target_limiter is None:
+        _target_limiter = ProviderLimiter(TARGET_PER_PROVIDER, TARGET_RATE_PER_SEC, TARGET_BURST)
+    return _target_limiter
+
+def get_regression_limiter() -> ProviderLimiter:
+    """Process-wide limiter for regression probes, shared by concurrent runs"""
+    global _regression_limiter
+    if _regression_limiter is None:
+        _regression_limiter = ProviderLimiter(REGRESSION_PER_PROVIDER, REGRESSION_RATE_PER_SEC, REGRESSION_BURST)
+    return _regression_limiter
+
+def _retry_after(response: httpx.Response) -> Optional[float]:
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+async def with_retries(
+    send: Callable[[], Awaitable[httpx.Response]],
+    retries: int = 3,
+    base_delay: float = 1.0,
+    max_delay: float = 30.0
+) -> httpx.Response:
+    """Call `send` until it succeeds, backing off on 429/5xx and transport errors"""
+    for attempt in range(retries + 1):
+        try:
+            response = await send()
+        except httpx.TransportError:
+            if attempt == retries:
+                raise
+            HTTP_RETRIES.inc(reason="transport")
+            delay = None
+        else:
+            if response.status_code not in RETRY_STATUSES or attempt == retries:
+                response.raise_for_status()
+                return response
+            HTTP_RETRIES.inc(reason=response.status_code)
+            delay = _retry_after(response)
+
+        if delay is None:
+            delay = min(max_delay, base_delay * 2 ** attempt) * (0.5 + random.random() / 2)
+        await asyncio.sleep(min(delay, max_delay))
@@ -0,0 +1,274 @@
+import asyncio
+import time
+from collections import defaultdict, deque
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, List, Any, Optional
+from sqlalchemy import insert
+from sqlalchemy.exc import DisconnectionError, OperationalError
+from sqlalchemy.dialects import postgresql, sqlite
+from app.database import AsyncSessionLocal
+from app.models import generate_uuid
+from app.services.metrics import SPAN_SECONDS
+from app.config import WRITE_BUFFER_MAX_BATCH, WRITE_BUFFER_FLUSH_INTERVAL, WRITE_BUFFER_MAX_PENDING
+
+# Called as hook(session, rows) inside the flush transaction with the rows it inserted
+FlushHook = Callable[[Any, List[Dict[str, Any]]], Awaitable[None]]
+
+# Rejected rows kept in memory (metrics()["dead_letters"]) for inspection
+DEAD_LETTER_KEEP = 50
+
+def _transient(error: Exception) -> bool:
+    """A failure of the connection or a lock rather than of the rows: retry them later as they are"""
+    return (
+        isinstance(error, (OperationalError, DisconnectionError, OSError, asyncio.TimeoutError))
+        or getattr(error, "connection_invalidated", False)
+    )
+
+def _column_groups(rows: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    # executemany needs a uniform column set per statement
+    by_columns: Dict[frozenset, List[Dict[str, Any]]] = defaultdict(list)
+    for row in rows:
+        by_columns[frozenset(row)].append(row)
+    return list(by_columns.values())
+
+class WriteBuffer:
+    """Write-behind buffer that collects rows from all sessions and bulk-inserts them"""
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        max_batch: int = WRITE_BUFFER_MAX_BATCH,
+        flush_interval: float = WRITE_BUFFER_FLUSH_INTERVAL,
+        max_pending: int = WRITE_BUFFER_MAX_PENDING
+    ):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending: Dict[Any, List[Dict[str, Any]]] = defaultdict(list)
+        self._count = 0
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._hooks: Dict[Any, List[FlushHook]] = defaultdict(list)
+
+        # Flush statistics
+        self.rows_written = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+        self.hook_failures = 0
+        self.rejected = 0
+        self.dead_letters: deque = deque(maxlen=DEAD_LETTER_KEEP)
+        self.flush_time_total = 0.0
+        self.last_flush_ms = 0.0
+
+    def add(self, model, **values) -> str:
+        """Queue a row for insertion and return its (client-generated) id immediately"""
+        values.setdefault("id", generate_uuid())
+        if "timestamp" in model.__table__.c and values.get("timestamp") is None:
+            # Stamp now rather than at flush time, which may be a few hundred ms later
+            values["timestamp"] = datetime.now(timezone.utc)
+
+        self._pending[model].append(values)
+        self._count += 1
+        self._ensure_started()
+        if self._count >= self.max_batch:
+            self._wakeup.set()
+        return values["id"]
+
+    def add_many(self, model, rows: List[Dict[str, Any]]) -> List[str]:
+        """Queue several rows together so they are inserted in the same flush (one executemany)"""
+        return [self.add(model, **values) for values in rows]
+
+    def on_flush(self, model, hook: FlushHook):
+        """Register a hook run with each flushed batch of `model` rows, in the same transaction"""
+        if hook not in self._hooks[model]:
+            self._hooks[model].append(hook)
+
+    @asynccontextmanager
+    async def exclusive(self):
+        """Flush, then hold off further flushes for the duration of the block"""
+        await self.flush()
+        async with self._flush_lock:
+            yield
+
+    @staticmethod
+    def _insert(model, dialect: str):
+        """Bulk insert that skips rows already present (e.g. replayed after a crash)"""
+        if dialect == "sqlite":
+            return sqlite.insert(model).on_conflict_do_nothing()
+        if dialect == "postgresql":
+            return postgresql.insert(model).on_conflict_do_nothing()
+        return insert(model)
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Write all pending rows in one transaction. Returns the number of rows written."""
+        async with self._flush_lock:
+            if not self._count:
+                return 0
+            pending, count = self._pending, self._count
+            self._pending, self._count = defaultdict(list), 0
+
+            started = time.perf_counter()
+            try:
+                await self._write(pending)
+            except asyncio.CancelledError:
+                self._requeue(pending, count)
+                raise
+            except Exception as e:
+                self.failures += 1
+                if _transient(e):
+                    self._requeue(pending, count)
+                    print(f"⚠️ Write buffer flush of {count} rows failed: {e}")
+                    return 0
+                print(f"⚠️ Write buffer flush of {count} rows failed, retrying in smaller batches: {e}")
+                count = await self._isolate(pending)
+                if not count:
+                    return 0
+
+            elapsed = time.perf_counter() - started
+            SPAN_SECONDS.observe(elapsed, span="db_flush", name="write_buffer")
+            self.rows_written += count
+            self.batches += 1
+            self.flush_time_total += elapsed
+            self.last_flush_ms = elapsed * 1000
+            return count
+
+    async def _write(self, pending: Dict[Any, List[Dict[str, Any]]]):
+        """
+        Insert rows and run their flush hooks in one transaction. Hooks see only the
+        rows actually inserted, not ones skipped as already present.
+        """
+        async with self.session_factory() as session:
+            dialect = session.bind.dialect
+            inserted: Dict[Any, List[Dict[str, Any]]] = defaultdict(list)
+            for model, rows in pending.items():
+                for group in _column_groups(rows):
+                    stmt = self._insert(model, dialect.name)
+                    if not self._hooks.get(model):
+                        await session.execute(stmt, group)
+                    elif dialect.insert_executemany_returning:
+                        result = await session.execute(stmt.returning(model.__table__.c.id), group)
+                        ids = set(result.scalars().all())
+                        inserted[model].extend(row for row in group if row["id"] in ids)
+                    else:
+                        # Plain INSERT: a duplicate fails the batch instead of being skipped
+                        await session.execute(stmt, group)
+                        inserted[model].extend(group)
+            for model, rows in inserted.items():
+                for hook in self._hooks.get(model, ()):
+                    if rows:
+                        await self._run_hook(session, hook, rows)
+            await session.commit()
+
+    async def _isolate(self, pending: Dict[Any, List[Dict[str, Any]]]) -> int:
+        """
+        After a failed batch, write each model/column group on its own, then the rows
+        of a failing group one by one. Rows that fail alone are rejected rather than
+        requeued, so one bad row cannot hold up every later flush. Returns rows written.
+        """
+        work = [(model, group) for model, rows in pending.items() for group in _column_groups(rows)]
+        written = 0
+        while work:
+            model, rows = work.pop(0)
+            try:
+                await self._write({model: rows})
+                written += len(rows)
+            except asyncio.CancelledError:
+                for model, rows in [(model, rows)] + work:
+                    self._requeue({model: rows}, len(rows))
+                raise
+            except Exception as e:
+                if _transient(e):
+                    self._requeue({model: rows}, len(rows))
+                elif len(rows) > 1:
+                    work[:0] = [(model, [row]) for row in rows]
+                else:
+                    self._reject(model, rows[0], e)
+        return written
+
+    def _reject(self, model, row: Dict[str, Any], error: Exception):
+        self.rejected += 1
+        self.dead_letters.append({
+            "table": model.__tablename__,
+            "id": row.get("id"),
+            "error": str(getattr(error, "orig", None) or error)[:300],
+            "at": datetime.now(timezone.utc).isoformat()
+        })
+        print(f"⚠️ Write buffer rejected {model.__tablename__} row {row.get('id')}: {self.dead_letters[-1]['error']}")
+
+    async def _run_hook(self, session, hook: FlushHook, rows: List[Dict[str, Any]]):
+        # A savepoint, so a failing hook loses only its own work and never the rows
+        try:
+            async with session.begin_nested():
+                await hook(session, rows)
+        except Exception as e:
+            self.hook_failures += 1
+            print(f"⚠️ Write buffer flush hook {getattr(hook, '__name__', hook)} failed: {e}")
+
+    def _requeue(self, pending: Dict[Any, List[Dict[str, Any]]], count: int):
+        """Put failed rows back in front of anything queued meanwhile, within max_pending"""
+        for model, rows in pending.items():
+            self._pending[model][:0] = rows
+        self._count += count
+        while self._count > self.max_pending:
+            model = next(m for m, rows in self._pending.items() if rows)
+            self._pending[model].pop(0)
+            self._count -= 1
+            self.dropped += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "pending": self._count,
+            "rows_written": self.rows_written,
+            "batches": self.batches,
+            "failures": self.failures,
+            "dropped": self.dropped,
+            "hook_failures": self.hook_failures,
+            "rejected": self.rejected,
+            "dead_letters": list(self.dead_letters),
+            "avg_batch_rows": round(self.rows_written / self.batches, 1) if self.batches else 0.0,
+            "avg_flush_ms": round(self.flush_time_total / self.batches * 1000, 3) if self.batches else 0.0,
+            "last_flush_ms": round(self.last_flush_ms, 3)
+        }
+
+    async def close(self):
+        """Stop the background flusher and write whatever is still pending"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+_buffer: Optional[WriteBuffer] = None
+
+def get_write_buffer() -> WriteBuffer:
+    """Return the app-wide write buffer, creating it on first use"""
+    global _buffer
+    if _buffer is None:
+        _buffer = WriteBuffer()
+    return _buffer
+
+async def close_write_buffer():
+    global _buffer
+    if _buffer is not None:
+        await _buffer.close()
+        _buffer = None
@@ -0,0 +1,93 @@
+"""
+Cost of budget accounting on the call path and of its periodic persistence.
+
+    cd backend && python -m benchmarks.bench_budget --calls 100000 --sessions 1000 --users 50
+
+Charges --calls synthetic completions spread over --sessions sessions, --users
+users and the catalog's models, checking the limits before each (as the agent
+does), then flushes to a temporary SQLite database. Reports per-call charge and
+check time, flush time for the resulting bucket rows, the day-total reload every
+flush performs, and the report queries the dashboards run.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+from app.database import build_engine
+from app.models import Base
+from app.services.budget import AGENT, TARGET, BudgetTracker, spend_report, spend_timeseries
+from app.services.model_catalog import ModelCatalog
+
+def make_catalog(models: int) -> ModelCatalog:
+    catalog = ModelCatalog(snapshot_path=os.devnull)
+    catalog._snapshot_loaded = True
+    catalog._index([
+        {"id": f"provider{i % 20}/model-{i}", "pricing": {"prompt": "0.000003", "completion": "0.000015"}}
+        for i in range(models)
+    ])
+    return catalog
+
+async def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = build_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'budget.db')}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        catalog = make_catalog(args.models)
+        tracker = BudgetTracker(
+            session_factory, catalog,
+            limits={"session": (1000.0, 0), "user": (10000.0, 0), "global": (0.0, 10 ** 12)},
+            persist_interval=0
+        )
+        await tracker.prepare()
+
+        rng = random.Random(7)
+        sessions = [f"session-{i}" for i in range(args.sessions)]
+        users = [f"user-{i}" for i in range(args.users)]
+        models = [m["id"] for m in catalog.models]
+        calls = [
+            (rng.choice(sessions), rng.choice(users), rng.choice(models), rng.choice((AGENT, TARGET)))
+            for _ in range(args.calls)
+        ]
+        usage = {"prompt_tokens": 1200, "completion_tokens": 300}
+
+        started = time.perf_counter()
+        for session_id, user_id, _, _ in calls:
+            tracker.exceeded(session_id, user_id)
+        check_s = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for session_id, user_id, model, kind in calls:
+            tracker.charge(model, usage, kind, session_id=session_id, user_id=user_id)
+        charge_s = time.perf_counter() - started
+        print(f"check  {check_s / args.calls * 1e6:6.2f} us/call")
+        print(f"charge {charge_s / args.calls * 1e6:6.2f} us/call ({len(tracker._pending)} pending bucket rows)")
+
+        started = time.perf_counter()
+        rows = await tracker.flush(reload=False)
+        print(f"flush  {(time.perf_counter() - started) * 1000:8.1f} ms for {rows} rows")
+
+        started = time.perf_counter()
+        await tracker.flush()
+        print(f"reload {(time.perf_counter() - started) * 1000:8.1f} ms (day totals for {args.users} users)")
+
+        async with session_factory() as db:
+            for group_by in ("model", "provider", "user", "session"):
+                started = time.perf_counter()
+                report = await spend_report(db, group_by=group_by, days=1)
+                print(f"report by {group_by:<8} {(time.perf_counter() - started) * 1000:8.1f} ms ({len(report)} rows)")
+            started = time.perf_counter()
+            series = await spend_timeseries(db, granularity="hour", days=1)
+            print(f"timeseries by hour {(time.perf_counter() - started) * 1000:8.1f} ms ({len(series)} buckets)")
+        await engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=100000)
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--models", type=int, default=40)
+    asyncio.run(main(parser.parse_args()))
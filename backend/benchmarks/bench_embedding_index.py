@@ -0,0 +1,120 @@
+"""
+Build time, reopen time and query latency of the semantic (embedding) index.
+
+    cd backend && python -m benchmarks.bench_embedding_index --rows 20000 --queries 500
+    EMBEDDING_MODEL=sentence-transformers/all-MiniLM-L6-v2 python -m benchmarks.bench_embedding_index --rows 5000
+
+Indexes a synthetic corpus in which every tenth prompt is a near-duplicate of an
+earlier one (re-spaced, re-cased, leetspeak, a word dropped), then queries with
+fresh variants of indexed prompts and reports p50/p95/p99 latency and recall@k
+(whether the original is in the top k). Also times incremental adds, reopening
+the memory-mapped files and the near-duplicate clustering report.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+from typing import List, Optional
+from app.models import generate_uuid
+from app.services.embedding_index import EmbeddingIndex, load_embedder
+from benchmarks.bench_prompt_search import vocabulary
+
+LEET = str.maketrans({"a": "4", "e": "3", "i": "1", "o": "0", "s": "5"})
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))], 3)
+
+def variant(text: str, rng: random.Random) -> str:
+    """A near-duplicate as found in scraped corpora"""
+    words = text.split()
+    kind = rng.randrange(4)
+    if kind == 0:
+        return "  ".join(words).upper()
+    if kind == 1:
+        return text.translate(LEET)
+    if kind == 2 and len(words) > 5:
+        del words[rng.randrange(len(words))]
+        return " ".join(words)
+    return " ".join(words[:3]) + "\n\n" + " ".join(words[3:]) + " Please answer fully."
+
+def corpus(count: int, rng: random.Random) -> List[tuple]:
+    words, cum_weights = vocabulary(rng)
+    rows = []
+    for i in range(count):
+        if i >= 10 and i % 10 == 0:
+            text = variant(rows[rng.randrange(len(rows))][1], rng)
+        else:
+            text = " ".join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(20, 80)))
+        rows.append((generate_uuid(), text))
+    return rows
+
+async def main(args):
+    rng = random.Random(args.seed)
+    rows = corpus(args.rows, rng)
+    report = {"rows": args.rows}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = EmbeddingIndex(directory=tmp, embedder=load_embedder())
+        started = time.perf_counter()
+        for start in range(0, len(rows), args.chunk):
+            await index.add("prompts", rows[start:start + args.chunk])
+        build = time.perf_counter() - started
+        report["embedder"] = index.embedder.name
+        report["build_s"] = round(build, 2)
+        report["build_rows_per_s"] = round(len(rows) / build)
+        report["index_mb"] = round(os.path.getsize(index.stores["prompts"].vectors_path) / 2 ** 20, 1)
+
+        started = time.perf_counter()
+        reopened = EmbeddingIndex(directory=tmp, embedder=index.embedder)
+        await asyncio.to_thread(reopened._load)
+        report["reopen_ms"] = round((time.perf_counter() - started) * 1000, 1)
+
+        latencies, hits = [], 0
+        for _ in range(args.queries):
+            row_id, text = rows[rng.randrange(len(rows))]
+            started = time.perf_counter()
+            results = reopened._search("prompts", variant(text, rng), args.k)
+            latencies.append((time.perf_counter() - started) * 1000)
+            hits += any(result_id == row_id for result_id, _ in results)
+        report["query_ms"] = {p: percentile(latencies, p) for p in (50, 95, 99)}
+        report[f"recall_at_{args.k}"] = round(hits / args.queries, 3)
+
+        extra = corpus(args.add, rng)
+        started = time.perf_counter()
+        await reopened.add("prompts", extra)
+        report["incremental_add_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        report["incremental_rows"] = args.add
+
+        if args.dedupe_rows:
+            subset = EmbeddingIndex(directory=os.path.join(tmp, "subset"), embedder=index.embedder)
+            await subset.add("prompts", rows[:args.dedupe_rows])
+            started = time.perf_counter()
+            clusters = await asyncio.to_thread(subset.clusters, "prompts", args.threshold)
+            report["dedupe"] = {
+                "rows": min(args.dedupe_rows, len(rows)),
+                "threshold": args.threshold,
+                "clusters": len(clusters),
+                "duplicate_rows": sum(len(c) for c in clusters) - len(clusters),
+                "planted_duplicates": sum(1 for i in range(10, min(args.dedupe_rows, len(rows)), 10)),
+                "elapsed_s": round(time.perf_counter() - started, 2),
+            }
+
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--chunk", type=int, default=1000, help="rows embedded per add() call")
+    parser.add_argument("--add", type=int, default=100, help="rows in the incremental add")
+    parser.add_argument("--dedupe-rows", type=int, default=5000, help="rows in the clustering report (0 to skip)")
+    parser.add_argument("--threshold", type=float, default=0.85)
+    parser.add_argument("--seed", type=int, default=7)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,94 @@
+"""
+Agent iterations and wall time: one tool call per turn vs. batched tool calls.
+
+    cd backend && python -m benchmarks.bench_multi_tool --agent-latency 0.8 --tool-latency 0.3
+
+A scripted agent model (served through an in-process httpx transport, no network)
+performs the same lookups either one per turn or as a single array of calls.
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+import httpx
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from app.config import AGENT_MODEL
+from app.migrations import upgrade
+from app.services.http_pool import HttpPool
+from app.services.lupin_agent import LupinAgent
+from app.services.model_catalog import ModelCatalog
+from app.services.prompt_search import ensure_search_index
+
+LOOKUPS = [
+    {"tool": "query_db", "args": {"search": "roleplay"}},
+    {"tool": "query_db", "args": {"search": "developer mode"}},
+    {"tool": "list_models", "args": {"provider": "anthropic"}},
+    {"tool": "list_models", "args": {"provider": "openai"}},
+]
+FINAL = "Here is what I found."
+
+def scripts():
+    return {
+        "sequential": [json.dumps(call) for call in LOOKUPS] + [FINAL],
+        "batched": [json.dumps(LOOKUPS), FINAL],
+    }
+
+def sse(text: str) -> bytes:
+    chunks = [text[i:i + 16] for i in range(0, len(text), 16)]
+    lines = [f"data: {json.dumps({'choices': [{'delta': {'content': c}}]})}\n\n" for c in chunks]
+    return ("".join(lines) + "data: [DONE]\n\n").encode()
+
+def make_transport(script, agent_latency: float, tool_latency: float) -> httpx.MockTransport:
+    replies = iter(script)
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/models"):
+            await asyncio.sleep(tool_latency)
+            data = [{"id": f"{p}/model-{i}", "name": f"{p} {i}"} for p in ("anthropic", "openai") for i in range(5)]
+            return httpx.Response(200, json={"data": data})
+        body = json.loads(request.content)
+        assert body["model"] == AGENT_MODEL
+        await asyncio.sleep(agent_latency)
+        return httpx.Response(200, content=sse(next(replies)), headers={"Content-Type": "text/event-stream"})
+
+    return httpx.MockTransport(handler)
+
+async def run_once(mode: str, agent_latency: float, tool_latency: float):
+    engine = create_async_engine("sqlite+aiosqlite://")
+    async with engine.begin() as conn:
+        await conn.run_sync(upgrade)
+        await conn.run_sync(ensure_search_index)
+    session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+    http = HttpPool(transport=make_transport(scripts()[mode], agent_latency, tool_latency))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # A cold catalog for each run, so the first list_models costs a round trip
+        catalog = ModelCatalog(http=http, api_key="bench", snapshot_path=os.path.join(tmp, "catalog.json"))
+
+        started = time.perf_counter()
+        agent = LupinAgent(session_factory, api_key="bench", http=http, catalog=catalog)
+        async for event in agent.run("Survey known roleplay jailbreaks and candidate targets"):
+            if event["type"] == "complete":
+                iterations = event["iterations"]
+        elapsed = time.perf_counter() - started
+
+    await http.aclose()
+    await engine.dispose()
+    return iterations, elapsed
+
+async def main(agent_latency: float, tool_latency: float):
+    results = {mode: await run_once(mode, agent_latency, tool_latency) for mode in ("sequential", "batched")}
+    for mode, (iterations, elapsed) in results.items():
+        print(f"{mode:>10}: {iterations} iterations, {elapsed:.2f}s")
+    seq, bat = results["sequential"], results["batched"]
+    print(f"saved {seq[0] - bat[0]} iterations and {seq[1] - bat[1]:.2f}s (x{seq[1] / bat[1]:.1f})")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--agent-latency", type=float, default=0.8, help="seconds per agent-model call")
+    parser.add_argument("--tool-latency", type=float, default=0.3, help="seconds per /models call")
+    args = parser.parse_args()
+    asyncio.run(main(args.agent_latency, args.tool_latency))
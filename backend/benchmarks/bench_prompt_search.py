@@ -0,0 +1,99 @@
+"""
+Compare LIKE scans against the full-text index used by query_db.
+
+    cd backend && python -m benchmarks.bench_prompt_search --sizes 10000,100000,1000000
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import statistics
+import tempfile
+import time
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from app.models import Base, Prompt, generate_uuid
+from app.services.prompt_search import ensure_search_index, search_prompts
+
+WORDS = (
+    "ignore previous instructions system prompt roleplay developer mode grandmother "
+    "story hypothetical fiction character unrestricted assistant token reveal secret "
+    "policy override translate encode base64 poem persona simulation jailbreak dan "
+    "research academic chemistry recipe malware exploit bypass filter safety guideline"
+).split()
+
+QUERIES = ["developer mode", "grandmother story", "base64 encode secret", "unrestricted persona", "chemistry"]
+
+def vocabulary(rng: random.Random, size: int = 20000):
+    """Real corpora are Zipf-distributed: a few common terms and a long tail"""
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    tail = ["".join(rng.choices(letters, k=rng.randint(4, 10))) for _ in range(size)]
+    words = tail[:50] + WORDS + tail[50:]
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(words))))
+    return words, cum_weights
+
+def make_rows(count: int, rng: random.Random):
+    words, cum_weights = vocabulary(rng)
+    for _ in range(count):
+        yield {
+            "id": generate_uuid(),
+            "content": " ".join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(20, 60))),
+            "category": rng.choice(["jailbreak", "system_prompt", "injection"]),
+            "success_rate": rng.random(),
+        }
+
+async def load(engine, count: int, chunk: int = 10000):
+    rng = random.Random(count)
+    rows = make_rows(count, rng)
+    async with engine.begin() as conn:
+        while True:
+            batch = [row for _, row in zip(range(chunk), rows)]
+            if not batch:
+                break
+            await conn.execute(insert(Prompt), batch)
+
+async def time_queries(session_factory, use_fts: bool, repeat: int) -> list:
+    timings = []
+    async with session_factory() as db:
+        for _ in range(repeat):
+            for q in QUERIES:
+                started = time.perf_counter()
+                await search_prompts(db, search=q, limit=5, use_fts=use_fts)
+                timings.append((time.perf_counter() - started) * 1000)
+    return timings
+
+async def bench(size: int, repeat: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+            await conn.run_sync(ensure_search_index)
+
+        started = time.perf_counter()
+        await load(engine, size)
+        load_s = time.perf_counter() - started
+
+        session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        like = await time_queries(session_factory, use_fts=False, repeat=repeat)
+        fts = await time_queries(session_factory, use_fts=True, repeat=repeat)
+        await engine.dispose()
+
+    print(
+        f"{size:>9,} rows | load {load_s:6.1f}s | "
+        f"LIKE p50 {statistics.median(like):8.2f}ms max {max(like):8.2f}ms | "
+        f"FTS p50 {statistics.median(fts):7.2f}ms max {max(fts):7.2f}ms | "
+        f"speedup x{statistics.median(like) / statistics.median(fts):.1f}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for size in (int(s) for s in args.sizes.split(",")):
+        asyncio.run(bench(size, args.repeat))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Import time and boot-to-ready time of the app, cold and on restart.
+
+    cd backend && python -m benchmarks.bench_startup --imports 5 --restarts 3 --workers 1,4
+
+Import time is measured in fresh interpreters (`import main`), with the slowest
+modules from one `-X importtime` run. Boot time starts uvicorn as a subprocess
+against a temporary SQLite database and catalog snapshot (no network needed) and
+times the port answering /health and every worker answering /ready. The first
+boot applies all migrations (cold); later boots reuse the database (restart).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+import httpx
+from benchmarks.load_chat import BACKEND_DIR, free_port
+
+def import_seconds(env: Dict[str, str]) -> float:
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+def slowest_imports(env: Dict[str, str], top: int) -> List[tuple]:
+    """(cumulative ms, module) for the slowest packages (at any depth) and app modules"""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        module = name.strip()
+        if cumulative.strip().isdigit() and (module.startswith(("app.", "main")) or "." not in module):
+            rows.append((int(cumulative) / 1000, module))
+    return sorted(rows, reverse=True)[:top]
+
+def write_snapshot(path: str, models: int):
+    catalog = [
+        {"id": f"provider{i % 40}/model-{i}", "name": f"Model {i}", "pricing": {"prompt": "0.000001", "completion": "0.000002"}}
+        for i in range(models)
+    ]
+    with open(path, "w") as f:
+        json.dump({"fetched_at": time.time(), "etag": None, "models": catalog}, f)
+
+def boot(env: Dict[str, str], workers: int, timeout: float) -> Dict[str, Optional[float]]:
+    port = free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    listening, ready, ready_pids, steps = None, None, set(), {}
+    try:
+        while time.perf_counter() - started < timeout and ready is None:
+            try:
+                # A new connection per poll so the kernel spreads them across workers
+                with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=1.0) as client:
+                    if listening is None and client.get("/health").status_code == 200:
+                        listening = time.perf_counter() - started
+                    response = client.get("/ready")
+                    if response.status_code == 200:
+                        body = response.json()
+                        ready_pids.add(body["pid"])
+                        steps = {name: step.get("ms") for name, step in body["steps"].items()}
+                        if len(ready_pids) >= workers:
+                            ready = time.perf_counter() - started
+            except httpx.HTTPError:
+                pass
+            time.sleep(0.01)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    return {"listening_s": listening, "ready_s": ready, "steps_ms": steps}
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot = os.path.join(tmp, "model_catalog.json")
+        write_snapshot(snapshot, args.models)
+        base_env = dict(
+            os.environ,
+            MODEL_CATALOG_SNAPSHOT=snapshot,
+            EMBEDDING_INDEX_DIR=os.path.join(tmp, "embedding_index"),
+            RESPONSE_CACHE_MODE="off",
+        )
+
+        env = dict(base_env, DATABASE_URL=f"sqlite+aiosqlite:///{os.path.join(tmp, 'imports.db')}")
+        samples = [import_seconds(env) for _ in range(args.imports)]
+        print(f"import main: median {statistics.median(samples) * 1000:.0f} ms, min {min(samples) * 1000:.0f} ms ({args.imports} runs)")
+        for ms, module in slowest_imports(env, args.top):
+            print(f"  {ms:8.1f} ms  {module}")
+
+        for workers in args.workers:
+            env = dict(base_env, DATABASE_URL=f"sqlite+aiosqlite:///{os.path.join(tmp, f'boot-{workers}.db')}")
+            for attempt in range(args.restarts):
+                result = boot(env, workers, args.timeout)
+                label = "cold" if attempt == 0 else "restart"
+                listening = f"{result['listening_s'] * 1000:.0f} ms" if result["listening_s"] else "n/a"
+                ready = f"{result['ready_s'] * 1000:.0f} ms" if result["ready_s"] else f"not ready after {args.timeout:.0f} s"
+                print(f"{workers} worker(s) {label:<8} | /health {listening:>8} | /ready {ready:>8} | steps {result['steps_ms']}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--imports", type=int, default=5, help="fresh-interpreter import samples")
+    parser.add_argument("--top", type=int, default=12, help="slowest imports to list")
+    parser.add_argument("--restarts", type=int, default=3, help="boots per worker count (first is cold)")
+    parser.add_argument("--workers", type=lambda s: [int(n) for n in s.split(",")], default=[1, 4])
+    parser.add_argument("--models", type=int, default=400, help="models in the catalog snapshot")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    main(parser.parse_args())
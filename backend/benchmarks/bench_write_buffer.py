@@ -0,0 +1,93 @@
+"""
+Attempt-write throughput: inline commit per attempt vs the write-behind buffer.
+
+    cd backend && python -m benchmarks.bench_write_buffer --agents 1,10,50 --attempts 100
+
+Runs N concurrent simulated agents against a SQLite database in WAL mode.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from sqlalchemy import event, select, func
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from app.models import Base, Attempt, generate_uuid
+from app.services.write_buffer import WriteBuffer
+
+RESPONSE = "Sure, here is a long and detailed answer. " * 20
+
+def make_engine(path: str):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _pragmas(dbapi_conn, _):
+        cursor = dbapi_conn.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA busy_timeout=30000")
+        cursor.close()
+
+    return engine
+
+def attempt_values(session_id: str, i: int) -> dict:
+    return {
+        "session_id": session_id,
+        "prompt": f"probe {i}",
+        "response": RESPONSE,
+        "success": i % 3 == 0,
+        "model_name": "anthropic/claude-3.5-sonnet",
+    }
+
+async def inline_agent(session_factory, attempts: int):
+    session_id = generate_uuid()
+    async with session_factory() as db:
+        for i in range(attempts):
+            db.add(Attempt(**attempt_values(session_id, i)))
+            await db.commit()
+
+async def buffered_agent(buffer: WriteBuffer, attempts: int):
+    session_id = generate_uuid()
+    for i in range(attempts):
+        buffer.add(Attempt, **attempt_values(session_id, i))
+        await asyncio.sleep(0)  # the agent loop yields between probes
+
+async def bench(mode: str, agents: int, attempts: int) -> float:
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(os.path.join(tmp, "bench.db"))
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        session_factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+        started = time.perf_counter()
+        if mode == "inline":
+            await asyncio.gather(*(inline_agent(session_factory, attempts) for _ in range(agents)))
+        else:
+            buffer = WriteBuffer(session_factory=session_factory)
+            await asyncio.gather(*(buffered_agent(buffer, attempts) for _ in range(agents)))
+            await buffer.close()
+        elapsed = time.perf_counter() - started
+
+        async with session_factory() as db:
+            written = (await db.execute(select(func.count(Attempt.id)))).scalar()
+        assert written == agents * attempts, f"expected {agents * attempts} rows, found {written}"
+        await engine.dispose()
+    return elapsed
+
+async def main(agent_counts, attempts: int):
+    for agents in agent_counts:
+        inline = await bench("inline", agents, attempts)
+        buffered = await bench("buffered", agents, attempts)
+        total = agents * attempts
+        print(
+            f"{agents:>4} agents x {attempts} attempts | "
+            f"inline {total / inline:9,.0f} rows/s | "
+            f"buffered {total / buffered:9,.0f} rows/s | x{inline / buffered:.1f}"
+        )
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--agents", default="1,10,50")
+    parser.add_argument("--attempts", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(main([int(n) for n in args.agents.split(",")], args.attempts))
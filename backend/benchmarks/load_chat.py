@@ -0,0 +1,183 @@
+"""
+End-to-end load test of /api/chat/lupin/stream against the mock OpenRouter server.
+
+    cd backend && python -m benchmarks.load_chat --clients 20 --sessions 100 --latency lognormal:0.3:0.4
+
+Starts benchmarks.mock_openrouter and the main.py app (uvicorn, fresh SQLite DB)
+as subprocesses, then runs --sessions agent sessions with --clients in flight.
+Reports p50/p95/p99 time to first event (the session event) and to the first
+agent event, agent iterations/sec, write-buffer flush latency and app RSS growth
+per session. Pass --app-url to load an already running app instead.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, Any, List, Optional
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return round(ordered[index], 1)
+
+def rss_kb(pid: int) -> Optional[int]:
+    """Resident set size of a process (Linux /proc only)"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+async def wait_ready(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+async def one_session(client: httpx.AsyncClient, app_url: str, index: int) -> Dict[str, Any]:
+    result = {"first_event_ms": None, "first_agent_event_ms": None, "iterations": 0, "errors": 0, "events": 0}
+    started = time.perf_counter()
+    payload = {"message": f"Find a roleplay jailbreak that works on Claude (client {index})"}
+    try:
+        async with client.stream("POST", f"{app_url}/api/chat/lupin/stream", json=payload) as response:
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                elapsed_ms = (time.perf_counter() - started) * 1000
+                event = json.loads(line[6:])
+                result["events"] += 1
+                if result["first_event_ms"] is None:
+                    result["first_event_ms"] = elapsed_ms
+                if event["type"] != "session" and result["first_agent_event_ms"] is None:
+                    result["first_agent_event_ms"] = elapsed_ms
+                if event["type"] == "error":
+                    result["errors"] += 1
+                elif event["type"] == "complete":
+                    result["iterations"] = event.get("iterations", 0)
+    except httpx.HTTPError:
+        result["errors"] += 1
+    result["elapsed_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+async def run_load(app_url: str, clients: int, sessions: int) -> Dict[str, Any]:
+    limit = asyncio.Semaphore(clients)
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+
+    async with httpx.AsyncClient(timeout=120.0, limits=limits) as client:
+        async def bounded(index: int):
+            async with limit:
+                return await one_session(client, app_url, index)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*[bounded(i) for i in range(sessions)])
+        wall = time.perf_counter() - started
+        write_buffer = (await client.get(f"{app_url}/health/write-buffer")).json()
+
+    iterations = sum(r["iterations"] for r in results)
+    first = [r["first_event_ms"] for r in results if r["first_event_ms"] is not None]
+    first_agent = [r["first_agent_event_ms"] for r in results if r["first_agent_event_ms"] is not None]
+    session_ms = [r["elapsed_ms"] for r in results]
+    return {
+        "sessions": sessions,
+        "clients": clients,
+        "wall_s": round(wall, 2),
+        "errors": sum(r["errors"] for r in results),
+        "iterations": iterations,
+        "iterations_per_s": round(iterations / wall, 1),
+        "sessions_per_s": round(sessions / wall, 2),
+        "first_event_ms": {p: percentile(first, p) for p in (50, 95, 99)},
+        "first_agent_event_ms": {p: percentile(first_agent, p) for p in (50, 95, 99)},
+        "session_ms": {p: percentile(session_ms, p) for p in (50, 95, 99)},
+        "db_write": {
+            "rows": write_buffer.get("rows_written"),
+            "batches": write_buffer.get("batches"),
+            "avg_flush_ms": write_buffer.get("avg_flush_ms"),
+            "last_flush_ms": write_buffer.get("last_flush_ms"),
+        },
+    }
+
+def start_stack(tmp: str, args) -> tuple:
+    mock_port, app_port = free_port(), free_port()
+    mock = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.mock_openrouter", "--port", str(mock_port),
+         "--latency", args.latency, "--token-delay", str(args.token_delay), "--rate-limit", str(args.rate_limit)],
+        cwd=BACKEND_DIR
+    )
+    env = {
+        **os.environ,
+        "OPENROUTER_BASE_URL": f"http://127.0.0.1:{mock_port}",
+        "OPENROUTER_API_KEY": "bench",
+        "DATABASE_URL": f"sqlite+aiosqlite:///{os.path.join(tmp, 'bench.db')}",
+        "MODEL_CATALOG_SNAPSHOT": os.path.join(tmp, "model_catalog.json"),
+        "RESPONSE_CACHE_MODE": "off",
+    }
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(app_port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL
+    )
+    return mock, app, f"http://127.0.0.1:{mock_port}", f"http://127.0.0.1:{app_port}"
+
+async def main(args):
+    processes = []
+    with tempfile.TemporaryDirectory() as tmp:
+        try:
+            if args.app_url:
+                app_url, app_pid = args.app_url.rstrip("/"), None
+            else:
+                mock, app, mock_url, app_url = start_stack(tmp, args)
+                processes = [app, mock]
+                app_pid = app.pid
+                await wait_ready(f"{mock_url}/stats")
+            await wait_ready(f"{app_url}/health")
+
+            # Warm-up session so imports, DB migrations and the model catalog are not measured
+            async with httpx.AsyncClient(timeout=120.0) as client:
+                await one_session(client, app_url, -1)
+            rss_before = rss_kb(app_pid) if app_pid else None
+
+            report = await run_load(app_url, args.clients, args.sessions)
+
+            rss_after = rss_kb(app_pid) if app_pid else None
+            if rss_before is not None and rss_after is not None:
+                report["rss_mb"] = round(rss_after / 1024, 1)
+                report["rss_kb_per_session"] = round((rss_after - rss_before) / args.sessions, 1)
+            print(json.dumps(report, indent=2))
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait(timeout=10)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=10, help="concurrent sessions in flight")
+    parser.add_argument("--sessions", type=int, default=50, help="total sessions to run")
+    parser.add_argument("--latency", default="lognormal:0.2:0.4", help="mock time to first token")
+    parser.add_argument("--token-delay", type=float, default=0.002, help="mock delay between chunks")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="mock 429 probability")
+    parser.add_argument("--app-url", default="", help="load an already running app instead of starting one")
+    asyncio.run(main(parser.parse_args()))
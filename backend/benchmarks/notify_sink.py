@@ -0,0 +1,145 @@
+"""
+Local stand-in for provider disclosure endpoints: a webhook receiver and an SMTP sink.
+
+    cd backend && python -m benchmarks.notify_sink --http-port 8025 --smtp-port 1025 --fail-rate 0.2
+    SMTP_HOST=127.0.0.1 SMTP_PORT=1025 python -m app.cli notify --drain
+
+Register providers with webhook_url http://127.0.0.1:8025/hook/<name>. Both sinks
+record what they receive, keyed by idempotency key (Idempotency-Key header or
+X-Idempotency-Key email header), and count redeliveries. --fail-rate answers
+that share of webhook posts with 503 and of emails with a 451 temporary failure,
+to exercise retries and backoff. GET /received shows the tally.
+"""
+import argparse
+import asyncio
+import random
+from email import message_from_bytes
+from typing import Any, Dict
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+class Tally:
+    def __init__(self):
+        self.keys: Dict[str, Dict[str, Any]] = {}
+        self.deliveries = 0
+        self.redeliveries = 0
+        self.findings = 0
+        self.failed = 0
+
+    def record(self, channel: str, key: str, findings: int, target: str):
+        self.deliveries += 1
+        if key in self.keys:
+            self.redeliveries += 1
+            self.keys[key]["count"] += 1
+            return
+        self.findings += findings
+        self.keys[key] = {"channel": channel, "target": target, "findings": findings, "count": 1}
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "deliveries": self.deliveries,
+            "unique_digests": len(self.keys),
+            "redeliveries": self.redeliveries,
+            "findings": self.findings,
+            "injected_failures": self.failed,
+        }
+
+def create_app(tally: Tally, fail_rate: float = 0.0) -> FastAPI:
+    app = FastAPI(title="Notification sink")
+
+    @app.post("/hook/{name}")
+    async def hook(name: str, request: Request):
+        if fail_rate and random.random() < fail_rate:
+            tally.failed += 1
+            return JSONResponse({"error": "unavailable"}, status_code=503)
+        body = await request.json()
+        key = request.headers.get("idempotency-key") or body.get("idempotency_key", "")
+        tally.record("webhook", key, len(body.get("findings", [])), name)
+        return {"received": key}
+
+    @app.get("/received")
+    async def received():
+        return tally.summary()
+
+    return app
+
+class SmtpSink:
+    """Just enough SMTP (EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT) to accept mail"""
+
+    def __init__(self, tally: Tally, fail_rate: float = 0.0):
+        self.tally = tally
+        self.fail_rate = fail_rate
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        async def reply(line: str):
+            writer.write((line + "\r\n").encode())
+            await writer.drain()
+
+        await reply("220 notify-sink ESMTP")
+        recipients = []
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode(errors="replace").strip()
+                verb = command.split(" ", 1)[0].upper()
+                if verb == "EHLO":
+                    await reply("250-notify-sink")
+                    await reply("250 8BITMIME")
+                elif verb in ("HELO", "NOOP"):
+                    await reply("250 OK")
+                elif verb == "MAIL":
+                    recipients = []
+                    await reply("250 OK")
+                elif verb == "RCPT":
+                    recipients.append(command.split(":", 1)[-1].strip(" <>"))
+                    await reply("250 OK")
+                elif verb == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    data = bytearray()
+                    while True:
+                        chunk = await reader.readline()
+                        if chunk in (b".\r\n", b".\n", b""):
+                            break
+                        data += chunk[1:] if chunk.startswith(b"..") else chunk
+                    if self.fail_rate and random.random() < self.fail_rate:
+                        self.tally.failed += 1
+                        await reply("451 Temporary failure, try again")
+                        continue
+                    message = message_from_bytes(bytes(data))
+                    key = message.get("X-Idempotency-Key") or message.get("Message-ID", "")
+                    findings = sum(1 for l in message.get_payload().splitlines() if l[:1].isdigit() and ". " in l[:6])
+                    self.tally.record("email", key, findings, ",".join(recipients))
+                    await reply("250 OK: queued")
+                elif verb == "RSET":
+                    recipients = []
+                    await reply("250 OK")
+                elif verb == "QUIT":
+                    await reply("221 Bye")
+                    break
+                else:
+                    await reply("502 Command not implemented")
+        finally:
+            writer.close()
+
+async def main(args):
+    import uvicorn
+
+    tally = Tally()
+    smtp = await asyncio.start_server(SmtpSink(tally, args.fail_rate).handle, args.host, args.smtp_port)
+    config = uvicorn.Config(create_app(tally, args.fail_rate), host=args.host, port=args.http_port, log_level="warning")
+    print(f"📮 Webhooks on http://{args.host}:{args.http_port}/hook/<name>, SMTP on {args.host}:{args.smtp_port}")
+    async with smtp:
+        await uvicorn.Server(config).serve()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--http-port", type=int, default=8025)
+    parser.add_argument("--smtp-port", type=int, default=1025)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="share of deliveries to reject temporarily")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    random.seed(args.seed)
+    asyncio.run(main(args))
@@ -1,17 +1,79 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from app.routers import chat
-from app.database import init_db
+from app.routers import chat, regression, admin, jobs, stats
+from app.config import STARTUP_PRELOAD
+from app.database import AsyncSessionLocal, init_db, engine, pool_status, warm_pool
+from app.services.http_pool import HttpPool, use_http_pool, close_http_pool
+from app.services.write_buffer import get_write_buffer, close_write_buffer
+from app.services.model_catalog import get_model_catalog
+from app.services.response_cache import get_response_cache, close_response_cache
+from app.services.session_store import get_session_store
+from app.services.metrics import REGISTRY
+from app.services.job_queue import get_job_queue, close_job_queue
+from app.services.outcome_stats import get_stats_reconciler, close_stats_reconciler
+from app.services.notifier import get_notifier, close_notifier
+from app.services.readiness import get_readiness, close_readiness
+from app.services.budget import get_budget_tracker, close_budget_tracker
+from app.services.archive import get_archiver, close_archiver
+
+async def _embedding_index_preload():
+    from app.services.embedding_index import get_embedding_index
+
+    # Includes the first sync, so semantic queries never wait for one
+    return await get_embedding_index().preload(AsyncSessionLocal)
+
+async def _refusal_model_preload():
+    from app.services.refusal_classifier import get_refusal_classifier
+
+    return await get_refusal_classifier().preload()
+
+async def _http_pool_ready(pool: HttpPool):
+    return pool.metrics()
+
+# Optional components STARTUP_PRELOAD can load behind readiness
+PRELOADS = {
+    "embedding_index": _embedding_index_preload,
+    "refusal_model": _refusal_model_preload,
+}
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup: Initialize database
-    await init_db()
+    # Startup: schema first (everything below uses the tables), then warm-ups that
+    # /ready waits on run in the background while the server starts accepting
+    # One pooled client for all outbound traffic, owned by the app and closed on shutdown
+    app.state.http_pool = use_http_pool(HttpPool())
+    readiness = get_readiness()
+    readiness.expect("schema", "db_pool", "http_pool", "model_catalog")
+    if not await readiness.run("schema", init_db):
+        raise RuntimeError("Database schema could not be initialized")
     print("✅ Database initialized")
+    readiness.start("db_pool", warm_pool)
+    readiness.start("http_pool", lambda: _http_pool_ready(app.state.http_pool))
+    readiness.start("model_catalog", get_model_catalog().preload)
+    for name in STARTUP_PRELOAD:
+        if name in PRELOADS:
+            readiness.start(name, PRELOADS[name], required=False)
+        else:
+            print(f"⚠️ Unknown STARTUP_PRELOAD component '{name}' (known: {', '.join(PRELOADS)})")
+    get_stats_reconciler().start()
+    get_budget_tracker().start()
+    get_archiver().start()
+    await get_notifier().start()
+    await get_job_queue().recover()
     yield
     # Shutdown: cleanup if needed
     print("👋 Shutting down...")
+    await close_readiness()
+    await close_job_queue()
+    await close_budget_tracker()
+    await close_archiver()
+    await close_stats_reconciler()
+    await close_notifier()
+    await close_write_buffer()
+    await close_http_pool()
+    close_response_cache()
 
 app = FastAPI(title="Lupin Backend", version="2.0.0", lifespan=lifespan)
 
@@ -26,6 +88,10 @@ app.add_middleware(
 
 # Include routers
 app.include_router(chat.router, prefix="/api/chat", tags=["chat"])
+app.include_router(regression.router, prefix="/api/regression", tags=["regression"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])
+app.include_router(stats.router, prefix="/api/stats", tags=["stats"])
+app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
 
 @app.get("/")
 async def root():
@@ -35,6 +101,90 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+@app.get("/health/http-pool")
+async def http_pool_health(request: Request):
+    return request.app.state.http_pool.metrics()
+
+@app.get("/ready")
+async def ready():
+    """200 once this worker has finished its required warm-up, 503 until then"""
+    readiness = get_readiness().snapshot()
+    return JSONResponse(readiness, status_code=200 if readiness["ready"] else 503)
+
+@app.get("/health/db")
+async def db_health():
+    return pool_status(engine)
+
+@app.get("/health/write-buffer")
+async def write_buffer_health():
+    return get_write_buffer().metrics()
+
+@app.get("/health/model-catalog")
+async def model_catalog_health():
+    return get_model_catalog().metrics()
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics(request: Request):
+    """Prometheus text exposition of spans, tokens, retries and pool/buffer gauges"""
+    pool = request.app.state.http_pool.metrics()
+    buffer = get_write_buffer().metrics()
+    sessions = get_session_store().metrics()
+    cache = get_response_cache().metrics()
+    job_queue = get_job_queue().metrics()
+    db_pool = pool_status(engine)
+    budget = get_budget_tracker().metrics()
+    return PlainTextResponse(
+        REGISTRY.render({
+            "lupin_http_in_flight": pool["in_flight"],
+            "lupin_http_waiting": pool["waiting"],
+            "lupin_http_errors": pool["errors"],
+            "lupin_write_buffer_pending": buffer["pending"],
+            "lupin_write_buffer_rows_written": buffer["rows_written"],
+            "lupin_write_buffer_dropped": buffer["dropped"],
+            "lupin_write_buffer_rejected": buffer["rejected"],
+            "lupin_sessions_cached": sessions["cached"],
+            "lupin_response_cache_hits": cache["memory_hits"] + cache["disk_hits"],
+            "lupin_response_cache_misses": cache["misses"],
+            "lupin_jobs_queued": job_queue["queued"],
+            "lupin_jobs_running": job_queue["running"],
+            "lupin_db_connections_checked_out": db_pool.get("checkedout", 0),
+            "lupin_db_pool_overflow": db_pool.get("overflow", 0),
+            "lupin_spend_today_usd": budget["global_today"]["spent_usd"],
+            "lupin_tokens_today": budget["global_today"]["tokens"],
+        }),
+        media_type="text/plain; version=0.0.4"
+    )
+
+@app.get("/health/jobs")
+async def jobs_health():
+    return get_job_queue().metrics()
+
+@app.get("/health/stats")
+async def stats_health():
+    return get_stats_reconciler().metrics()
+
+@app.get("/health/budget")
+async def budget_health():
+    return get_budget_tracker().metrics()
+
+@app.get("/health/archive")
+async def archive_health():
+    return get_archiver().metrics()
+
+@app.get("/health/notifications")
+async def notifications_health():
+    return get_notifier().metrics()
+
+@app.get("/health/embedding-index")
+async def embedding_index_health():
+    from app.services.embedding_index import get_embedding_index
+
+    return get_embedding_index().metrics()
+
+@app.get("/health/response-cache")
+async def response_cache_health():
+    return get_response_cache().metrics()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
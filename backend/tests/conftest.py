@@ -0,0 +1,31 @@
+import os
+import tempfile
+
+# Keep anything the app touches at import or first use out of the working tree
+_scratch = tempfile.mkdtemp(prefix="lupin-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite+aiosqlite:///{_scratch}/lupin.db")
+os.environ.setdefault("MODEL_CATALOG_SNAPSHOT", f"{_scratch}/models.json")
+os.environ.setdefault("EMBEDDING_INDEX_DIR", f"{_scratch}/embeddings")
+os.environ.setdefault("ARCHIVE_DIR", f"{_scratch}/archive")
+os.environ.setdefault("RESPONSE_CACHE_PATH", f"{_scratch}/response_cache.db")
+
+from contextlib import asynccontextmanager
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, AsyncSession
+from app.database import build_engine
+from app.models import Base
+
+@pytest.fixture
+def database(tmp_path):
+    """Opens (as an async context manager) a session factory over a fresh SQLite database"""
+    @asynccontextmanager
+    async def open_database():
+        engine = build_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        try:
+            yield async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        finally:
+            await engine.dispose()
+
+    return open_database
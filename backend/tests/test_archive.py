@@ -0,0 +1,99 @@
+import asyncio
+import os
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func, select
+from app.models import ArchivePart, Attempt
+from app.services import archive
+from app.services.archive import Archiver, encode_part, read_part
+
+OLD = datetime(2024, 1, 15, tzinfo=timezone.utc)
+LONG = "Sure, here is exactly how you would do that, step by step. " * 4
+
+def attempts(count, start=OLD):
+    return [
+        {"id": f"a{n:02}", "session_id": "s", "prompt": "You are DAN", "response": LONG if n % 2 else f"no {n}",
+         "success": bool(n % 2), "model_name": "alpha/one", "timestamp": start + timedelta(hours=n), "extra_data": None}
+        for n in range(count)
+    ]
+
+def test_part_round_trips_with_long_texts_stored_once(tmp_path):
+    rows = attempts(6)
+    data, stats = encode_part(rows, ("prompt", "response"))
+    path = tmp_path / "part.jsonl.zst"
+    path.write_bytes(data)
+
+    restored = list(read_part(str(path)))
+    assert [row["id"] for row in restored] == [row["id"] for row in rows]
+    assert [row["response"] for row in restored] == [row["response"] for row in rows]
+    assert restored[0]["timestamp"] == OLD.isoformat()
+    # The short prompt is inlined; the long response is written once for its three rows
+    assert stats["rows"] == 6 and stats["distinct_texts"] == 1
+    assert stats["stored_bytes"] == len(data) < stats["raw_bytes"]
+
+async def seed(session_factory, rows):
+    async with session_factory() as db:
+        db.add_all([Attempt(**row) for row in rows])
+        await db.commit()
+
+async def counts(session_factory):
+    async with session_factory() as db:
+        return await db.scalar(select(func.count()).select_from(Attempt)), await db.scalar(select(func.count()).select_from(ArchivePart))
+
+def archived_files(directory):
+    return sorted(os.path.relpath(os.path.join(root, name), directory) for root, _, names in os.walk(directory) for name in names)
+
+def test_batch_rolls_back_when_rows_vanish_before_the_delete(database, tmp_path, monkeypatch):
+    directory = str(tmp_path / "archive")
+    write_file = archive._write_file
+
+    def write_then_lose_a_row(path, data):
+        write_file(path, data)
+        # Another archiver deletes one of the selected rows before this batch commits
+        with sqlite3.connect(tmp_path / "test.db") as conn:
+            conn.execute("DELETE FROM attempts WHERE id = 'a00'")
+
+    async def scenario():
+        async with database() as session_factory:
+            await seed(session_factory, attempts(4))
+            monkeypatch.setattr(archive, "_write_file", write_then_lose_a_row)
+            result = await Archiver(session_factory, directory=directory, after_days=30).archive()
+            return result, await counts(session_factory)
+
+    result, (remaining, parts) = asyncio.run(scenario())
+    assert result["attempts"] == 0
+    assert remaining == 3 and parts == 0
+    assert archived_files(directory) == []
+
+def test_start_sweeps_files_left_without_a_part_row(database, tmp_path):
+    directory = str(tmp_path / "archive")
+
+    async def scenario():
+        async with database() as session_factory:
+            await seed(session_factory, attempts(3))
+            archiver = Archiver(session_factory, directory=directory, after_days=30, interval=3600)
+            await archiver.archive()
+            kept = archived_files(directory)
+
+            # A worker died after writing these, before (or while) committing their batches
+            orphan, tmp, fresh = (os.path.join(directory, "attempts", "2024-01", name)
+                                  for name in ("dead.jsonl.zst", "dead.jsonl.zst.tmp", "busy.jsonl.zst"))
+            for path in (orphan, tmp, fresh):
+                with open(path, "wb") as f:
+                    f.write(b"partial")
+            long_ago = time.time() - 2 * archive.ORPHAN_GRACE_SECONDS
+            os.utime(orphan, (long_ago, long_ago))
+            os.utime(tmp, (long_ago, long_ago))
+            for path in kept:
+                os.utime(os.path.join(directory, path), (long_ago, long_ago))
+
+            archiver.start()
+            await asyncio.sleep(0.1)
+            await archiver.close()
+            return kept, archiver.metrics()["orphans_removed"]
+
+    kept, removed = asyncio.run(scenario())
+    assert removed == 2 and len(kept) == 1
+    # Recorded parts stay, and so does a recent file whose batch may still be committing
+    assert archived_files(directory) == sorted(kept + [os.path.join("attempts", "2024-01", "busy.jsonl.zst")])
@@ -0,0 +1,95 @@
+import asyncio
+import json
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.routers import admin, chat, jobs, stats
+from app.services.budget import GLOBAL, SESSION, TARGET, USER, BudgetExceeded, BudgetTracker
+from app.services.job_queue import get_job_queue
+from app.services.model_catalog import ModelCatalog
+
+USAGE = {"prompt_tokens": 100, "completion_tokens": 100}
+
+def catalog(tmp_path) -> ModelCatalog:
+    path = tmp_path / "models.json"
+    path.write_text(json.dumps({"models": [{"id": "alpha/one", "pricing": {"prompt": "0.001", "completion": "0.002"}}]}))
+    return ModelCatalog(snapshot_path=str(path))
+
+def tracker(session_factory, tmp_path, **limits) -> BudgetTracker:
+    return BudgetTracker(
+        session_factory, catalog=catalog(tmp_path),
+        limits={SESSION: (0, 0), USER: (0, 0), GLOBAL: (0, 0), **limits}, persist_interval=0
+    )
+
+def test_charge_landing_while_a_session_loads_keeps_its_persisted_spend(database, tmp_path):
+    async def scenario():
+        async with database() as session_factory:
+            earlier = tracker(session_factory, tmp_path)
+            earlier.charge("alpha/one", USAGE, TARGET, session_id="s")
+            await earlier.flush(reload=False)
+
+            budget = tracker(session_factory, tmp_path, session=(0.5, 0))
+            await budget.prepare()
+            loading = asyncio.create_task(budget.prepare("s"))
+            await asyncio.sleep(0)
+            # Another run of the same session charges while this worker reads its history
+            budget.charge("alpha/one", USAGE, TARGET, session_id="s")
+            await loading
+            return budget.status("s")["scopes"][SESSION], budget.exceeded("s")
+
+    spent, verdict = asyncio.run(scenario())
+    assert spent["spent_usd"] == 0.6 and spent["tokens"] == 400
+    assert verdict["scope"] == SESSION
+
+def test_calls_in_flight_overshoot_once_and_later_checks_stop(database, tmp_path):
+    async def scenario():
+        async with database() as session_factory:
+            budget = tracker(session_factory, tmp_path, user=(0.5, 0))
+            await budget.prepare(user_id="u")
+
+            async def call():
+                if budget.exceeded(user_id="u"):
+                    return False
+                await asyncio.sleep(0.01)
+                budget.charge("alpha/one", USAGE, TARGET, user_id="u")
+                return True
+
+            # All three pass the check before any of them is charged
+            first = await asyncio.gather(*(call() for _ in range(3)))
+            second = await asyncio.gather(*(call() for _ in range(3)))
+            await budget.flush(reload=False)
+
+            # A second worker sees the overshoot once it has loaded the day
+            other = tracker(session_factory, tmp_path, user=(0.5, 0))
+            await other.prepare(user_id="u")
+            return first, second, budget.status(user_id="u")["scopes"][USER], other.exceeded(user_id="u")
+
+    first, second, spent, verdict = asyncio.run(scenario())
+    assert first == [True] * 3 and second == [False] * 3
+    assert spent["spent_usd"] == 0.9 and spent["remaining_usd"] == 0.0
+    assert verdict["scope"] == USER and verdict["spent_usd"] == 0.9
+
+class ExhaustedQueue:
+    async def submit(self, message, **kwargs):
+        raise BudgetExceeded({"scope": USER, "id": kwargs["user_id"], "message": "Budget exceeded for user u"})
+
+def test_spent_budget_rejects_new_runs_with_429():
+    app = FastAPI()
+    app.include_router(jobs.router, prefix="/api/jobs")
+    app.include_router(chat.router, prefix="/api/chat")
+    app.dependency_overrides[get_job_queue] = ExhaustedQueue
+    client = TestClient(app)
+
+    for path in ("/api/jobs", "/api/chat/lupin", "/api/chat/lupin/stream"):
+        response = client.post(path, json={"message": "hi", "user_id": "u"})
+        assert response.status_code == 429, path
+        assert response.json()["detail"]["scope"] == USER
+
+def test_spend_and_budget_reports_need_the_admin_token(monkeypatch):
+    monkeypatch.setattr(admin, "ADMIN_TOKEN", "secret")
+    app = FastAPI()
+    app.include_router(stats.router, prefix="/api/stats")
+    client = TestClient(app)
+
+    for path in ("/api/stats/spend", "/api/stats/spend/timeseries", "/api/stats/budget"):
+        assert client.get(path).status_code == 401, path
+        assert client.get(path, headers={"X-Admin-Token": "wrong"}).status_code == 401, path
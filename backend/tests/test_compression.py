@@ -0,0 +1,22 @@
+from app.compression import ZSTD_MAGIC, compress_text, decompress_text, is_compressed
+
+def test_short_text_stays_plain_utf8():
+    stored = compress_text("I cannot help with that.", min_bytes=512)
+    assert stored == "I cannot help with that.".encode("utf-8") and not is_compressed(stored)
+
+def test_long_text_round_trips_compressed():
+    text = "Sure — here is the story, with ünïcödé. " * 100
+    stored = compress_text(text, min_bytes=512)
+    assert stored.startswith(ZSTD_MAGIC) and len(stored) < len(text.encode("utf-8"))
+    assert decompress_text(stored) == text
+    assert decompress_text(memoryview(stored)) == text
+
+def test_incompressible_text_is_kept_plain():
+    text = "".join(chr(0x4E00 + (i * 7919) % 20000) for i in range(400))
+    stored = compress_text(text, min_bytes=16)
+    assert decompress_text(stored) == text
+    assert len(stored) <= len(text.encode("utf-8"))
+
+def test_legacy_values_pass_through():
+    assert decompress_text(None) is None
+    assert decompress_text("a row written before compression") == "a row written before compression"
@@ -0,0 +1,77 @@
+import asyncio
+import multiprocessing
+import numpy as np
+import pytest
+from app.models import Prompt
+from app.services import embedding_index
+from app.services.embedding_index import EmbeddingIndex, HashingEmbedder, VectorStore
+
+DIM = 8
+
+def one_hot(n: int) -> np.ndarray:
+    vector = np.zeros(DIM, dtype=np.float32)
+    vector[n % DIM] = 1.0
+    return vector
+
+def labelled(ids):
+    # Each row's vector encodes its id, so a row mapped to the wrong id is detectable
+    return np.stack([np.full(DIM, float(row_id.split("-")[1]), dtype=np.float32) for row_id in ids])
+
+def test_stores_in_two_workers_stay_in_step(tmp_path):
+    first, second = VectorStore(str(tmp_path), "prompts", DIM), VectorStore(str(tmp_path), "prompts", DIM)
+    first.load()
+    second.load()
+
+    first.add(["a", "b"], np.stack([one_hot(0), one_hot(1)]))
+    # The second worker's view is stale; its append must land after the first's rows
+    second.add(["c"], np.stack([one_hot(2)]))
+    assert second.ids == ["a", "b", "c"]
+    second.remove(["a"])
+
+    first.reload_if_changed()
+    assert first.ids == ["", "b", "c"] and first.search(one_hot(2), 1) == [("c", 1.0)]
+    assert first.search(one_hot(0), 1) == []
+
+def _append_rows(directory, worker, batches):
+    store = VectorStore(directory, "prompts", DIM)
+    store.load()
+    for batch in range(batches):
+        ids = [f"w{worker}b{batch}i{i}-{worker * 1000 + batch * 10 + i}" for i in range(5)]
+        store.add(ids, labelled(ids))
+
+@pytest.mark.skipif(embedding_index.fcntl is None, reason="needs flock")
+def test_concurrent_appends_from_processes_keep_ids_and_rows_aligned(tmp_path):
+    context = multiprocessing.get_context("fork")
+    workers = [context.Process(target=_append_rows, args=(str(tmp_path), w, 100)) for w in range(8)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+        assert worker.exitcode == 0
+
+    store = VectorStore(str(tmp_path), "prompts", DIM)
+    store.load()
+    assert len(store.ids) == len(set(store.ids)) == 8 * 100 * 5
+    assert np.array_equal(np.asarray(store.vectors), labelled(store.ids))
+
+def test_first_sync_runs_in_warm_up_or_background_never_inline(database, tmp_path):
+    async def scenario():
+        async with database() as session_factory:
+            async with session_factory() as db:
+                db.add_all([Prompt(id=f"p{n}", content=f"prompt number {n}") for n in range(3)])
+                await db.commit()
+
+            lazy = EmbeddingIndex(str(tmp_path / "lazy"), embedder=HashingEmbedder(64))
+            await lazy.refresh(session_factory)
+            # The query that triggered it goes on without waiting
+            inline = lazy.last_sync
+            await lazy._sync_task
+
+            warmed = EmbeddingIndex(str(tmp_path / "warm"), embedder=HashingEmbedder(64))
+            detail = await warmed.preload(session_factory)
+            return inline, lazy.metrics()["rows"], detail
+
+    inline, synced, detail = asyncio.run(scenario())
+    assert inline == 0.0
+    assert synced["prompts"] == 3
+    assert detail["synced"]["prompts"]["added"] == 3
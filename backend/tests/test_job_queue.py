@@ -0,0 +1,91 @@
+import asyncio
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.routers import jobs
+from app.services.budget import BudgetTracker, GLOBAL, SESSION, USER
+from app.services.job_queue import JobQueue, get_job_queue
+from app.services.model_catalog import ModelCatalog
+from app.services.session_store import SessionStore
+from app.services.write_buffer import WriteBuffer
+
+def job_queue(session_factory, tmp_path) -> JobQueue:
+    # No workers: the tests publish the job's events themselves
+    return JobQueue(
+        concurrency=0,
+        session_factory=session_factory,
+        store=SessionStore(session_factory),
+        writer=WriteBuffer(session_factory, flush_interval=60),
+        http=object(),
+        budget=BudgetTracker(
+            session_factory,
+            catalog=ModelCatalog(snapshot_path=str(tmp_path / "missing.json")),
+            limits={SESSION: (0, 0), USER: (0, 0), GLOBAL: (0, 0)},
+            persist_interval=0
+        )
+    )
+
+async def collect(queue, job_id, after):
+    return [item async for item in queue.subscribe(job_id, after)]
+
+def test_resume_replays_from_memory_then_from_the_database(database, tmp_path):
+    async def scenario():
+        async with database() as session_factory:
+            queue = job_queue(session_factory, tmp_path)
+            job_id = (await queue.submit("hello"))["job_id"]
+            stream = queue._streams[job_id]
+            for event in (
+                {"type": "thought_delta", "content": "thin"},
+                {"type": "thought", "content": "thinking"},
+                {"type": "target_delta", "content": "rep"},
+                {"type": "target_response", "content": "reply"},
+            ):
+                queue._publish(stream, event)
+
+            # A client attached mid-run waits for what comes next
+            attached = asyncio.create_task(collect(queue, job_id, 3))
+            await asyncio.sleep(0)
+            queue._publish(stream, {"type": "done"})
+            await queue._finish(job_id, stream, "completed")
+            live = await attached
+
+            queue._streams.pop(job_id)
+            replayed = await collect(queue, job_id, 1)
+            job = await queue.get(job_id)
+            await queue.writer.close()
+            return live, replayed, job
+
+    live, replayed, job = asyncio.run(scenario())
+    assert [(seq, e["type"]) for seq, e in live] == [(4, "target_delta"), (5, "target_response"), (6, "done")]
+    # Past retention only persisted events remain, under their original seqs
+    assert [(seq, e["type"]) for seq, e in replayed] == [(3, "thought"), (5, "target_response"), (6, "done")]
+    assert job["status"] == "completed" and job["last_seq"] == 6
+
+class FakeQueue:
+    def __init__(self):
+        self.after = None
+
+    async def get(self, job_id):
+        return {"job_id": job_id} if job_id == "j" else None
+
+    async def subscribe(self, job_id, after=0):
+        self.after = after
+        for seq in range(after + 1, 4):
+            yield seq, {"type": "step", "n": seq}
+
+def test_last_event_id_header_resumes_the_stream():
+    queue = FakeQueue()
+    app = FastAPI()
+    app.include_router(jobs.router, prefix="/api/jobs")
+    app.dependency_overrides[get_job_queue] = lambda: queue
+    client = TestClient(app)
+
+    response = client.get("/api/jobs/j/events", headers={"Last-Event-ID": "2"})
+    assert queue.after == 2
+    assert response.text == 'id: 3\ndata: {"type": "step", "n": 3}\n\n'
+
+    # The later of ?after= and the header wins; a malformed header is ignored
+    client.get("/api/jobs/j/events?after=1", headers={"Last-Event-ID": "x"})
+    assert queue.after == 1
+    client.get("/api/jobs/j/events?after=1", headers={"Last-Event-ID": "0"})
+    assert queue.after == 1
+    assert client.get("/api/jobs/other/events").status_code == 404
@@ -0,0 +1,80 @@
+import asyncio
+import pytest
+from app.models import Attempt
+from app.services.lupin_agent import LupinAgent
+from app.services.refusal_classifier import RefusalClassifier
+from app.services.session_store import SessionState
+
+REPLIES = {
+    "alpha/fast": "Sure! Here is a long and detailed answer to your question.",
+    "beta/refuses": "I'm sorry, but I cannot help with that request.",
+}
+
+class FakeWriter:
+    def __init__(self):
+        self.batches = []
+
+    def add_many(self, model, rows):
+        self.batches.append((model, rows))
+        return [row["id"] for row in rows]
+
+class FakeTargets:
+    """Canned replies; 'slow' models hang until cancelled, 'broken' ones fail"""
+
+    def __init__(self):
+        self.cancelled = []
+
+    async def __call__(self, model, messages, refusal_check=None):
+        if model.endswith("/slow"):
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                self.cancelled.append(model)
+                raise
+        if model.endswith("/broken"):
+            raise RuntimeError("upstream 502")
+        await asyncio.sleep(0.01)
+        refusal_check.feed(REPLIES[model])
+        return REPLIES[model]
+
+def agent(writer, targets) -> LupinAgent:
+    lupin = LupinAgent(
+        session_factory=None, api_key="", http=object(), writer=writer, classifier=RefusalClassifier(),
+        session=SessionState("s"), catalog=object(), cache=object(), budget=object(), limiter=object()
+    )
+    lupin._stream_target = targets
+    lupin._events = asyncio.Queue()
+    return lupin
+
+def test_fan_out_compares_models_and_queues_the_attempts_together():
+    writer = FakeWriter()
+    lupin = agent(writer, FakeTargets())
+    result = asyncio.run(lupin.jailbreak_attempt(["alpha/fast", "beta/refuses", "gamma/broken"], "prompt"))
+
+    assert result["succeeded"] == ["alpha/fast"] and result["refused"] == ["beta/refuses"]
+    assert result["errors"] == {"gamma/broken": "upstream 502"}
+    assert [r["model"] for r in result["results"]] == ["alpha/fast", "beta/refuses"]
+    # One add_many, so the rows share a flush; errored targets write no row
+    [(model, rows)] = writer.batches
+    assert model is Attempt and sorted(row["model_name"] for row in rows) == ["alpha/fast", "beta/refuses"]
+    assert {row["extra_data"]["fanout_id"] for row in rows} == {result["fanout_id"]}
+    assert lupin.history("alpha/fast")[-1]["content"] == REPLIES["alpha/fast"]
+
+def test_cancelled_fan_out_stops_pending_targets_and_keeps_finished_attempts():
+    writer, targets = FakeWriter(), FakeTargets()
+    lupin = agent(writer, targets)
+
+    async def scenario():
+        run = asyncio.create_task(lupin.jailbreak_attempt(["alpha/fast", "beta/slow", "beta/refuses"], "prompt"))
+        finished = [await lupin._events.get() for _ in range(2)]
+        run.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await run
+        await asyncio.sleep(0)
+        return finished
+
+    finished = asyncio.run(scenario())
+    assert sorted(event["model"] for event in finished) == ["alpha/fast", "beta/refuses"]
+    assert targets.cancelled == ["beta/slow"]
+    [(_, rows)] = writer.batches
+    assert sorted(row["model_name"] for row in rows) == ["alpha/fast", "beta/refuses"]
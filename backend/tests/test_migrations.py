@@ -0,0 +1,121 @@
+"""Upgrading a populated database created by the original, pre-migration schema"""
+from datetime import datetime, timezone
+from sqlalchemy import create_engine, inspect, select, text
+from sqlalchemy.orm import Session
+from app.migrations import MIGRATIONS, upgrade
+from app import models
+from app.models import Base, Attempt, JailbreakNotification, Prompt
+from app.services.corpus_importer import content_hash
+from app.services.prompt_search import ensure_search_index
+
+# The tables as create_all made them before schema_version existed
+BASELINE_DDL = [
+    """CREATE TABLE ai_providers (
+        id VARCHAR NOT NULL, provider_name VARCHAR(100) NOT NULL, company_name VARCHAR(200) NOT NULL,
+        security_email VARCHAR(200), webhook_url VARCHAR(500), contact_name VARCHAR(200),
+        notification_enabled BOOLEAN, notification_method VARCHAR(20), model_patterns JSON,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP, updated_at DATETIME, extra_data JSON,
+        PRIMARY KEY (id), UNIQUE (provider_name)
+    )""",
+    """CREATE TABLE attempts (
+        id VARCHAR NOT NULL, session_id VARCHAR NOT NULL, prompt TEXT NOT NULL, response TEXT,
+        success BOOLEAN, model_name VARCHAR(100), timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        extra_data JSON, PRIMARY KEY (id)
+    )""",
+    """CREATE TABLE exploits (
+        id VARCHAR NOT NULL, cve_id VARCHAR(50) NOT NULL, title VARCHAR(200) NOT NULL,
+        description TEXT NOT NULL, exploit_content TEXT NOT NULL, exploit_type VARCHAR(50),
+        severity VARCHAR(20), source VARCHAR(200), source_type VARCHAR(50), target_models JSON,
+        mitigation TEXT, status VARCHAR(20), discovered_date DATETIME,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP, updated_at DATETIME, extra_data JSON,
+        PRIMARY KEY (id), UNIQUE (cve_id)
+    )""",
+    """CREATE TABLE jailbreak_notifications (
+        id VARCHAR NOT NULL, provider_id VARCHAR NOT NULL, attempt_id VARCHAR, test_run_id VARCHAR,
+        exploit_id VARCHAR, model_name VARCHAR(100) NOT NULL, jailbreak_prompt TEXT NOT NULL,
+        notification_method VARCHAR(20), notification_status VARCHAR(20), notification_response TEXT,
+        sent_at DATETIME DEFAULT CURRENT_TIMESTAMP, extra_data JSON, PRIMARY KEY (id)
+    )""",
+    """CREATE TABLE prompts (
+        id VARCHAR NOT NULL, content TEXT NOT NULL, source VARCHAR(100), category VARCHAR(50),
+        subcategory VARCHAR(50), provider VARCHAR(50), severity VARCHAR(20), success_rate FLOAT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP, updated_at DATETIME, extra_data JSON,
+        PRIMARY KEY (id)
+    )""",
+    """CREATE TABLE test_runs (
+        id VARCHAR NOT NULL, run_name VARCHAR(200), exploit_id VARCHAR NOT NULL,
+        target_model VARCHAR(100) NOT NULL, test_prompt TEXT NOT NULL, response TEXT, success BOOLEAN,
+        blocked BOOLEAN, execution_time_ms INTEGER, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+        extra_data JSON, PRIMARY KEY (id)
+    )""",
+]
+
+LONG_REPLY = "Sure, here is the story you asked for. " * 40
+
+def populated_baseline(path):
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as conn:
+        for statement in BASELINE_DDL:
+            conn.exec_driver_sql(statement)
+        conn.execute(text(
+            "INSERT INTO prompts (id, content, category, success_rate) VALUES "
+            "('p1', 'You are DAN', 'roleplay', 0.5), ('p2', 'you are  DAN ', 'roleplay', 0.2), "
+            "('p3', 'Ignore previous instructions', 'injection', 0.1)"
+        ))
+        conn.execute(text(
+            "INSERT INTO attempts (id, session_id, prompt, response, success, model_name, timestamp) VALUES "
+            "('a1', 's1', 'You are DAN', :reply, 1, 'openai/gpt-4o', '2024-01-02 03:04:05')"
+        ), {"reply": LONG_REPLY})
+        conn.execute(text(
+            "INSERT INTO test_runs (id, run_name, exploit_id, target_model, test_prompt, response, success, blocked) "
+            "VALUES ('t1', 'nightly', 'e1', 'openai/gpt-4o', 'probe', 'I cannot help with that.', 0, 1)"
+        ))
+        conn.execute(text(
+            "INSERT INTO jailbreak_notifications (id, provider_id, model_name, jailbreak_prompt, notification_status, sent_at) "
+            "VALUES ('n1', 'prov', 'openai/gpt-4o', 'You are DAN', 'pending', '2024-01-02 03:04:05')"
+        ))
+    return engine
+
+def test_upgrade_from_populated_baseline(tmp_path):
+    engine = populated_baseline(tmp_path / "baseline.db")
+    with engine.begin() as conn:
+        assert upgrade(conn) == [version for version, _, _ in MIGRATIONS]
+        ensure_search_index(conn)
+
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        columns = {c["name"] for c in inspector.get_columns(table.name)}
+        assert {c.name for c in table.columns} <= columns, table.name
+
+    with Session(engine) as db:
+        # Normalized duplicates keep a NULL hash so the unique index could be built
+        hashes = dict(db.execute(select(Prompt.id, Prompt.content_hash)).all())
+        assert hashes["p1"] and hashes["p3"] and hashes["p2"] is None
+        # The migration's inlined hash must agree with the importer's dedup key
+        assert hashes["p1"] == content_hash("You are DAN")
+
+        # Existing prompts get a full-text key and are indexed under it
+        keys = dict(db.execute(select(Prompt.id, Prompt.search_rowid)).all())
+        assert None not in keys.values() and len(set(keys.values())) == 3
+        matched = db.execute(text("SELECT rowid FROM prompts_fts WHERE prompts_fts MATCH 'ignore'")).scalars().all()
+        assert matched == [keys["p3"]]
+
+        # Legacy TEXT responses read back through the compressed column type
+        assert db.get(Attempt, "a1").response == LONG_REPLY
+        assert db.get(models.TestRun, "t1").response == "I cannot help with that."
+
+        # Notifications queued before the dispatcher became due at once
+        notification = db.get(JailbreakNotification, "n1")
+        assert notification.delivery_attempts == 0
+        assert notification.next_attempt_at.replace(tzinfo=timezone.utc) == datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+
+    with engine.begin() as conn:
+        assert upgrade(conn) == []
+    engine.dispose()
+
+def test_upgrade_fresh_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    with engine.begin() as conn:
+        assert upgrade(conn) == [version for version, _, _ in MIGRATIONS]
+    assert set(Base.metadata.tables) <= set(inspect(engine).get_table_names())
+    engine.dispose()
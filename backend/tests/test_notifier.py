@@ -0,0 +1,115 @@
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import httpx
+from sqlalchemy import select, update
+from app.models import AIProvider, JailbreakNotification
+from app.services.notifier import Notifier, finding_key, part_digest_key
+from app.services.write_buffer import WriteBuffer
+
+class FakeWebhook:
+    """Accepts every digest, recording its idempotency key and findings"""
+
+    def __init__(self):
+        self.deliveries = []
+
+    async def post(self, url, json=None, headers=None, timeout=None):
+        await asyncio.sleep(0.01)
+        self.deliveries.append((headers["Idempotency-Key"], [f["id"] for f in json["findings"]]))
+        return httpx.Response(200, text="ok", request=httpx.Request("POST", url))
+
+def notifier(session_factory, http, **kwargs) -> Notifier:
+    return Notifier(session_factory, writer=WriteBuffer(session_factory, flush_interval=60), http=http, interval=0, **kwargs)
+
+async def seed(session_factory, count, **values):
+    now = datetime.now(timezone.utc)
+    async with session_factory() as db:
+        db.add(AIProvider(id="prov", provider_name="alpha", company_name="Alpha", webhook_url="https://alpha.test/hook",
+                          notification_method="webhook"))
+        db.add_all([
+            JailbreakNotification(
+                id=f"n{i:02}", provider_id="prov", model_name="alpha/one", jailbreak_prompt=f"prompt {i}",
+                finding_key=finding_key("alpha/one", f"prompt {i}"), notification_status="pending",
+                next_attempt_at=now, **{"delivery_attempts": 0, **values}
+            )
+            for i in range(count)
+        ])
+        await db.commit()
+
+async def statuses(session_factory):
+    async with session_factory() as db:
+        rows = await db.execute(select(JailbreakNotification.notification_status, JailbreakNotification.idempotency_key))
+        return rows.all()
+
+def test_concurrent_dispatchers_send_each_finding_once(database):
+    async def scenario():
+        async with database() as session_factory:
+            await seed(session_factory, 12)
+            http = FakeWebhook()
+            workers = [notifier(session_factory, http, batch_limit=5, digest_size=3) for _ in range(3)]
+            await asyncio.gather(*(worker.dispatch() for worker in workers))
+            await asyncio.gather(*(worker.dispatch() for worker in workers))
+            return http, await statuses(session_factory)
+
+    http, rows = asyncio.run(scenario())
+    sent = Counter(row_id for _, ids in http.deliveries for row_id in ids)
+    assert len(sent) == 12 and set(sent.values()) == {1}
+    assert {status for status, _ in rows} == {"sent"}
+
+def test_claim_is_not_returned_twice(database):
+    async def scenario():
+        async with database() as session_factory:
+            await seed(session_factory, 4)
+            first, second = notifier(session_factory, FakeWebhook()), notifier(session_factory, FakeWebhook())
+            async with session_factory() as db:
+                claimed = await first._claim(db)
+                await db.commit()
+            async with session_factory() as db:
+                again = await second._claim(db)
+            return claimed, again
+
+    claimed, again = asyncio.run(scenario())
+    assert len(claimed) == 4 and again == []
+
+def test_expired_lease_is_retried_under_the_same_key(database):
+    async def scenario():
+        async with database() as session_factory:
+            await seed(session_factory, 2)
+            # A worker claimed the rows into a digest and died before recording the outcome
+            crashed = notifier(session_factory, FakeWebhook(), send_lease=60)
+            async with session_factory() as db:
+                rows = await crashed._claim(db)
+                await db.execute(update(JailbreakNotification).values(idempotency_key="k" * 64))
+                await db.commit()
+
+            http = FakeWebhook()
+            live = notifier(session_factory, http)
+            while_leased = await live.dispatch()
+            async with session_factory() as db:
+                await db.execute(
+                    update(JailbreakNotification)
+                    .values(next_attempt_at=datetime.now(timezone.utc) - timedelta(seconds=1))
+                )
+                await db.commit()
+            after_expiry = await live.dispatch()
+            return len(rows), while_leased, after_expiry, http
+
+    claimed, while_leased, after_expiry, http = asyncio.run(scenario())
+    assert claimed == 2
+    assert while_leased["claimed"] == 0
+    assert after_expiry["claimed"] == 2 and http.deliveries == [("k" * 64, ["n00", "n01"])]
+
+def test_split_retry_gives_each_part_its_own_key(database):
+    async def scenario():
+        async with database() as session_factory:
+            # A failed digest of five findings, retried after digest_size dropped to two
+            await seed(session_factory, 5, idempotency_key="k" * 64, delivery_attempts=1)
+            http = FakeWebhook()
+            await notifier(session_factory, http, digest_size=2).dispatch()
+            return http, await statuses(session_factory)
+
+    http, rows = asyncio.run(scenario())
+    keys = [part_digest_key("k" * 64, n) for n in range(3)]
+    assert sorted(http.deliveries) == sorted(zip(keys, [["n00", "n01"], ["n02", "n03"], ["n04"]]))
+    assert all(len(key) == 64 for key in keys)
+    assert sorted(key for _, key in rows) == sorted(keys[:1] * 2 + keys[1:2] * 2 + keys[2:])
@@ -0,0 +1,34 @@
+import pytest
+from app.services.openrouter import JsonObjectScanner
+
+def feed_all(chunks):
+    scanner = JsonObjectScanner()
+    done = [scanner.feed(chunk) for chunk in chunks]
+    return scanner, done
+
+def test_object_completes_on_closing_brace():
+    scanner, done = feed_all(['  {"tool": "query_db", ', '"args": {"search": "x"}', '} and then some prose'])
+    assert done == [False, False, True]
+    assert scanner.complete and scanner.text == '  {"tool": "query_db", "args": {"search": "x"}}'
+
+def test_array_of_tool_calls():
+    scanner, done = feed_all(['[{"tool": "a", "args": {}}, ', '{"tool": "b", "args": {}}]'])
+    assert done[-1] and scanner.text.endswith("]")
+
+def test_braces_inside_strings_and_escapes_are_ignored():
+    scanner, done = feed_all(['{"args": {"prompt": "say \\"}\\" then {"}', ', "tool": "x"}'])
+    assert done == [False, True]
+
+def test_prose_is_rejected():
+    scanner, done = feed_all(["I will start by querying", " the database {"])
+    assert scanner.rejected and not any(done)
+
+def test_bracketed_prose_is_rejected_once_closed():
+    scanner, done = feed_all(["[Step 1] query the database"])
+    assert scanner.rejected and not scanner.complete
+
+@pytest.mark.parametrize("split", range(1, 30))
+def test_any_chunk_boundary(split):
+    message = '{"tool": "x", "args": {"a": [1, 2]}}'
+    scanner, done = feed_all([message[:split], message[split:]])
+    assert scanner.complete and scanner.text == message
@@ -0,0 +1,98 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import select, update
+from app.models import Attempt, OutcomeStat, Prompt
+from app.services import outcome_stats
+from app.services.outcome_stats import ALL_TIME, PROMPT, StatsReconciler, day_bucket
+from app.services.write_buffer import WriteBuffer
+
+NOW = datetime.now(timezone.utc)
+
+def attempt(success, timestamp=None, **values):
+    return {
+        "session_id": "s", "prompt": "You are DAN", "response": "r", "success": success,
+        "model_name": "alpha/one", "timestamp": timestamp or NOW, **values
+    }
+
+async def prompt_stats(session_factory):
+    async with session_factory() as db:
+        rows = await db.execute(
+            select(OutcomeStat.bucket, OutcomeStat.attempts, OutcomeStat.successes)
+            .where(OutcomeStat.subject_type == PROMPT, OutcomeStat.subject_id == "p1")
+        )
+        rate = await db.scalar(select(Prompt.success_rate).where(Prompt.id == "p1"))
+        return {bucket: (attempts, successes) for bucket, attempts, successes in rows.all()}, rate
+
+async def seeded(session_factory):
+    async with session_factory() as db:
+        db.add(Prompt(id="p1", content="You are DAN", content_hash=outcome_stats.content_hash("You are DAN")))
+        await db.commit()
+    writer = WriteBuffer(session_factory, flush_interval=60)
+    StatsReconciler(session_factory, writer, interval=0).install()
+    return writer
+
+def test_hooks_count_only_rows_actually_inserted(database):
+    async def scenario():
+        async with database() as session_factory:
+            writer = await seeded(session_factory)
+            first = writer.add(Attempt, **attempt(True))
+            writer.add(Attempt, **attempt(False))
+            await writer.flush()
+            # Replayed after a crash: the insert skips it, so it must not be counted again
+            writer.add(Attempt, **attempt(True, id=first))
+            writer.add(Attempt, **attempt(True))
+            await writer.flush()
+            await writer.close()
+            return await prompt_stats(session_factory)
+
+    stats, rate = asyncio.run(scenario())
+    assert stats == {day_bucket(NOW): (3, 2), ALL_TIME: (3, 2)}
+    assert abs(rate - 2 / 3) < 1e-9
+
+def test_reconcile_fixes_drift_day_by_day(database):
+    yesterday = NOW - timedelta(days=1)
+
+    async def scenario():
+        async with database() as session_factory:
+            writer = await seeded(session_factory)
+            writer.add_many(Attempt, [attempt(True, yesterday), attempt(False), attempt(True)])
+            await writer.flush()
+            async with session_factory() as db:
+                await db.execute(update(OutcomeStat).values(attempts=OutcomeStat.attempts + 5))
+                await db.commit()
+            result = await StatsReconciler(session_factory, writer, interval=0).reconcile(2)
+            await writer.close()
+            return result, await prompt_stats(session_factory)
+
+    result, (stats, rate) = asyncio.run(scenario())
+    assert stats == {day_bucket(yesterday): (1, 1), day_bucket(NOW): (2, 1), ALL_TIME: (3, 2)}
+    assert result["since"] == day_bucket(yesterday) and result["scanned"] == 3 and result["corrected"] == 2
+
+def test_counting_does_not_block_flushes_and_new_rows_are_recounted(database, monkeypatch):
+    count_day = outcome_stats.count_day
+    locked_while_counting = []
+
+    async def scenario():
+        async with database() as session_factory:
+            writer = await seeded(session_factory)
+            writer.add(Attempt, **attempt(True))
+            await writer.flush()
+
+            async def counting_with_a_flush(db, day, chunk_size=1000):
+                locked_while_counting.append(writer._flush_lock.locked())
+                if len(locked_while_counting) == 1:
+                    # A flush lands while the day is being counted
+                    writer.add(Attempt, **attempt(False))
+                    await writer.flush()
+                return await count_day(db, day, chunk_size)
+
+            monkeypatch.setattr(outcome_stats, "count_day", counting_with_a_flush)
+            result = await StatsReconciler(session_factory, writer, interval=0).reconcile(1)
+            await writer.close()
+            return result, await prompt_stats(session_factory)
+
+    result, (stats, _) = asyncio.run(scenario())
+    # Counted unlocked first, then recounted under the lock because a row arrived
+    assert locked_while_counting == [False, True]
+    assert stats == {day_bucket(NOW): (2, 1), ALL_TIME: (2, 1)}
+    assert result["corrected"] == 0
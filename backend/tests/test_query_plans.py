@@ -0,0 +1,54 @@
+"""The hot report/agent queries must be served by indexes on SQLite: no full table scan, no temp B-tree sort"""
+from datetime import datetime, timedelta, timezone
+import pytest
+from sqlalchemy import create_engine, select
+from sqlalchemy.dialects import sqlite
+from app import models
+from app.migrations import upgrade
+from app.models import Prompt, Attempt, JailbreakNotification
+
+since = datetime.now(timezone.utc) - timedelta(days=7)
+
+HOT_QUERIES = {
+    "attempts by session": select(Attempt).where(Attempt.session_id == "s").order_by(Attempt.timestamp),
+    "attempts by model in window": select(Attempt).where(Attempt.model_name == "m", Attempt.timestamp >= since),
+    "attempts in window": select(Attempt).where(Attempt.timestamp >= since),
+    "prompts by category ranked": select(Prompt).where(Prompt.category == "jailbreak")
+        .order_by(Prompt.success_rate.desc()).limit(5),
+    "prompts ranked": select(Prompt).order_by(Prompt.success_rate.desc()).limit(5),
+    "test runs for exploit x model": select(models.TestRun)
+        .where(models.TestRun.exploit_id == "e", models.TestRun.target_model == "m"),
+    "test runs by model in window": select(models.TestRun)
+        .where(models.TestRun.target_model == "m", models.TestRun.timestamp >= since),
+    "pending notifications by provider": select(JailbreakNotification)
+        .where(JailbreakNotification.provider_id == "p", JailbreakNotification.notification_status == "pending"),
+    "due notifications": select(JailbreakNotification)
+        .where(JailbreakNotification.notification_status == "pending", JailbreakNotification.next_attempt_at <= since)
+        .order_by(JailbreakNotification.next_attempt_at).limit(500),
+}
+
+def plan_problems(plan: str) -> list:
+    problems = []
+    for line in plan.splitlines():
+        if line.startswith("SCAN") and "USING" not in line:
+            problems.append(f"full scan: {line}")
+        if "USE TEMP B-TREE" in line:
+            problems.append(f"unindexed sort: {line}")
+    if "INDEX" not in plan:
+        problems.append("no index used")
+    return problems
+
+@pytest.fixture(scope="module")
+def migrated():
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        upgrade(conn)
+    yield engine
+    engine.dispose()
+
+@pytest.mark.parametrize("name", HOT_QUERIES)
+def test_query_uses_index(migrated, name):
+    sql = str(HOT_QUERIES[name].compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+    with migrated.connect() as conn:
+        plan = "\n".join(row[-1] for row in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}"))
+    assert not plan_problems(plan), plan
@@ -0,0 +1,44 @@
+import pytest
+from app.services.refusal_classifier import PatternTier, RefusalClassifier, REFUSAL_PATTERNS
+
+def test_earliest_pattern_wins():
+    tier = PatternTier()
+    assert tier.search("Well, I apologize, but I cannot do that") == (6, "i apologize")
+    assert tier.search("Here is the answer you wanted.") is None
+
+def test_case_insensitive_and_longest_pattern_listed_first():
+    tier = PatternTier(["I can", "I cannot"])
+    assert tier.patterns == ["i cannot", "i can"]
+    assert tier.search("I CANNOT help")[0] == 0
+
+@pytest.mark.parametrize("text", [
+    "sorry, but no", "that is not appropriate", "sure thing", "filler pattern 7 then i cannot",
+    "I CAN'T (really) + won't", "against my ethical guidelines",
+])
+def test_alternation_agrees_with_substring_search(text):
+    patterns = REFUSAL_PATTERNS + [f"filler pattern {i}" for i in range(40)] + ["(really) +"]
+    tier = PatternTier(patterns)
+    lowered = text.lower()
+    found = [(lowered.find(p), p) for p in tier.patterns if p in lowered]
+    expected = min(found, key=lambda f: (f[0], -len(f[1]))) if found else None
+    assert tier.search(text) == expected
+
+def test_streaming_check_matches_across_chunks():
+    classifier = RefusalClassifier(early_window=200)
+    check = classifier.stream()
+    assert not check.feed("Hmm. I ca")
+    assert check.feed("n't help with that.")
+    assert check.match == "i can't" and check.match_at == 5 and check.should_cancel
+
+def test_late_refusal_does_not_cancel():
+    check = RefusalClassifier(early_window=20).stream()
+    check.feed("Sure! Here is a long and detailed story about dragons. ")
+    assert check.feed("Though I must decline the last part.")
+    assert not check.should_cancel
+
+def test_verdicts():
+    classifier = RefusalClassifier()
+    refused, short, success = classifier.classify_many(["I cannot help.", "Okay.", "Sure. " * 20])
+    assert refused["refused"] and not refused["success"]
+    assert not short["refused"] and not short["success"]
+    assert success["success"] and success["pattern"] is None
@@ -0,0 +1,145 @@
+import asyncio
+from collections import Counter
+import httpx
+from sqlalchemy import select
+from app import models
+from app.models import Exploit
+from app.services.budget import BudgetTracker, GLOBAL, SESSION, USER
+from app.services.model_catalog import ModelCatalog
+from app.services.refusal_classifier import RefusalClassifier
+from app.services.regression_runner import RegressionRunner
+from app.services.response_cache import ResponseCache
+from app.services.throttle import ProviderLimiter, get_regression_limiter, provider_of
+from app.services.write_buffer import WriteBuffer
+
+EXPLOITS = [
+    Exploit(id=f"e{n}", cve_id=f"PIE-2025-{n:03}", title="t", description="d", exploit_content=f"probe {n}")
+    for n in range(6)
+]
+MODELS = ["alpha/one", "beta/two"]
+
+class FakeHttp:
+    """Answers chat completions after a short delay, recording concurrency per provider"""
+
+    def __init__(self, failing=()):
+        self.failing = set(failing)
+        self.calls = Counter()
+        self.in_flight = Counter()
+        self.peak = Counter()
+        self.peak_total = 0
+
+    async def post(self, url, headers=None, json=None, timeout=None):
+        model = json["model"]
+        provider = provider_of(model)
+        self.calls[(json["messages"][0]["content"], model)] += 1
+        self.in_flight[provider] += 1
+        self.peak[provider] = max(self.peak[provider], self.in_flight[provider])
+        self.peak_total = max(self.peak_total, sum(self.in_flight.values()))
+        await asyncio.sleep(0.01)
+        self.in_flight[provider] -= 1
+        request = httpx.Request("POST", url)
+        if model in self.failing:
+            return httpx.Response(400, json={"error": "bad model"}, request=request)
+        reply = {"choices": [{"message": {"content": "Sure, here is a long and detailed answer to that."}}]}
+        return httpx.Response(200, json=reply, request=request)
+
+def runner(session_factory, http, tmp_path, cache_mode="off", **kwargs):
+    return RegressionRunner(
+        api_key="test",
+        http=http,
+        writer=WriteBuffer(session_factory, flush_interval=60),
+        limiter=ProviderLimiter(2),
+        max_retries=0,
+        classifier=RefusalClassifier(),
+        cache=ResponseCache(path=str(tmp_path / "cache.db"), mode=cache_mode),
+        budget=BudgetTracker(
+            session_factory,
+            catalog=ModelCatalog(snapshot_path=str(tmp_path / "missing.json")),
+            limits={SESSION: (0, 0), USER: (0, 0), GLOBAL: (0, 0)},
+            persist_interval=0
+        ),
+        **kwargs
+    )
+
+async def run_all(regression, session_factory, run_name):
+    async with session_factory() as db:
+        events = [event async for event in regression.run(db, run_name, EXPLOITS, MODELS)]
+    await regression.writer.close()
+    return events
+
+async def recorded_pairs(session_factory, run_name):
+    async with session_factory() as db:
+        rows = await db.execute(
+            select(models.TestRun.exploit_id, models.TestRun.target_model).where(models.TestRun.run_name == run_name)
+        )
+        return sorted(rows.all())
+
+def test_workers_fill_each_provider_up_to_its_limit(database, tmp_path):
+    async def scenario():
+        async with database() as session_factory:
+            http = FakeHttp()
+            events = await run_all(runner(session_factory, http, tmp_path), session_factory, "nightly")
+            return http, events, await recorded_pairs(session_factory, "nightly")
+
+    http, events, recorded = asyncio.run(scenario())
+    assert events[0] == {"type": "start", "run_name": "nightly", "total": 12, "pending": 12}
+    assert events[-1]["completed"] == 12 and events[-1]["error"] == 0
+    # Both providers ran their two slots at once, and never more
+    assert dict(http.peak) == {"alpha": 2, "beta": 2} and http.peak_total == 4
+    assert len(recorded) == 12 and set(http.calls.values()) == {1}
+
+def test_worker_count_is_capped(database, tmp_path):
+    async def scenario():
+        async with database() as session_factory:
+            http = FakeHttp()
+            await run_all(runner(session_factory, http, tmp_path, max_workers=1), session_factory, "serial")
+            return http
+
+    http = asyncio.run(scenario())
+    assert http.peak_total == 1 and sum(http.calls.values()) == 12
+
+def test_resumed_run_retries_only_unrecorded_pairs(database, tmp_path):
+    async def scenario():
+        async with database() as session_factory:
+            first = await run_all(
+                runner(session_factory, FakeHttp(failing={"beta/two"}), tmp_path), session_factory, "nightly"
+            )
+            http = FakeHttp()
+            second = await run_all(runner(session_factory, http, tmp_path), session_factory, "nightly")
+            return first, second, http, await recorded_pairs(session_factory, "nightly")
+
+    first, second, http, recorded = asyncio.run(scenario())
+    assert first[-1]["completed"] == 6 and first[-1]["error"] == 6
+    assert second[0]["pending"] == 6
+    assert set(model for _, model in http.calls) == {"beta/two"}
+    assert recorded == sorted((e.id, m) for e in EXPLOITS for m in MODELS)
+
+def test_runs_share_the_process_limiter(database, tmp_path):
+    async def scenario():
+        async with database() as session_factory:
+            first, second = (
+                RegressionRunner(http=FakeHttp(), writer=WriteBuffer(session_factory), limiter=None)
+                for _ in range(2)
+            )
+            return first.limiter is second.limiter is get_regression_limiter()
+
+    assert asyncio.run(scenario())
+
+def test_replay_runs_offline_from_recorded_responses(database, tmp_path):
+    async def scenario():
+        async with database() as session_factory:
+            recording = runner(session_factory, FakeHttp(failing={"beta/two"}), tmp_path, cache_mode="on")
+            await run_all(recording, session_factory, "recorded")
+            recording.cache.close()
+            http = FakeHttp()
+            replay = runner(session_factory, http, tmp_path, cache_mode="replay", cache_bypass=True)
+            events = await run_all(replay, session_factory, "ci")
+            return http, events
+
+    http, events = asyncio.run(scenario())
+    results = [e for e in events if e["type"] == "result"]
+    errors = [e for e in events if e["type"] == "error"]
+    # Recorded pairs replay (even with bypass set); unrecorded ones fail without a call
+    assert not http.calls
+    assert len(results) == 6 and all(e["cached"] and e["model"] == "alpha/one" for e in results)
+    assert len(errors) == 6 and all("replay mode" in e["error"] for e in errors)
@@ -0,0 +1,54 @@
+import asyncio
+import time
+import pytest
+from app.services.response_cache import CacheMiss, ResponseCache, cache_key
+
+MESSAGES = [{"role": "user", "content": "probe"}]
+
+def test_key_ignores_streaming_and_unrelated_message_fields():
+    assert cache_key("m", MESSAGES) == cache_key("m", [{**MESSAGES[0], "name": "x"}], {"stream": True})
+    assert cache_key("m", MESSAGES) != cache_key("other", MESSAGES)
+    assert cache_key("m", MESSAGES) != cache_key("m", MESSAGES, {"temperature": 0})
+
+def test_replay_serves_recordings_past_their_ttl(tmp_path):
+    path = str(tmp_path / "cache.db")
+    key, other = cache_key("alpha/one", MESSAGES), cache_key("alpha/one", [{"role": "user", "content": "new"}])
+
+    async def scenario():
+        recorder = ResponseCache(path=path, mode="on", ttl=0.01)
+        await recorder.put(key, "alpha/one", {"content": "recorded", "elapsed_ms": 7})
+        recorder.close()
+        time.sleep(0.02)
+
+        # A live cache treats the entry as expired; replay still serves it, from disk
+        assert await ResponseCache(path=path, mode="on").get(key) is None
+        replay = ResponseCache(path=path, mode="replay")
+        served = await replay.get(key)
+        with pytest.raises(CacheMiss):
+            await replay.get(other)
+        # Replay never records, so a later replay misses again
+        await replay.put(other, "alpha/one", {"content": "fresh"})
+        with pytest.raises(CacheMiss):
+            await replay.get(other)
+        metrics = replay.metrics()
+        replay.close()
+        return served, metrics
+
+    served, metrics = asyncio.run(scenario())
+    assert served == {"content": "recorded", "elapsed_ms": 7}
+    assert metrics["disk_hits"] == 1 and metrics["misses"] == 2 and metrics["stores"] == 0
+
+def test_zero_ttl_models_are_not_recorded(tmp_path):
+    async def scenario():
+        cache = ResponseCache(path=str(tmp_path / "cache.db"), mode="on", ttl=60, model_ttls={"beta/": 0})
+        await cache.put("k1", "beta/two", {"content": "x"})
+        await cache.put("k2", "alpha/one", {"content": "y"})
+        found = (await cache.get("k1"), await cache.get("k2"))
+        cache.close()
+        return found
+
+    assert asyncio.run(scenario()) == (None, {"content": "y"})
+
+def test_unknown_mode_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        ResponseCache(path=str(tmp_path / "cache.db"), mode="record")
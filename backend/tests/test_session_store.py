@@ -0,0 +1,71 @@
+import asyncio
+import json
+from app.services.session_store import COMPACTED_MARKER, SessionStore, compact_conversation
+
+def test_lru_evicts_least_recently_used_and_reloads_from_db(database):
+    async def scenario():
+        async with database() as session_factory:
+            store = SessionStore(session_factory, max_sessions=2, ttl=60)
+            states = [await store.get_or_create(f"s{n}") for n in range(3)]
+            for state in states:
+                state.notepad = state.session_id
+                await store.save(state)
+            # s0 was pushed out; touching s1 makes s2 the next to go
+            assert list(store._cache) == ["s1", "s2"]
+            assert await store.get("s1") is states[1]
+            reloaded = await store.get("s0")
+            return store, states, reloaded
+
+    store, states, reloaded = asyncio.run(scenario())
+    assert reloaded is not states[0] and reloaded.notepad == "s0"
+    assert list(store._cache) == ["s1", "s0"]
+    # Three lookups of new ids, then s0 from the database
+    assert store.metrics() == {"cached": 2, "hits": 1, "misses": 4}
+
+def test_expired_session_is_reloaded(database):
+    async def scenario():
+        async with database() as session_factory:
+            store = SessionStore(session_factory, max_sessions=10, ttl=0)
+            state = await store.get_or_create("s")
+            state.external_history = {"alpha/one": [{"role": "user", "content": "hi"}]}
+            await store.save(state)
+            return state, await store.get("s"), await store.get("missing"), store.metrics()
+
+    saved, reloaded, missing, metrics = asyncio.run(scenario())
+    assert reloaded is not saved and reloaded.external_history == saved.external_history
+    assert missing is None
+    assert metrics["hits"] == 0 and metrics["misses"] == 3
+
+def tool_result(n, size=2000):
+    return {"role": "user", "content": json.dumps({"tool": "query_db", "result": [
+        {"id": f"p{n}-{i}", "content": "x" * size, "success_rate": 0.5, "category": "c"} for i in range(3)
+    ]})}
+
+def test_old_tool_results_are_summarized_recent_ones_kept():
+    conversation = [{"role": "system", "content": "sys"}, {"role": "user", "content": "go"}]
+    for n in range(3):
+        conversation += [{"role": "assistant", "content": f"call {n}"}, tool_result(n)]
+    recent = conversation[-1]["content"]
+
+    compact_conversation(conversation, keep_recent=2, max_messages=100, max_tool_chars=1000)
+    summarized = [m["content"] for m in conversation if m["content"].endswith(COMPACTED_MARKER)]
+    assert len(summarized) == 2 and all(len(s) < 1100 for s in summarized)
+    assert '"p0-0"' in summarized[0] and "category" not in summarized[0]
+    assert conversation[-1]["content"] == recent
+
+    # Compacting again leaves summaries alone
+    before = [m["content"] for m in conversation]
+    compact_conversation(conversation, keep_recent=2, max_messages=100, max_tool_chars=1000)
+    assert [m["content"] for m in conversation] == before
+
+def test_long_conversation_drops_oldest_exchanges_on_an_assistant_turn():
+    conversation = [{"role": "system", "content": "sys"}, {"role": "user", "content": "first request"}]
+    for n in range(10):
+        conversation += [{"role": "assistant", "content": f"call {n}"}, {"role": "user", "content": f"result {n}"}]
+
+    compact_conversation(conversation, keep_recent=4, max_messages=8)
+    assert [m["content"] for m in conversation[:2]] == ["sys", "first request"]
+    assert conversation[2]["content"] == f"[earlier messages omitted] {COMPACTED_MARKER}"
+    assert conversation[3]["role"] == "assistant"
+    assert conversation[-1]["content"] == "result 9"
+    assert len(conversation) <= 8
@@ -0,0 +1,87 @@
+import asyncio
+from sqlalchemy import func, select
+from sqlalchemy.exc import OperationalError
+from app.models import Attempt
+from app.services.write_buffer import WriteBuffer
+
+def attempt(prompt="probe", **values):
+    return {"session_id": "s", "prompt": prompt, "response": "r", "success": False, "model_name": "m", **values}
+
+async def count_attempts(session_factory) -> int:
+    async with session_factory() as db:
+        return (await db.execute(select(func.count()).select_from(Attempt))).scalar()
+
+def test_rows_are_written_in_one_batch(database):
+    async def scenario():
+        async with database() as session_factory:
+            writer = WriteBuffer(session_factory, flush_interval=60)
+            ids = writer.add_many(Attempt, [attempt(f"p{i}") for i in range(5)])
+            assert await writer.flush() == 5
+            assert await count_attempts(session_factory) == 5
+            await writer.close()
+            return ids, writer.metrics()
+
+    ids, metrics = asyncio.run(scenario())
+    assert len(set(ids)) == 5
+    assert metrics["batches"] == 1 and metrics["pending"] == 0
+
+def test_bad_row_is_rejected_and_does_not_block_later_flushes(database):
+    async def scenario():
+        async with database() as session_factory:
+            writer = WriteBuffer(session_factory, flush_interval=60)
+            bad_id = writer.add(Attempt, **attempt(prompt=object()))
+            writer.add_many(Attempt, [attempt("p1"), attempt("p2"), attempt("p3", extra_data={"k": 1})])
+            first = await writer.flush()
+            writer.add(Attempt, **attempt("p4"))
+            second = await writer.flush()
+            written = await count_attempts(session_factory)
+            await writer.close()
+            return bad_id, first, second, written, writer.metrics()
+
+    bad_id, first, second, written, metrics = asyncio.run(scenario())
+    assert (first, second, written) == (3, 1, 4)
+    assert metrics["rejected"] == 1 and metrics["pending"] == 0 and metrics["failures"] == 1
+    assert metrics["dead_letters"][0]["id"] == bad_id and metrics["dead_letters"][0]["table"] == "attempts"
+
+def test_transient_failure_requeues_rows(database):
+    async def scenario():
+        async with database() as session_factory:
+            writer = WriteBuffer(session_factory, flush_interval=60)
+            writer.add_many(Attempt, [attempt("p1"), attempt("p2")])
+            write = writer._write
+
+            async def locked(pending):
+                raise OperationalError("INSERT", {}, Exception("database is locked"))
+
+            writer._write = locked
+            assert await writer.flush() == 0
+            assert writer.metrics()["pending"] == 2
+            writer._write = write
+            assert await writer.flush() == 2
+            await writer.close()
+            return writer.metrics()
+
+    metrics = asyncio.run(scenario())
+    assert metrics["rejected"] == 0 and metrics["rows_written"] == 2
+
+def test_max_pending_drops_oldest(database):
+    async def scenario():
+        async with database() as session_factory:
+            writer = WriteBuffer(session_factory, flush_interval=60, max_pending=2)
+            writer.add_many(Attempt, [attempt("p1"), attempt("p2"), attempt("p3")])
+            write = writer._write
+
+            async def down(pending):
+                raise OperationalError("INSERT", {}, Exception("unable to open database file"))
+
+            writer._write = down
+            await writer.flush()
+            writer._write = write
+            await writer.flush()
+            async with session_factory() as db:
+                prompts = sorted((await db.execute(select(Attempt.prompt))).scalars())
+            await writer.close()
+            return prompts, writer.metrics()
+
+    prompts, metrics = asyncio.run(scenario())
+    assert prompts == ["p2", "p3"] and metrics["dropped"] == 1